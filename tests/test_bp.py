@@ -0,0 +1,106 @@
+import pytest
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from tidalsim.bp_model.bp import *
+from tidalsim.cache_model.cache import ArrayFormat
+from tidalsim.cache_model.warmup import warmup_ckpts_from_inst_points
+from tidalsim.util.spike_log import SpikeTraceEntry
+
+
+class TestBranchPredictor:
+    params = BPParams(
+        btb_entries=2, bht_entries=16, history_length=4, history_bits=2, ras_entries=2
+    )
+
+    def test_btb_lru(self) -> None:
+        bp = BranchPredictor(self.params)
+        bp.update_btb(np.array([0x10, 0x20, 0x10]), np.array([0x100, 0x200, 0x110]))
+        # 0x20 is now the LRU entry
+        bp.update_btb(np.array([0x30]), np.array([0x300]))
+        assert bp.btb_valid.tolist() == [True, True]
+        assert bp.btb_pc.tolist() == [0x10, 0x30]
+        assert bp.btb_target.tolist() == [0x110, 0x300]
+
+    def test_bht_counters_saturate(self) -> None:
+        bp = BranchPredictor(BPParams(bht_entries=16, history_bits=0))
+        bp.update_bht(np.zeros(5, dtype=np.int64), np.ones(5, dtype=bool))
+        assert bp.bht_counters[0] == 3
+        assert bp.history == 0b1_1111
+        bp.update_bht(np.zeros(1, dtype=np.int64), np.zeros(1, dtype=bool))
+        assert bp.bht_counters[0] == 2
+
+    # The batched updates match updating the predictor one control instruction at a time
+    def test_batches_match_sequential(self) -> None:
+        rng = np.random.default_rng(0)
+        p = self.params
+        pcs = rng.integers(0, 64, size=500) * 2
+        taken = rng.random(500) < 0.7
+        counters = [0] * p.bht_entries
+        history = 0
+        btb: Dict[int, int] = {}
+        for pc, t in zip(pcs.tolist(), taken.tolist()):
+            h = history & ((1 << p.history_bits) - 1)
+            idx = ((pc >> 1) ^ (h << (p.bht_index_bits - p.history_bits))) & (p.bht_entries - 1)
+            counters[idx] = min(counters[idx] + 1, 3) if t else max(counters[idx] - 1, 0)
+            history = ((history << 1) | int(t)) & ((1 << p.history_length) - 1)
+            if t:
+                btb.pop(pc, None)
+                btb[pc] = pc + 0x100
+                if len(btb) > p.btb_entries:
+                    btb.pop(next(iter(btb)))
+        bp = BranchPredictor(p)
+        for batch in np.array_split(np.arange(500), [1, 100, 101, 377]):
+            bp.update_bht(pcs[batch], taken[batch])
+            batch_taken = batch[taken[batch]]
+            bp.update_btb(pcs[batch_taken], pcs[batch_taken] + 0x100)
+        assert bp.bht_counters.tolist() == counters
+        assert bp.history == history
+        assert bp.btb_pc.tolist() == list(btb)
+
+    def test_ras_wraps(self) -> None:
+        bp = BranchPredictor(self.params)
+        for addr in [0x4, 0x8, 0xC]:
+            bp.push_ras(addr)
+        assert bp.ras_count == 2
+        assert bp.ras[bp.ras_top] == 0xC
+        bp.pop_ras()
+        assert bp.ras[bp.ras_top] == 0x8
+
+    def test_tracker(self) -> None:
+        trace = [
+            SpikeTraceEntry(0x0, "beq", 0),
+            SpikeTraceEntry(0x40, "jal", 1),  # taken branch to 0x40, then a call
+            SpikeTraceEntry(0x100, "ret", 2, inst_bytes=2),
+            SpikeTraceEntry(0x44, "bne", 3),  # back from the call
+            SpikeTraceEntry(0x48, "addi", 4),  # not taken
+        ]
+        tracker = BranchPredictorTracker(BranchPredictor(self.params))
+        for inst in trace:
+            tracker.update(inst)
+        tracker.flush()
+        bp = tracker.bp
+        # The return evicts the LRU entry (the beq)
+        assert bp.btb_pc.tolist() == [0x40, 0x100]
+        assert bp.ras_count == 0
+        assert bp.history == 0b10
+        assert not tracker.pending()
+
+    def test_bp_ckpts_and_dump(self, tmp_path: Path) -> None:
+        trace = [
+            SpikeTraceEntry(0x0, "beq", i) if i % 2 == 0 else SpikeTraceEntry(0x8, "j", i)
+            for i in range(6)
+        ]
+        ckpts = warmup_ckpts_from_inst_points(iter(trace), 64, [2, 6], bp=self.params)
+        assert ckpts.bp is not None and len(ckpts.bp) == 2
+        # The j at inst 1 is resolved once inst 2 is seen, so it's not in the first snapshot
+        assert ckpts.bp[0].btb_pc[ckpts.bp[0].btb_valid].tolist() == [0x0]
+        # The beq at inst 4 is the most recently used entry
+        assert ckpts.bp[1].btb_pc.tolist() == [0x8, 0x0]
+        ckpts.bp[1].dump(tmp_path, ArrayFormat.Bin)
+        btb_rows = (tmp_path / "bp_btb.bin").read_text().splitlines()
+        assert len(btb_rows) == 2 and all(len(row) == 1 + 2 * 39 for row in btb_rows)
+        assert len((tmp_path / "bp_bht.bin").read_text().splitlines()) == 16
+        assert (tmp_path / "bp_ras.bin").read_text() == ""
@@ -10,9 +10,9 @@ class TestCacheModel:
 
     def check_tag_bin_file(self, file_contents: List[str], way_idx: int) -> None:
         for set_idx in range(self.params.n_sets):
-            assert (int(file_contents[set_idx], 2) & self.params.tag_mask) == self.state.array[
-                way_idx
-            ][set_idx].tag
+            assert (int(file_contents[set_idx], 2) & self.params.tag_mask) == self.state.block(
+                way_idx, set_idx
+            ).tag
 
     # Run these using pytest -rA to show the printed arrays for manual inspection
     def test_tag_array_pretty_printing(self) -> None:
@@ -50,7 +50,7 @@ class TestCacheModel:
                 data_from_bin = s_split[data_bus_bytes * set_idx : data_bus_bytes * (set_idx + 1)]
                 assert (
                     int("".join(reversed(data_from_bin)), 2)
-                    == self.state.array[way_idx][set_idx].data
+                    == self.state.block(way_idx, set_idx).data
                 )
         print(self.state.data_array_binary_str(way_idx=0))
 
@@ -91,4 +91,32 @@ class TestCacheModel:
 
         for way_idx in range(self.params.n_ways):
             for set_idx in range(self.params.n_sets):
-                assert read_set(way_idx, set_idx) == self.state.array[way_idx][set_idx].data
+                assert read_set(way_idx, set_idx) == self.state.block(way_idx, set_idx).data
+
+    def test_parse_cache_geometry(self) -> None:
+        params = parse_cache_geometry("64x4")
+        assert params == self.params
+        assert params.geometry_str() == "64x4"
+        assert parse_cache_geometry("128x8", block_size_bytes=32) == CacheParams(32, 32, 128, 8)
+
+    def test_dump_arrays_hex_and_raw(self, tmp_path: Path) -> None:
+        self.state.dump_tag_arrays(tmp_path, "tag", ArrayFormat.Hex)
+        self.state.dump_data_arrays(tmp_path, "data", ArrayFormat.Raw)
+        for way_idx in range(self.params.n_ways):
+            bin_lines = self.state.tag_array_binary_str(way_idx).split("\n")
+            with (tmp_path / f"tag{way_idx}.hex").open("r") as f:
+                hex_lines = [line.rstrip() for line in f]
+            assert [int(x, 16) for x in hex_lines] == [int(x, 2) for x in bin_lines]
+            assert all(len(x) == ceil((self.params.tag_bits + 2) / 4) for x in hex_lines)
+            # Reassemble each block from the byte lane files
+            lanes = [
+                (tmp_path / f"data{way_idx * self.params.data_bus_bytes + b}.raw").read_bytes()
+                for b in range(self.params.data_bus_bytes)
+            ]
+            for set_idx in range(self.params.n_sets):
+                block = bytes(
+                    lanes[b][set_idx * self.params.data_rows_per_set + row]
+                    for row in range(self.params.data_rows_per_set)
+                    for b in range(self.params.data_bus_bytes)
+                )
+                assert int.from_bytes(block, "little") == self.state.block(way_idx, set_idx).data
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pandas as pd
+
+from tidalsim.modeling.convergence import IPCConvergence
+from tidalsim.util.job_sched import JobScheduler, JobState, SimJob
+
+
+class TestConvergence:
+    def test_ipc_convergence(self, tmp_path: Path) -> None:
+        perf_file = tmp_path / "perf.csv"
+        monitor = IPCConvergence(perf_file, tolerance=0.01, min_windows=4, warmup_insts=200)
+        assert monitor.poll() is None
+        perf_file.write_text("cycles,instret\n")
+        # The warmup windows have a very different IPC and aren't counted
+        with perf_file.open("a") as f:
+            f.write("1000,100\n1000,100\n")
+        assert monitor.poll() is None and monitor.ipcs == []
+        with perf_file.open("a") as f:
+            f.write("200,100\n200,100\n202,100\n")
+            # A partially written row isn't parsed
+            f.write("19")
+        assert monitor.poll() is None
+        assert len(monitor.ipcs) == 3
+        with perf_file.open("a") as f:
+            f.write("8,100\n")
+        reason = monitor.poll()
+        assert reason is not None and "4 windows" in reason
+        mean, half_width = monitor.estimate()
+        assert abs(mean - 0.5) < 1e-3 and half_width < 0.01 * mean
+
+        # Noisy IPCs never converge
+        noisy = IPCConvergence(tmp_path / "noisy.csv", tolerance=0.01, min_windows=4)
+        (tmp_path / "noisy.csv").write_text(
+            "cycles,instret\n" + "".join(f"{100 + 100 * (i % 2)},100\n" for i in range(20))
+        )
+        assert noisy.poll() is None
+
+    def test_early_stop(self, tmp_path: Path) -> None:
+        # A 'simulator' that writes a window every 10ms forever
+        cmd = (
+            "echo cycles,instret > perf.csv; while true; do echo 200,100 >> perf.csv;"
+            " printf 20 >> perf.csv; sleep 0.01; echo 0,100 >> perf.csv; done"
+        )
+        monitor = IPCConvergence(tmp_path / "perf.csv", tolerance=0.01, min_windows=5)
+        job = SimJob("sim", cmd, tmp_path, [tmp_path / "perf.csv"], timeout_s=10, monitor=monitor)
+        with JobScheduler(tmp_path / "status.json", 100, 1, poll_interval_s=0.01) as scheduler:
+            status = scheduler.run([job])
+        assert status["sim"].state == JobState.Done
+        assert "windows" in status["sim"].stop_reason
+        # The perf file was cut at the last complete row
+        perf_data = pd.read_csv(tmp_path / "perf.csv")
+        assert (perf_data["instret"] == 100).all()
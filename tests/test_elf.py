@@ -0,0 +1,83 @@
+import pytest
+import struct
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from tidalsim.util.elf import *
+
+
+# Build a minimal little-endian ELF64 with one PT_LOAD segment per entry in [segments]
+# Each entry is (paddr, file contents, size in memory)
+def build_elf(segments: List[Tuple[int, bytes, int]]) -> bytes:
+    ehsize, phentsize = 64, 56
+    phoff = ehsize
+    data_offset = phoff + phentsize * len(segments)
+    header = b"\x7fELF" + bytes([2, 1, 1]) + bytes(9)
+    header += struct.pack(
+        "<HHIQQQIHHHHHH",
+        2,
+        243,
+        1,
+        0x8000_0000,
+        phoff,
+        0,
+        0,
+        ehsize,
+        phentsize,
+        len(segments),
+        64,
+        0,
+        0,
+    )
+    program_headers = b""
+    contents = b""
+    for paddr, data, memsz in segments:
+        program_headers += struct.pack(
+            "<IIQQQQQQ", PT_LOAD, 5, data_offset + len(contents), paddr, paddr, len(data), memsz, 8
+        )
+        contents += data
+    return header + program_headers + contents
+
+
+class TestElf:
+    def test_read_elf_segments(self, tmp_path: Path) -> None:
+        elf = tmp_path / "test.elf"
+        elf.write_bytes(build_elf([(0x8000_0000, b"\x01\x02", 2), (0x8000_1000, b"\x03", 4)]))
+        assert read_elf_header(elf.read_bytes()).e_entry == 0x8000_0000
+        assert read_elf_segments(elf) == [
+            ElfSegment(0x8000_0000, b"\x01\x02"),
+            # .bss is zero-filled up to the size in memory
+            ElfSegment(0x8000_1000, b"\x03\x00\x00\x00"),
+        ]
+
+    def test_elf_memory_image(self, tmp_path: Path) -> None:
+        elf = tmp_path / "test.elf"
+        elf.write_bytes(
+            build_elf(
+                [(0x1000, b"\xff", 1), (0x8000_0000, b"\x01\x02", 2), (0x8000_0010, b"\x03", 1)]
+            )
+        )
+        image = elf_memory_image(elf, base=0x8000_0000)
+        # The segment below the base is ignored
+        assert image.tolist() == [1, 2] + [0] * 14 + [3]
+
+    def test_not_an_elf(self, tmp_path: Path) -> None:
+        (tmp_path / "test.bin").write_bytes(b"\x00" * 64)
+        with pytest.raises(RuntimeError):
+            read_elf_segments(tmp_path / "test.bin")
+
+    def test_write_elf(self, tmp_path: Path) -> None:
+        elf = tmp_path / "mem.elf"
+        image = np.arange(0x2000, dtype=np.uint8)
+        segments = [ElfSegment(0x8000_0000, image[:0x1000]), ElfSegment(0x8000_3000, b"\x01\x02")]
+        write_elf(elf, segments, {"tohost": 0x8000_1000, "fromhost": 0x8000_1040})
+        assert read_elf_header(elf.read_bytes()).e_machine == EM_RISCV
+        assert read_elf_segments(elf) == [
+            ElfSegment(0x8000_0000, image[:0x1000].tobytes()),
+            ElfSegment(0x8000_3000, b"\x01\x02"),
+        ]
+        assert read_elf_symbols(elf) == {"tohost": 0x8000_1000, "fromhost": 0x8000_1040}
+        # Loading the ELF gives back the original memory image
+        assert elf_memory_image(elf).tolist()[:0x1000] == image[:0x1000].tolist()
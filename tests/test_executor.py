@@ -0,0 +1,118 @@
+import pytest
+import math
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+from tidalsim.util.executor import LocalExecutor, LocalQueueWorkers, QueueExecutor
+from tidalsim.util.job_sched import JobMonitor, JobScheduler, JobState, SimJob
+
+
+# Stops a job as soon as [file] exists
+class FileMonitor(JobMonitor):
+    def __init__(self, file: Path) -> None:
+        self.file = file
+        self.stopped = False
+
+    def poll(self) -> Optional[str]:
+        return "enough output" if self.file.exists() else None
+
+    def stop(self) -> None:
+        self.stopped = True
+
+
+class TestExecutor:
+    def test_local_executor(self) -> None:
+        with LocalExecutor(2) as executor:
+            futures = [executor.submit(pow, i, 2) for i in range(4)]
+            assert [f.result() for f in futures] == [0, 1, 4, 9]
+
+    def test_queue_executor(self, tmp_path: Path) -> None:
+        queue_dir = tmp_path / "queue"
+        with QueueExecutor(queue_dir, poll_interval_s=0.01) as executor:
+            with LocalQueueWorkers(queue_dir, 2, poll_interval_s=0.01):
+                futures = [executor.submit(pow, i, 2) for i in range(8)]
+                failure = executor.submit(math.factorial, -1)
+                assert [f.result() for f in futures] == [i**2 for i in range(8)]
+                with pytest.raises(ValueError):
+                    failure.result()
+        assert list((queue_dir / "tasks").iterdir()) == []
+        assert list((queue_dir / "claimed").iterdir()) == []
+        assert list((queue_dir / "results").iterdir()) == []
+
+    def test_copy_artifacts(self, tmp_path: Path) -> None:
+        queue_dir = tmp_path / "queue"
+        src = tmp_path / "ckpt" / "loadarch"
+        dst = tmp_path / "ckpt" / "perf.csv"
+        src.parent.mkdir()
+        src.write_text("state")
+        with QueueExecutor(queue_dir, copy_artifacts=True, poll_interval_s=0.01) as executor:
+            future = executor.submit(shutil.copyfile, src, dst, inputs=[src], outputs=[dst])
+            # The task carries its input, the worker doesn't need to see the original
+            src.unlink()
+            with LocalQueueWorkers(queue_dir, 1, poll_interval_s=0.01):
+                future.result()
+        assert dst.read_text() == "state"
+
+    def test_copy_artifacts_overwrites_stale_inputs(self, tmp_path: Path) -> None:
+        queue_dir = tmp_path / "queue"
+        src = tmp_path / "ckpt" / "loadarch"
+        dst = tmp_path / "ckpt" / "perf.csv"
+        src.parent.mkdir()
+        src.write_text("regenerated")
+        with QueueExecutor(queue_dir, copy_artifacts=True, poll_interval_s=0.01) as executor:
+            future = executor.submit(shutil.copyfile, src, dst, inputs=[src], outputs=[dst])
+            # The worker still has the input from an earlier run
+            src.write_text("stale")
+            with LocalQueueWorkers(queue_dir, 1, poll_interval_s=0.01):
+                future.result()
+        assert dst.read_text() == "regenerated"
+
+    def test_only_requeue_own_tasks(self, tmp_path: Path) -> None:
+        queue_dir = tmp_path / "queue"
+        (queue_dir / "claimed").mkdir(parents=True)
+        # A task of another executor sharing the queue, claimed by a worker that's gone
+        other_claim = queue_dir / "claimed" / "00000000000000000000-other.task@gone"
+        other_claim.write_bytes(b"")
+        with QueueExecutor(queue_dir, poll_interval_s=0.01, worker_timeout_s=0.05) as executor:
+            with LocalQueueWorkers(queue_dir, 1, poll_interval_s=0.01):
+                assert executor.submit(time.sleep, 0.3).result(timeout=30) is None
+        assert other_claim.exists()
+        assert list((queue_dir / "tasks").iterdir()) == []
+
+    def test_requeue_dead_worker(self, tmp_path: Path) -> None:
+        queue_dir = tmp_path / "queue"
+        with QueueExecutor(queue_dir, poll_interval_s=0.01, worker_timeout_s=0.5) as executor:
+            future = executor.submit(pow, 3, 2)
+            # A worker claims the task and dies without ever touching its heartbeat
+            (task_file,) = (queue_dir / "tasks").iterdir()
+            task_file.rename(queue_dir / "claimed" / f"{task_file.name}@dead")
+            with LocalQueueWorkers(queue_dir, 1, poll_interval_s=0.01):
+                assert future.result(timeout=30) == 9
+
+    def test_scheduled_jobs(self, tmp_path: Path) -> None:
+        queue_dir = tmp_path / "queue"
+        monitor = FileMonitor(tmp_path / "progress")
+        jobs = [
+            SimJob("ok", "echo done > perf.csv", tmp_path, [tmp_path / "perf.csv"]),
+            SimJob("hung", "sleep 30", tmp_path, timeout_s=0.5),
+            SimJob("stopped", "touch progress; sleep 30", tmp_path, monitor=monitor),
+        ]
+        with QueueExecutor(queue_dir, poll_interval_s=0.01) as executor:
+            with LocalQueueWorkers(queue_dir, 3, poll_interval_s=0.01):
+                with JobScheduler(
+                    tmp_path / "status.json",
+                    100,
+                    4,
+                    max_attempts=1,
+                    poll_interval_s=0.01,
+                    executor=executor,
+                ) as scheduler:
+                    status = scheduler.run(jobs)
+        assert status["ok"].state == JobState.Done
+        assert status["hung"].state == JobState.Failed
+        assert "timed out" in status["hung"].reason
+        assert status["stopped"].state == JobState.Done
+        assert status["stopped"].stop_reason == "enough output"
+        assert monitor.stopped
@@ -0,0 +1,49 @@
+from pathlib import Path
+
+from tidalsim.modeling.extrapolation import (
+    GoldenSegment,
+    golden_segments,
+    stitch_golden_perf,
+    read_sample_placement,
+    write_sample_placement,
+)
+
+
+class TestExtrapolation:
+    def test_golden_segments(self) -> None:
+        assert golden_segments(2500, 1000, 200) == [
+            GoldenSegment(0, 1000, 0),
+            GoldenSegment(1000, 1000, 800),
+            GoldenSegment(2000, 500, 1800),
+        ]
+        assert golden_segments(2500, 1000, 200)[1].warmup_insts == 200
+        assert golden_segments(1000, 1000, 200) == [GoldenSegment(0, 1000, 0)]
+
+    def test_stitch_golden_perf(self, tmp_path: Path) -> None:
+        # 3 segments of 200 instructions with 100 instructions of warmup, 100 instruction windows
+        segments = golden_segments(550, 200, 100)
+        rows = [
+            # The window past the end of the segment is dropped
+            ["10,100", "20,100", "30,100"],
+            # The first window is warmup
+            ["99,100", "40,100", "50,100"],
+            # The last segment keeps all its windows, including the partial one at the end
+            ["99,100", "60,100", "70,50"],
+        ]
+        perf_files = []
+        for i, segment_rows in enumerate(rows):
+            perf_files.append(tmp_path / f"perf{i}.csv")
+            perf_files[-1].write_text("\n".join(["cycles,instret"] + segment_rows) + "\n")
+        golden_perf_df = stitch_golden_perf(perf_files, segments)
+        assert golden_perf_df["cycles"].tolist() == [10, 20, 40, 50, 60, 70]
+        assert golden_perf_df["inst_count"].tolist() == [100, 200, 300, 400, 500, 550]
+        assert golden_perf_df["ipc"].tolist()[-1] == 50 / 70
+
+    def test_sample_placement(self, tmp_path: Path) -> None:
+        assert read_sample_placement(tmp_path) == {}
+        write_sample_placement(tmp_path, [0, 1000, 5000], [0, 1000, 4000])
+        assert read_sample_placement(tmp_path) == {
+            0: (0, 0),
+            1000: (1000, 0),
+            5000: (4000, 1000),
+        }
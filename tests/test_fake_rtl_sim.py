@@ -0,0 +1,101 @@
+import pytest
+import subprocess
+from pathlib import Path
+
+import pandas as pd
+
+from tidalsim.util.elf import ElfSegment, write_elf
+from tidalsim.util.job_sched import JobScheduler, JobState, SimJob
+from tidalsim.util.loadarch import SCALAR_LINES
+from tidalsim.util.rtl_sim import FakeSimBackend, VCSBackend
+
+
+def make_checkpoint(ckpt_dir: Path, seed: int) -> None:
+    ckpt_dir.mkdir()
+    (ckpt_dir / "loadarch").write_text(
+        "".join([":\n"] + [f"0x{seed + i:016x}\n" for i in range(SCALAR_LINES)])
+    )
+    write_elf(
+        ckpt_dir / "mem.elf",
+        [ElfSegment(0x8000_0000, bytes([seed]) * 64)],
+        {"tohost": 0x8000_1000, "fromhost": 0x8000_1040},
+    )
+
+
+def run_fake_sim(ckpt_dir: Path, max_insts: int, **kwargs) -> subprocess.CompletedProcess:
+    cmd = FakeSimBackend().cmd(
+        perf_file=ckpt_dir / "perf.csv",
+        perf_sample_period=100,
+        max_instructions=max_insts,
+        binary=ckpt_dir / "mem.elf",
+        loadarch=ckpt_dir / "loadarch",
+        suppress_exit=True,
+        **kwargs,
+    )
+    return subprocess.run(cmd, shell=True, cwd=ckpt_dir, capture_output=True)
+
+
+class TestFakeRTLSim:
+    # The fake simulator runs as 'python -m tidalsim.scripts.fake_rtl_sim', even if tidalsim isn't installed
+    @pytest.fixture(autouse=True)
+    def tidalsim_path(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("PYTHONPATH", str(Path(__file__).resolve().parent.parent))
+
+    def test_perf_file(self, tmp_path: Path) -> None:
+        make_checkpoint(tmp_path / "a", 1)
+        assert run_fake_sim(tmp_path / "a", 1050, checkpoint_dir=None).returncode == 0
+        perf_data = pd.read_csv(tmp_path / "a" / "perf.csv")
+        assert perf_data["instret"].tolist() == [100] * 10 + [50]
+        assert (perf_data["cycles"] > 0).all()
+        # Deterministic
+        first_run = (tmp_path / "a" / "perf.csv").read_text()
+        run_fake_sim(tmp_path / "a", 1050, checkpoint_dir=None)
+        assert (tmp_path / "a" / "perf.csv").read_text() == first_run
+        # Another checkpoint performs differently
+        make_checkpoint(tmp_path / "b", 2)
+        run_fake_sim(tmp_path / "b", 1050, checkpoint_dir=None)
+        assert (tmp_path / "b" / "perf.csv").read_text() != first_run
+
+    def test_warm_caches(self, tmp_path: Path) -> None:
+        make_checkpoint(tmp_path / "a", 1)
+        run_fake_sim(tmp_path / "a", 100, checkpoint_dir=None)
+        cold_cycles = pd.read_csv(tmp_path / "a" / "perf.csv")["cycles"][0]
+        (tmp_path / "a" / "dcache_tag_array0.bin").write_text("0" * 32)
+        run_fake_sim(tmp_path / "a", 100, checkpoint_dir=tmp_path / "a")
+        assert pd.read_csv(tmp_path / "a" / "perf.csv")["cycles"][0] < cold_cycles
+
+    def test_failures(self, tmp_path: Path) -> None:
+        make_checkpoint(tmp_path / "a", 1)
+        assert (
+            run_fake_sim(tmp_path / "a", 1000, checkpoint_dir=None, timeout_cycles=10).returncode
+            != 0
+        )
+        (tmp_path / "a" / "loadarch").write_text("garbage\n")
+        assert run_fake_sim(tmp_path / "a", 1000, checkpoint_dir=None).returncode != 0
+
+    def test_scheduled(self, tmp_path: Path) -> None:
+        backend = FakeSimBackend(latency_s=0.01)
+        jobs = []
+        for i in range(4):
+            ckpt_dir = tmp_path / f"0x80000000.{i}"
+            make_checkpoint(ckpt_dir, i)
+            cmd = backend.cmd(
+                ckpt_dir / "perf.csv",
+                100,
+                500,
+                ckpt_dir / "mem.elf",
+                ckpt_dir / "loadarch",
+                suppress_exit=True,
+                checkpoint_dir=None,
+            )
+            jobs.append(SimJob(ckpt_dir.name, cmd, ckpt_dir, [ckpt_dir / "perf.csv"]))
+        with JobScheduler(tmp_path / "status.json", 100, 4, poll_interval_s=0.01) as scheduler:
+            status = scheduler.run(jobs)
+        assert all(s.state == JobState.Done for s in status.values())
+
+    def test_vcs_backend(self) -> None:
+        cmd = VCSBackend(Path("simv"), Path("chipyard")).cmd(
+            Path("perf.csv"), 100, None, Path("mem.elf"), Path("loadarch"), False, None
+        )
+        assert cmd.startswith("simv")
+        assert "+max-instructions" not in cmd and "+suppress-exit" not in cmd
@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+
+from tidalsim.util.job_sched import JobScheduler, JobState, SimJob, failed_jobs
+from tidalsim.util.rtl_sim import rtl_sim_cmd, rtl_sim_timeouts
+
+
+def touch_job(tmp_path: Path, name: str, **kwargs) -> SimJob:
+    return SimJob(
+        name,
+        f"echo {name} >> order.txt && touch {name}.out",
+        tmp_path,
+        [tmp_path / f"{name}.out"],
+        **kwargs,
+    )
+
+
+class TestJobSched:
+    def test_longest_first(self, tmp_path: Path) -> None:
+        jobs = [touch_job(tmp_path, f"j{i}", expected_cost=i) for i in range(4)]
+        with JobScheduler(tmp_path / "status.json", 100, 1, poll_interval_s=0.01) as scheduler:
+            status = scheduler.run(jobs)
+        assert all(s.state == JobState.Done for s in status.values())
+        assert (tmp_path / "order.txt").read_text().split() == ["j3", "j2", "j1", "j0"]
+
+    def test_memory_limit(self, tmp_path: Path) -> None:
+        # Each job records how many jobs are running alongside it
+        jobs = [
+            SimJob(
+                f"j{i}",
+                "touch running.$$ && sleep 0.2 && ls running.* | wc -l >> counts.txt && rm"
+                " running.$$",
+                tmp_path,
+                mem_gb=10,
+            )
+            for i in range(4)
+        ]
+        with JobScheduler(tmp_path / "status.json", 25, 8, poll_interval_s=0.01) as scheduler:
+            scheduler.run(jobs)
+        counts = [int(c) for c in (tmp_path / "counts.txt").read_text().split()]
+        assert len(counts) == 4 and max(counts) <= 2
+        # A job larger than the limit still runs on its own
+        big = SimJob("big", "true", tmp_path, mem_gb=50)
+        with JobScheduler(tmp_path / "status.json", 25, 8, poll_interval_s=0.01) as scheduler:
+            assert scheduler.run([big])["big"].state == JobState.Done
+
+    def test_retries_and_failures(self, tmp_path: Path) -> None:
+        # Fails on the first attempt only
+        flaky = SimJob("flaky", "test -f tried || (touch tried && false)", tmp_path)
+        broken = SimJob("broken", "exit 3", tmp_path)
+        no_output = SimJob("no_output", "true", tmp_path, [tmp_path / "missing"])
+        hung = SimJob("hung", "sleep 10", tmp_path, timeout_s=0.2)
+        ok = touch_job(tmp_path, "ok")
+        with JobScheduler(
+            tmp_path / "status.json", 100, 8, max_attempts=2, poll_interval_s=0.01
+        ) as scheduler:
+            status = scheduler.run([flaky, broken, no_output, hung, ok])
+        assert status["flaky"].state == JobState.Done and status["flaky"].attempts == 2
+        assert status["broken"].state == JobState.Failed and status["broken"].returncode == 3
+        assert "missing" in status["no_output"].reason
+        assert "timed out" in status["hung"].reason
+        assert status["ok"].state == JobState.Done
+        assert sorted(failed_jobs(status)) == ["broken", "hung", "no_output"]
+        saved = json.loads((tmp_path / "status.json").read_text())
+        assert saved["broken"]["state"] == "failed"
+
+    def test_resume(self, tmp_path: Path) -> None:
+        jobs = [touch_job(tmp_path, "a"), SimJob("b", "exit 1", tmp_path)]
+        with JobScheduler(tmp_path / "status.json", 100, 8, 1, poll_interval_s=0.01) as scheduler:
+            scheduler.run(jobs)
+        # Only the failed job runs again
+        jobs = [touch_job(tmp_path, "a"), touch_job(tmp_path, "b")]
+        with JobScheduler(tmp_path / "status.json", 100, 8, 1, poll_interval_s=0.01) as scheduler:
+            status = scheduler.run(jobs)
+        assert status["b"].state == JobState.Done
+        assert (tmp_path / "order.txt").read_text().split() == ["a", "b"]
+        # A finished job whose output is gone runs again
+        (tmp_path / "a.out").unlink()
+        with JobScheduler(tmp_path / "status.json", 100, 8, 1, poll_interval_s=0.01) as scheduler:
+            scheduler.run(jobs)
+        assert (tmp_path / "order.txt").read_text().split() == ["a", "b", "a"]
+
+    def test_rtl_sim_cmd(self) -> None:
+        timeout_cycles, timeout_s = rtl_sim_timeouts(1_000_000, 20, 500)
+        assert timeout_cycles == 20_000_000 and timeout_s == 40_000
+        cmd = rtl_sim_cmd(
+            Path("simv"),
+            Path("perf.csv"),
+            100,
+            1000,
+            Path("chipyard"),
+            Path("mem.elf"),
+            Path("loadarch"),
+            suppress_exit=True,
+            checkpoint_dir=None,
+            timeout_cycles=timeout_cycles,
+        )
+        assert "+max-cycles=20000000" in cmd
+        assert "+max-instructions=1000" in cmd
+        assert "+suppress-exit" in cmd
+        assert "+checkpoint-dir" not in cmd
@@ -0,0 +1,75 @@
+import pytest
+from typing import List
+
+from tidalsim.util.loadarch import *
+
+
+# The output 'vreg' prints with [n_elems] 64-bit elements per vector register
+def vreg_lines(vlen: int, n_elems: int) -> List[str]:
+    elems = "  ".join(f"[{e}]: 0x{0:016x}" for e in reversed(range(n_elems)))
+    return [f"VLEN={vlen} bits; ELEN=64 bits\n"] + [f"v{i:<3}: {elems}\n" for i in range(32)]
+
+
+# The output spike prints for one checkpoint of [n_harts] harts, every register value is [base] + its line
+def loadarch_lines(n_harts: int, base: int = 0, vregs: List[str] = vreg_lines(128, 2)) -> List[str]:
+    lines = [":\n"]
+    for h in range(n_harts):
+        lines += [f"0x{base + i:016x}\n" for i in range(SCALAR_LINES)]
+        lines += vregs
+    return lines
+
+
+class TestLoadarch:
+    def test_from_lines(self) -> None:
+        loadarch = Loadarch.from_lines(loadarch_lines(2))
+        assert len(loadarch.harts) == 2
+        hart = loadarch.harts[1]
+        assert hart.pc == 0
+        assert hart.priv == 1
+        assert hart.csrs["fcsr"] == 2
+        assert hart.csrs["satp"] == 2 + CSR_NAMES.index("satp")
+        assert hart.fregs[0] == 2 + len(CSR_NAMES) + 2
+        assert hart.xregs[31] == SCALAR_LINES - 1
+        assert hart.vregs[0] == "VLEN=128 bits; ELEN=64 bits"
+        assert len(hart.vregs) == 33
+
+    def test_vreg_layouts(self) -> None:
+        # The vreg output is found by its contents, however many lines it takes
+        wide = vreg_lines(512, 8)
+        for vregs in [wide, wide[:1], []]:
+            loadarch = Loadarch.from_lines(loadarch_lines(2, vregs=vregs))
+            assert len(loadarch.harts) == 2
+            assert [hart.vregs for hart in loadarch.harts] == [[l.rstrip("\n") for l in vregs]] * 2
+            assert loadarch.harts[1].pc == 0
+
+    def test_bad_loadarch(self) -> None:
+        with pytest.raises(RuntimeError):
+            Loadarch.from_lines(loadarch_lines(1)[:SCALAR_LINES])
+        with pytest.raises(RuntimeError):
+            Loadarch.from_lines(loadarch_lines(1) + ["core 0: exception\n"])
+        lines = loadarch_lines(1)
+        lines[1] = "core 0: exception\n"
+        with pytest.raises(RuntimeError):
+            Loadarch.from_lines(lines)
+
+    def test_bytes_roundtrip(self) -> None:
+        loadarch = Loadarch.from_lines(loadarch_lines(2))
+        loadarch.harts[0].xregs[3] = 0xFFFF_FFFF_0000_0000
+        loadarch.harts[1].fregs[3] = (1 << 127) | 5
+        raw = loadarch.to_bytes()
+        assert Loadarch.from_bytes(raw) == loadarch
+        with pytest.raises(RuntimeError):
+            Loadarch.from_bytes(raw[1:])
+
+    def test_stream_loadarchs(self) -> None:
+        first = loadarch_lines(2, base=0)
+        lines = first + loadarch_lines(2, base=100, vregs=vreg_lines(256, 4))
+        loadarchs = list(stream_loadarchs(iter(lines), n_harts=2))
+        assert len(loadarchs) == 2
+        assert loadarchs[0][0] == first
+        assert loadarchs[1][1].harts[1].pc == 100
+        assert len(loadarchs[1][1].harts[1].vregs) == 33
+        with pytest.raises(RuntimeError):
+            list(stream_loadarchs(iter(lines[: -33 - SCALAR_LINES]), n_harts=2))
+        with pytest.raises(RuntimeError):
+            list(stream_loadarchs(iter(lines[:-34]), n_harts=2))
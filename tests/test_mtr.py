@@ -1,9 +1,18 @@
 import pytest
+import itertools
 import struct
+from pathlib import Path
 
 from tidalsim.cache_model.cache import *
 from tidalsim.cache_model.mtr import *
-from tidalsim.util.spike_log import SpikeTraceEntry, SpikeCommitInfo, Op
+from tidalsim.util.spike_log import (
+    SpikeTraceEntry,
+    SpikeCommitInfo,
+    Op,
+    parse_spike_log,
+    spike_log_inst_count,
+    spike_log_inst_offsets,
+)
 
 
 class TestMTRCkpt:
@@ -46,6 +55,72 @@ class TestMTRCkpt:
             ),
         ]
 
+    def test_mtr_merge(self) -> None:
+        earlier = MTR(self.block_size, {0: MTREntry(2, None), 1: MTREntry(None, 3)})
+        later = MTR(self.block_size, {0: MTREntry(None, 4), 2: MTREntry(5, None)})
+        assert earlier.merge(later) == MTR(
+            self.block_size, {0: MTREntry(2, 4), 1: MTREntry(None, 3), 2: MTREntry(5, None)}
+        )
+        # The inputs shouldn't be modified
+        assert earlier == MTR(self.block_size, {0: MTREntry(2, None), 1: MTREntry(None, 3)})
+
+    # A full commit log with bootrom instructions (which aren't counted) and labels
+    trace = """core   0: 0x0000000000001000 (0x00000297) auipc   t0, 0x0
+core   0: 3 0x0000000000001000 (0x00000297) x5  0x0000000000001000
+core   0: 0x0000000000001004 (0x0182b283) ld      t0, 24(t0)
+core   0: 3 0x0000000000001004 (0x0182b283) x5  0x0000000080000000 mem 0x0000000000001018
+core   0: >>>>  _start
+core   0: 0x0000000080000000 (0x00052583) lw      a1, 0(a0)
+core   0: 3 0x0000000080000000 (0x00052583) x11 0x0000000000000001 mem 0x0000000080002000
+core   0: 0x0000000080000004 (0x00b52223) sw      a1, 4(a0)
+core   0: 3 0x0000000080000004 (0x00b52223) mem 0x0000000080002004 0x00000001
+core   0: 0x0000000080000008 (0x00158593) addi    a1, a1, 1
+core   0: 3 0x0000000080000008 (0x00158593) x11 0x0000000000000002
+core   0: >>>>  loop
+core   0: 0x000000008000000c (0x04b52023) sw      a1, 64(a0)
+core   0: 3 0x000000008000000c (0x04b52023) mem 0x0000000080002040 0x00000002
+core   0: 0x0000000080000010 (0x08052603) lw      a2, 128(a0)
+core   0: 3 0x0000000080000010 (0x08052603) x12 0x0000000000000007 mem 0x0000000080002080
+core   0: 0x0000000080000014 (0x00c52423) sw      a2, 8(a0)
+core   0: 3 0x0000000080000014 (0x00c52423) mem 0x0000000080002008 0x00000007
+core   0: 0x0000000080000018 (0x00052683) lw      a3, 0(a0)
+core   0: 3 0x0000000080000018 (0x00052683) x13 0x0000000000000001 mem 0x0000000080002000
+core   0: 0x000000008000001c (0x04d52223) sw      a3, 68(a0)
+core   0: 3 0x000000008000001c (0x04d52223) mem 0x0000000080002044 0x00000001
+"""
+
+    @pytest.mark.parametrize("track_data", [False, True])
+    def test_mtr_ckpt_from_inst_points_sharded(self, tmp_path: Path, track_data: bool) -> None:
+        trace_file = tmp_path / "spike.trace"
+        trace_file.write_text(self.trace)
+        for inst_points in [[0, 3, 6], [1, 2, 5, 8], [3, 3, 8], [8]]:
+            with trace_file.open("r") as f:
+                sequential = mtr_ckpts_from_inst_points(
+                    parse_spike_log(f, True), self.block_size, inst_points, track_data
+                )
+            sharded = mtr_ckpts_from_inst_points_sharded(
+                trace_file, True, self.block_size, inst_points, n_jobs=2, track_data=track_data
+            )
+            assert sharded == sequential
+
+    def test_spike_log_inst_offsets(self, tmp_path: Path) -> None:
+        trace_file = tmp_path / "spike.trace"
+        trace_file.write_text(self.trace)
+        offsets = spike_log_inst_offsets(trace_file, True, [0, 3, 3, 8, 10])
+        lines = self.trace.splitlines(keepends=True)
+        line_offsets = list(itertools.accumulate((len(line) for line in lines), initial=0))
+        # The lines of instructions 0 and 3, then the end of the log
+        assert (
+            offsets == [line_offsets[5], line_offsets[12], line_offsets[12]] + [len(self.trace)] * 2
+        )
+
+    def test_spike_log_inst_count(self, tmp_path: Path) -> None:
+        trace_file = tmp_path / "spike.trace"
+        trace_file.write_text(self.trace)
+        with trace_file.open("r") as f:
+            n_insts = sum(1 for _ in parse_spike_log(f, True))
+        assert spike_log_inst_count(trace_file, True) == n_insts
+
 
 class TestMTRCache:
     byte_offset_bits = 6
@@ -76,19 +151,20 @@ class TestMTRCache:
         self, expected: Dict[Tuple[int, int], Tuple[int, CohStatus]], cache: CacheState
     ) -> None:
         for (way_idx, set_idx), (block_addr, coh) in expected.items():
-            block = cache.array[way_idx][set_idx]
+            block = cache.block(way_idx, set_idx)
             assert block.tag == (block_addr >> cache.params.set_bits)
             assert block.coherency == coh
 
+    # Blocks that were only read are clean (Trunk), written blocks are Dirty
     def test_mtr_cache_reconstruction_1_way(self) -> None:
         params = self.cache_params(1)
         cache = self.mtr.as_cache(params)
         print(cache.array_pretty_str(Array.Tag))
         expected: Dict[Tuple[int, int], Tuple[int, CohStatus]] = {
-            (0, 0): (16, CohStatus.Dirty),
+            (0, 0): (16, CohStatus.Trunk),
             (0, 1): (1, CohStatus.Dirty),
             (0, 2): (0, CohStatus.Nothing),
-            (0, 3): (11, CohStatus.Dirty),
+            (0, 3): (11, CohStatus.Trunk),
         }
         self.check(expected, cache)
 
@@ -97,17 +173,24 @@ class TestMTRCache:
         cache = self.mtr.as_cache(params)
         print(cache.array_pretty_str(Array.Tag))
         expected: Dict[Tuple[int, int], Tuple[int, CohStatus]] = {
-            (0, 0): (16, CohStatus.Dirty),
+            (0, 0): (16, CohStatus.Trunk),
             (1, 0): (8, CohStatus.Dirty),
             (2, 0): (0, CohStatus.Dirty),
             (3, 0): (12, CohStatus.Dirty),
             (0, 1): (1, CohStatus.Dirty),
             (0, 2): (0, CohStatus.Nothing),
-            (0, 3): (11, CohStatus.Dirty),
+            (0, 3): (11, CohStatus.Trunk),
             (1, 3): (7, CohStatus.Dirty),
         }
         self.check(expected, cache)
 
+    def test_mtr_cache_reconstruction_sweep(self) -> None:
+        params = [self.cache_params(ways) for ways in [1, 2, 4]]
+        caches = reconstruct_caches(self.mtr, params, n_jobs=2)
+        for p, cache in zip(params, caches):
+            assert cache == self.mtr.as_cache(p)
+        assert caches == self.mtr.as_caches(params)
+
 
 class TestMTRCacheData:
     byte_offset_bits = 6
@@ -145,5 +228,185 @@ class TestMTRCacheData:
         cache: CacheState
         with (tmp_path / "data.bin").open("rb") as f:
             cache = mtr.as_cache(self.params, dram_bin=f, dram_base=0)
-        assert cache.array[0][0].data == 0xFFFF_CAFE_FFFF_CAFE_DEDE_BBAC_FFFF_CAFE
+        assert cache.block(0, 0).data == 0xFFFF_CAFE_FFFF_CAFE_DEDE_BBAC_FFFF_CAFE
         print(cache.array_pretty_str(Array.Data))
+
+    def test_gather_blocks(self) -> None:
+        image = np.arange(100, dtype=np.uint8)
+        blocks = gather_blocks(image, np.array([0, 64, 96]), 8)
+        assert blocks.tolist() == [
+            list(range(8)),
+            list(range(64, 72)),
+            [96, 97, 98, 99, 0, 0, 0, 0],
+        ]
+
+    def test_map_dram_image(self, tmp_path: Path) -> None:
+        (tmp_path / "mem.bin").write_bytes(bytes(range(200)))
+        image = map_dram_image(tmp_path / "mem.bin")
+        assert image.tolist() == list(range(200))
+        (tmp_path / "empty.bin").write_bytes(b"")
+        assert len(map_dram_image(tmp_path / "empty.bin")) == 0
+        # A mapped image gives the same reconstruction as passing the file handle
+        mtr = MTR(self.block_size, {0: MTREntry(1, None), 1: MTREntry(2, None)})
+        with (tmp_path / "mem.bin").open("rb") as f:
+            assert mtr.as_cache(self.params, f, dram_base=0) == mtr.as_cache(
+                self.params, image, dram_base=0
+            )
+
+    def test_mtr_track_data(self) -> None:
+        mtr = MTR(self.block_size, track_data=True)
+        mtr.update(SpikeCommitInfo(address=4, data=0x1234_5678, op=Op.Store, size=4), 0)
+        # Only the low [size] bytes of the data are recorded
+        mtr.update(SpikeCommitInfo(address=8, data=0xFFFF_FFAB, op=Op.Load, size=1), 1)
+        # A misaligned access straddling blocks 0 and 1
+        mtr.update(SpikeCommitInfo(address=62, data=0xAABB_CCDD, op=Op.Store, size=4), 2)
+        # Accesses without a known size are ignored
+        mtr.update(SpikeCommitInfo(address=128, data=0xFF, op=Op.Load), 3)
+        assert mtr.block_data[0][4:9] == bytes([0x78, 0x56, 0x34, 0x12, 0xAB])
+        assert mtr.block_data[0][62:] == bytes([0xDD, 0xCC])
+        assert mtr.block_valid[0] == (0b1_1111 << 4) | (0b11 << 62)
+        assert mtr.block_data[1][:2] == bytes([0xBB, 0xAA])
+        assert mtr.block_valid[1] == 0b11
+        assert 2 not in mtr.block_data
+
+        later = MTR(self.block_size, track_data=True)
+        later.update(SpikeCommitInfo(address=6, data=0xEEEE, op=Op.Store, size=2), 10)
+        merged = mtr.merge(later)
+        assert merged.block_data[0][4:9] == bytes([0x78, 0x56, 0xEE, 0xEE, 0xAB])
+        assert merged.block_valid[0] == mtr.block_valid[0]
+        # Merging doesn't touch the inputs
+        assert mtr.block_data[0][6] == 0x34
+
+    def test_mtr_cache_reconstruction_from_trace_data(self) -> None:
+        mtr = MTR(self.block_size, track_data=True)
+        mtr.update(SpikeCommitInfo(address=0x10, data=0xCAFE, op=Op.Store, size=2), 0)
+        mtr.update(SpikeCommitInfo(address=0x40, data=0x12, op=Op.Load, size=1), 1)
+        initial_image = np.arange(256, dtype=np.uint8)
+        cache = mtr.as_cache(self.params, dram_base=0, initial_image=initial_image)
+        expected_block_0 = list(range(64))
+        expected_block_0[0x10:0x12] = [0xFE, 0xCA]
+        assert cache.data[0, 0].tolist() == expected_block_0
+        assert cache.data[0, 1].tolist() == [0x12] + list(range(65, 128))
+        # Without an initial image, the untouched bytes are zero
+        cache = mtr.as_cache(self.params, dram_base=0)
+        assert cache.block(0, 0).data == 0xCAFE << (0x10 * 8)
+        assert cache.block(0, 1).data == 0x12
+
+    def test_mtr_memory_pages(self) -> None:
+        mtr = MTR(self.block_size, track_data=True)
+        mtr.update(SpikeCommitInfo(address=0x1010, data=0xCAFE, op=Op.Store, size=2), 0)
+        mtr.update(SpikeCommitInfo(address=0x1304, data=0x12, op=Op.Load, size=1), 1)
+        # Accesses outside DRAM are ignored
+        mtr.update(SpikeCommitInfo(address=0x10, data=0xFF, op=Op.Store, size=1), 2)
+        initial_image = np.arange(16, dtype=np.uint8)
+        pages = mtr.memory_pages(initial_image, dram_base=0x1000, dram_size=0x400, page_size=0x100)
+        # Only the pages holding initialized or traced bytes are built
+        assert sorted(pages) == [0, 0x300]
+        assert pages[0].tolist() == list(range(16)) + [0xFE, 0xCA] + [0] * (0x100 - 18)
+        assert pages[0x300].tolist() == [0] * 4 + [0x12] + [0] * (0x100 - 5)
+        assert mtr.untracked_accesses == 0
+        # Loads whose size isn't known can't be tracked
+        mtr.update(SpikeCommitInfo(address=0x1400, data=0, op=Op.Load), 3)
+        assert mtr.untracked_accesses == 1
+        assert mtr.merge(mtr).untracked_accesses == 2
+
+    def test_mtr_ckpts_track_data_sharded(self, tmp_path: Path) -> None:
+        trace_file = tmp_path / "spike.trace"
+        trace_file.write_text(
+            "".join(
+                f"core   0: 0x{0x8000_0000 + 4 * i:016x} (0x00b52023) sw      a1, 0(a0)\n"
+                f"core   0: 3 0x{0x8000_0000 + 4 * i:016x} (0x00b52023) mem"
+                f" 0x{4 * i:016x} 0x{i + 1:08x}\n"
+                for i in range(8)
+            )
+        )
+        with trace_file.open("r") as f:
+            sequential = mtr_ckpts_from_inst_points(
+                parse_spike_log(f, True), self.block_size, [2, 5, 8], True
+            )
+        sharded = mtr_ckpts_from_inst_points_sharded(
+            trace_file, True, self.block_size, [2, 5, 8], n_jobs=2, track_data=True
+        )
+        assert sequential == sharded
+        assert sequential[-1].block_data[0][:32] == b"".join(
+            struct.pack("<L", i + 1) for i in range(8)
+        )
+
+
+class TestIcacheMTR:
+    block_size = 64
+
+    def test_update_fetch(self) -> None:
+        imtr = MTR(self.block_size)
+        imtr.update_fetch(0x0, 4, 0)
+        imtr.update_fetch(0x4, 2, 1)
+        # A 4 byte instruction straddling blocks 0 and 1
+        imtr.update_fetch(0x3E, 4, 2)
+        imtr.update_fetch(0x80, 2, 3)
+        assert imtr == MTR(
+            self.block_size, {0: MTREntry(2, None), 1: MTREntry(2, None), 2: MTREntry(3, None)}
+        )
+
+
+class TestMTRCacheHierarchy:
+    block_size = 64
+    l1_params = CacheParams(32, block_size, n_sets=1, n_ways=2)
+    l2_params = CacheParams(32, block_size, n_sets=2, n_ways=1)
+    # From most to least recently used: blocks 1, 2, 3, 0
+    mtr = MTR(
+        block_size,
+        {
+            0: MTREntry(1, None),
+            1: MTREntry(4, None),
+            2: MTREntry(3, None),
+            3: MTREntry(2, None),
+        },
+    )
+
+    def test_inclusive(self) -> None:
+        l1s, l2 = self.mtr.as_cache_hierarchy([self.l1_params], self.l2_params)
+        # The L2 holds the MRU block of each set: block 2 (set 0) and block 1 (set 1)
+        assert l2.block(0, 0).tag == 1
+        assert l2.block(0, 1).tag == 0
+        # The L1 only holds blocks that are in the L2, and they are Trunk in the L2
+        assert [l1s[0].block(w, 0).tag for w in range(2)] == [1, 2]
+        assert l2.block(0, 0).coherency == CohStatus.Trunk
+        assert l2.block(0, 1).coherency == CohStatus.Trunk
+
+    def test_non_inclusive(self) -> None:
+        l2_params = CacheParams(32, self.block_size, n_sets=1, n_ways=1)
+        l1s, l2 = self.mtr.as_cache_hierarchy([self.l1_params], l2_params, inclusive=False)
+        # The L1 holds the two most recently used blocks, regardless of the L2
+        assert [l1s[0].block(w, 0).tag for w in range(2)] == [1, 2]
+        assert l2.block(0, 0).tag == 1
+        assert l2.block(0, 0).coherency == CohStatus.Trunk
+        # With inclusion, the L1 can only hold the single block in the L2
+        l1s, l2 = self.mtr.as_cache_hierarchy([self.l1_params], l2_params)
+        assert l1s[0].block(0, 0).tag == 1
+        assert l1s[0].block(1, 0).coherency == CohStatus.Nothing
+
+    def test_l2_coherency(self) -> None:
+        # From most to least recently used: blocks 0, 1, 2, 3, only 0 and 2 were written
+        mtr = MTR(
+            self.block_size,
+            {
+                0: MTREntry(None, 4),
+                1: MTREntry(3, None),
+                2: MTREntry(None, 2),
+                3: MTREntry(1, None),
+            },
+        )
+        l1_params = [
+            CacheParams(32, self.block_size, n_sets=1, n_ways=1),
+            CacheParams(32, self.block_size, n_sets=2, n_ways=1),
+        ]
+        l2_params = CacheParams(32, self.block_size, n_sets=4, n_ways=1)
+        l1s, l2 = mtr.as_cache_hierarchy(l1_params, l2_params)
+        # Blocks 0 and 1 are held by an L1 (block 1 only by the second one), block 2 is dirty in
+        # the L2 only and block 3 is clean
+        assert [l2.block(0, set_idx).coherency for set_idx in range(4)] == [
+            CohStatus.Trunk,
+            CohStatus.Trunk,
+            CohStatus.Dirty,
+            CohStatus.Trunk,
+        ]
@@ -0,0 +1,111 @@
+import pytest
+from pathlib import Path
+
+from tidalsim.cache_model.cache import CacheParams, CohStatus
+from tidalsim.cache_model.mtr import MTR, MTREntry
+from tidalsim.cache_model.multicore_mtr import *
+from tidalsim.util.spike_log import SpikeTraceEntry, SpikeCommitInfo, Op, parse_spike_log
+from tidalsim.util.spike_ckpt import dump_multicore_dcache_ckpt
+
+
+class TestMulticoreMTR:
+    block_size = 64
+
+    def test_hart_entry(self) -> None:
+        # hart 0 wrote the block, then hart 1 read it: both hold it
+        entry = MulticoreMTREntry({1: 5}, last_writetime=3, last_writer=0)
+        assert entry.hart_entry(0) == MTREntry(None, 3, 0)
+        assert entry.hart_entry(1) == MTREntry(5, None)
+        # hart 1's read came before hart 0's write, so it was invalidated
+        entry = MulticoreMTREntry({1: 2}, last_writetime=3, last_writer=0)
+        assert entry.hart_entry(1) is None
+        assert entry.hart_entry(2) is None
+
+    def test_merge(self) -> None:
+        earlier = MulticoreMTR(
+            self.block_size, 2, {0: MulticoreMTREntry({0: 1}, 2, 0), 1: MulticoreMTREntry({1: 3})}
+        )
+        later = MulticoreMTR(
+            self.block_size, 2, {0: MulticoreMTREntry({1: 5}, 4, 1), 2: MulticoreMTREntry({0: 6})}
+        )
+        assert earlier.merge(later) == MulticoreMTR(
+            self.block_size,
+            2,
+            {
+                0: MulticoreMTREntry({0: 1, 1: 5}, 4, 1),
+                1: MulticoreMTREntry({1: 3}),
+                2: MulticoreMTREntry({0: 6}),
+            },
+        )
+        # The inputs shouldn't be modified
+        assert earlier.table[0] == MulticoreMTREntry({0: 1}, 2, 0)
+
+    def test_ckpts_from_inst_points(self) -> None:
+        log = [
+            SpikeTraceEntry(0x0, "sw", 0, SpikeCommitInfo(0x0, 0, Op.Store), hart=0),
+            SpikeTraceEntry(0x0, "lw", 1, SpikeCommitInfo(0x0, 0, Op.Load), hart=1),
+            SpikeTraceEntry(0x4, "sw", 2, SpikeCommitInfo(0x40, 0, Op.Store), hart=1),
+            SpikeTraceEntry(0x8, "lw", 3, SpikeCommitInfo(0x44, 0, Op.Load), hart=0),
+            SpikeTraceEntry(0xC, "sw", 4, SpikeCommitInfo(0x44, 0, Op.Store), hart=0),
+        ]
+        mtr_ckpts = multicore_mtr_ckpts_from_inst_points(iter(log), self.block_size, [2, 5], 2)
+        assert mtr_ckpts[0].table == {0: MulticoreMTREntry({1: 1}, 0, 0)}
+        assert mtr_ckpts[1].table == {
+            0: MulticoreMTREntry({1: 1}, 0, 0),
+            1: MulticoreMTREntry({0: 3}, 4, 0),
+        }
+        mtr = mtr_ckpts[1]
+        assert mtr.hart_view(0) == MTR(
+            self.block_size, {0: MTREntry(None, 0, 0), 1: MTREntry(3, 4, 0)}
+        )
+        # hart 1's copy of block 1 was invalidated by hart 0's store
+        assert mtr.hart_view(1) == MTR(self.block_size, {0: MTREntry(1, None)})
+
+    def test_as_caches(self) -> None:
+        mtr = MulticoreMTR(
+            self.block_size,
+            2,
+            {
+                # shared: written by hart 0, then read by hart 1
+                0: MulticoreMTREntry({1: 5}, 3, 0),
+                # private to hart 0, dirty
+                1: MulticoreMTREntry({}, 4, 0),
+                # private to hart 1, clean
+                2: MulticoreMTREntry({1: 6}),
+            },
+        )
+        params = CacheParams(32, self.block_size, n_sets=1, n_ways=2)
+        hart0, hart1 = mtr.as_caches(params, n_jobs=1)
+        assert sorted(hart0.coherency[:, 0].tolist()) == sorted([CohStatus.Branch, CohStatus.Dirty])
+        assert sorted(hart1.coherency[:, 0].tolist()) == sorted([CohStatus.Branch, CohStatus.Trunk])
+
+    def test_dump_every_geometry(self, tmp_path: Path) -> None:
+        dram_block = 0x8000_0000 // self.block_size
+        mtr = MulticoreMTR(
+            self.block_size,
+            2,
+            {
+                dram_block: MulticoreMTREntry({1: 5}, 3, 0),
+                dram_block + 1: MulticoreMTREntry({}, 4, 0),
+            },
+        )
+        (tmp_path / "mem.0x80000000.bin").write_bytes(bytes(4096))
+        params = [
+            CacheParams(32, self.block_size, n_sets=1, n_ways=2),
+            CacheParams(32, self.block_size, n_sets=2, n_ways=1),
+        ]
+        dump_multicore_dcache_ckpt(mtr, tmp_path, params, n_jobs=1)
+        for hart in range(2):
+            hart_dir = tmp_path / f"hart{hart}"
+            assert list(hart_dir.glob("dcache_tag_array*"))
+            for geometry in ["1x2", "2x1"]:
+                assert list((hart_dir / f"dcache.{geometry}").glob("dcache_tag_array*"))
+
+
+def test_parse_hart() -> None:
+    lines = [
+        "core   1: 0x0000000080001a8e (0x00009522) c.add   a0, s0",
+    ]
+    assert list(parse_spike_log(iter(lines), full_commit_log=False)) == [
+        SpikeTraceEntry(0x8000_1A8E, "c.add", 0, None, inst_bytes=2, hart=1)
+    ]
@@ -0,0 +1,76 @@
+import pytest
+from pathlib import Path
+
+from tidalsim.cache_model.cache import CacheParams
+from tidalsim.cache_model.mtr import MTR, MTREntry
+from tidalsim.util.elf import ElfSegment, write_elf
+from tidalsim.util.executor import LocalQueueWorkers, QueueExecutor
+from tidalsim.util.job_sched import JobScheduler, JobState, SimJob
+from tidalsim.util.pipeline import CheckpointPipeline
+from tidalsim.util.spike_ckpt import CkptStateParams, dump_ckpt_state
+
+
+def sim_job(ckpt_dir: Path) -> SimJob:
+    # Only succeeds if the caches were reconstructed first
+    return SimJob(
+        ckpt_dir.name,
+        "test -f dcache_tag_array0.bin && touch perf.csv",
+        ckpt_dir,
+        [ckpt_dir / "perf.csv"],
+    )
+
+
+class TestPipeline:
+    def test_checkpoint_pipeline(self, tmp_path: Path) -> None:
+        binary = tmp_path / "test.elf"
+        write_elf(binary, [ElfSegment(0x8000_0000, bytes(range(256)))], {})
+        params = CkptStateParams([CacheParams(32, 64, 4, 1)], [], elf=binary)
+        mtr = MTR(64, {(0x8000_0000 >> 6): MTREntry(0, None)})
+        ckpt_dirs = [tmp_path / f"0x80000000.{i}" for i in range(3)]
+        for ckpt_dir in ckpt_dirs:
+            ckpt_dir.mkdir()
+        with JobScheduler(tmp_path / "status.json", 100, 4, poll_interval_s=0.01) as scheduler:
+            pipeline = CheckpointPipeline(scheduler, sim_job, n_workers=2)
+            for ckpt_dir in ckpt_dirs:
+                pipeline.checkpoint_ready(ckpt_dir, dump_ckpt_state, ckpt_dir, params, mtr)
+            status = pipeline.wait()
+        assert all(status[c.name].state == JobState.Done for c in ckpt_dirs)
+
+    def test_post_process_failure(self, tmp_path: Path) -> None:
+        # Without an ELF, the block data comes from a DRAM dump that doesn't exist
+        params = CkptStateParams([CacheParams(32, 64, 4, 1)], [])
+        mtr = MTR(64, {(0x8000_0000 >> 6): MTREntry(0, None)})
+        bad_dir = tmp_path / "0x80000000.0"
+        good_dir = tmp_path / "0x80000000.100"
+        for ckpt_dir in [bad_dir, good_dir]:
+            ckpt_dir.mkdir()
+        (good_dir / "dcache_tag_array0.bin").touch()
+        with JobScheduler(tmp_path / "status.json", 100, 4, poll_interval_s=0.01) as scheduler:
+            pipeline = CheckpointPipeline(scheduler, sim_job, n_workers=1)
+            pipeline.checkpoint_ready(bad_dir, dump_ckpt_state, bad_dir, params, mtr)
+            pipeline.checkpoint_ready(good_dir)
+            with pytest.raises(Exception):
+                pipeline.wait()
+            # The other checkpoint is still simulated
+            assert scheduler.status[good_dir.name].state == JobState.Done
+            assert bad_dir.name not in scheduler.status
+
+    def test_queue_executor(self, tmp_path: Path) -> None:
+        binary = tmp_path / "test.elf"
+        write_elf(binary, [ElfSegment(0x8000_0000, bytes(range(256)))], {})
+        params = CkptStateParams([CacheParams(32, 64, 4, 1)], [], elf=binary)
+        mtr = MTR(64, {(0x8000_0000 >> 6): MTREntry(0, None)})
+        ckpt_dirs = [tmp_path / f"0x80000000.{i}" for i in range(3)]
+        for ckpt_dir in ckpt_dirs:
+            ckpt_dir.mkdir()
+        queue_dir = tmp_path / "queue"
+        with QueueExecutor(queue_dir, poll_interval_s=0.01) as executor:
+            with LocalQueueWorkers(queue_dir, 2, poll_interval_s=0.01):
+                with JobScheduler(
+                    tmp_path / "status.json", 100, 4, poll_interval_s=0.01, executor=executor
+                ) as scheduler:
+                    pipeline = CheckpointPipeline(scheduler, sim_job, executor=executor)
+                    for ckpt_dir in ckpt_dirs:
+                        pipeline.checkpoint_ready(ckpt_dir, dump_ckpt_state, ckpt_dir, params, mtr)
+                    status = pipeline.wait()
+        assert all(status[c.name].state == JobState.Done for c in ckpt_dirs)
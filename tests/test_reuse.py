@@ -0,0 +1,81 @@
+import pytest
+import random
+
+from tidalsim.cache_model.reuse import *
+from tidalsim.util.spike_log import SpikeTraceEntry, SpikeCommitInfo, Op
+
+
+# Reference reuse distances from walking an LRU stack per set
+def naive_reuse_distances(block_addrs: List[int], n_sets: int) -> List[Optional[int]]:
+    stacks: Dict[int, List[int]] = {}
+    distances: List[Optional[int]] = []
+    for block_addr in block_addrs:
+        stack = stacks.setdefault(block_addr % n_sets, [])
+        if block_addr in stack:
+            distances.append(stack.index(block_addr))
+            stack.remove(block_addr)
+        else:
+            distances.append(None)
+        stack.insert(0, block_addr)
+    return distances
+
+
+class TestReuseDistance:
+    def test_fenwick_tree(self) -> None:
+        tree = FenwickTree(size=2)
+        values = [3, 0, 5, 1, 0, 2, 7]
+        for i, v in enumerate(values):
+            tree.add(i, v)
+        assert len(tree) == 8
+        for i in range(len(values) + 1):
+            assert tree.prefix_sum(i) == sum(values[:i])
+
+    @pytest.mark.parametrize("n_sets", [1, 4])
+    def test_tracker_matches_lru_stack(self, n_sets: int) -> None:
+        rng = random.Random(10)
+        block_addrs = [rng.randrange(40) for _ in range(3000)]
+        tracker = ReuseDistanceTracker(n_sets)
+        distances = [tracker.access(a) for a in block_addrs]
+        assert distances == naive_reuse_distances(block_addrs, n_sets)
+
+    def test_reuse_profile(self) -> None:
+        addrs = [0x0, 0x40, 0x0, 0x80, 0x40, 0x0, 0x8]
+        trace = [
+            SpikeTraceEntry(0x8000_0000, "ld", 2 * i, SpikeCommitInfo(addr, 0, Op.Load))
+            for i, addr in enumerate(addrs)
+        ]
+        # Interleave non-memory instructions, these still count towards the interval length
+        trace = sorted(
+            trace + [SpikeTraceEntry(0x8000_0004, "add", 2 * i + 1) for i in range(len(addrs))],
+            key=lambda x: x.inst_count,
+        )
+        fa, dm = reuse_profiles_from_spike_log(
+            iter(trace), block_size_bytes=64, interval_length=4, set_counts=[1, 2]
+        )
+        # Block addresses: 0, 1, 0, 2, 1, 0, 0 -> distances: cold, cold, 1, cold, 2, 2, 0
+        assert fa.cold_accesses == 3
+        assert fa.distance_counts.tolist() == [1, 1, 2]
+        assert fa.interval_histograms.shape == (4, N_LOG2_BUCKETS + 1)
+        assert fa.interval_histograms[:, N_LOG2_BUCKETS].tolist() == [2, 1, 0, 0]
+        assert fa.interval_histograms[:, 2].tolist() == [0, 0, 2, 0]
+        assert fa.miss_ratio_curve([1, 2, 3, 100]).tolist() == pytest.approx(
+            [6 / 7, 5 / 7, 3 / 7, 3 / 7]
+        )
+        # With 2 sets, blocks 0 and 2 share set 0: 0, 1, 0, 2, 1, 0, 0 -> cold, cold, 0, cold, 0, 1, 0
+        assert dm.distance_counts.tolist() == [3, 1]
+        assert dm.miss_ratio(1) == pytest.approx(4 / 7)
+
+    def test_append_reuse_features(self) -> None:
+        df = DataFrame[EmbeddingSchema]({
+            "instret": [2, 2],
+            "inst_count": [2, 4],
+            "inst_start": [0, 2],
+            "embedding": [np.array([1.0, 0.0]), np.array([0.0, 1.0])],
+        })
+        histograms = np.zeros((2, N_LOG2_BUCKETS + 1), dtype=np.int64)
+        histograms[0, N_LOG2_BUCKETS] = 2
+        profile = ReuseProfile(64, 1, 2, np.zeros(0, dtype=np.int64), 2, histograms)
+        augmented = append_reuse_features(df, profile)
+        assert augmented["embedding"][0].size == 2 + N_LOG2_BUCKETS + 1
+        assert np.linalg.norm(augmented["embedding"][0]) == pytest.approx(1.0)
+        assert augmented["embedding"][1][1] == pytest.approx(1.0)
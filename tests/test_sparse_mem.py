@@ -0,0 +1,88 @@
+import pytest
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import threading
+
+import numpy as np
+
+from tidalsim.util.sparse_mem import *
+
+
+class TestSparseMem:
+    def image(self, fill: int) -> np.ndarray:
+        image = np.zeros(8 * PAGE_SIZE_BYTES, dtype=np.uint8)
+        image[0] = 1  # page 0
+        image[PAGE_SIZE_BYTES + 5] = 2  # page 1
+        image[5 * PAGE_SIZE_BYTES : 6 * PAGE_SIZE_BYTES] = fill  # page 5
+        return image
+
+    def test_compact(self, tmp_path: Path) -> None:
+        store = PageStore(tmp_path / "pages")
+        ckpt_dir = tmp_path / "ckpt"
+        ckpt_dir.mkdir()
+        sparse = compact_dram_image(self.image(3), 0x8000_0000, store, ckpt_dir)
+        assert sorted(sparse.pages) == [0, PAGE_SIZE_BYTES, 5 * PAGE_SIZE_BYTES]
+        assert sparse.populated_ranges() == [
+            (0, 2 * PAGE_SIZE_BYTES),
+            (5 * PAGE_SIZE_BYTES, 6 * PAGE_SIZE_BYTES),
+        ]
+        sparse.dump(ckpt_dir / "mem.pages.json")
+        assert SparseMem.load(ckpt_dir / "mem.pages.json") == sparse
+        assert np.array_equal(
+            load_sparse_mem(ckpt_dir / "mem.pages.json").to_image(), self.image(3)
+        )
+
+    def test_sparse_image(self, tmp_path: Path) -> None:
+        dense = self.image(3)
+        sparse = compact_dram_image(dense, 0x8000_0000, PageStore(tmp_path / "pages"), tmp_path)
+        sparse.dump(tmp_path / "mem.pages.json")
+        image = load_sparse_mem(tmp_path / "mem.pages.json")
+        # Blocks in populated pages, in zero pages, straddling pages and past the end of the image
+        offsets = np.array(
+            [0, 64, PAGE_SIZE_BYTES, 3 * PAGE_SIZE_BYTES, 6 * PAGE_SIZE_BYTES - 32, dense.size - 16]
+        )
+        blocks = image.gather_blocks(offsets, 64)
+        for offset, block in zip(offsets.tolist(), blocks):
+            expected = np.zeros(64, dtype=np.uint8)
+            in_image = dense[offset : offset + 64]
+            expected[: in_image.size] = in_image
+            assert np.array_equal(block, expected)
+        assert read_image(image, PAGE_SIZE_BYTES + 4, 2).tolist() == [0, 2]
+        # Only the touched populated pages are read
+        assert sorted(image.loaded_pages) == [0, PAGE_SIZE_BYTES, 5 * PAGE_SIZE_BYTES]
+
+    def test_dedup(self, tmp_path: Path) -> None:
+        store = PageStore(tmp_path / "pages")
+        a = compact_dram_image(self.image(3), 0x8000_0000, store, tmp_path)
+        b = compact_dram_image(self.image(4), 0x8000_0000, store, tmp_path)
+        # Only page 5 differs between the images
+        assert a.pages[0] == b.pages[0]
+        assert a.pages[5 * PAGE_SIZE_BYTES] != b.pages[5 * PAGE_SIZE_BYTES]
+        assert len(list((tmp_path / "pages").glob("*/*"))) == 4
+
+    def test_concurrent_put(self, tmp_path: Path) -> None:
+        # Checkpoints are converted by threads sharing a pid, which race to store the same pages
+        store = PageStore(tmp_path / "pages")
+        n_threads = 8
+        pages = [bytes([i % 256, i // 256]) * (PAGE_SIZE_BYTES // 2) for i in range(200)]
+        barrier = threading.Barrier(n_threads)
+
+        def put_all() -> List[str]:
+            digests = []
+            for page in pages:
+                barrier.wait()
+                try:
+                    digests.append(store.put(page))
+                except Exception:
+                    # Don't leave the other threads waiting
+                    barrier.abort()
+                    raise
+            return digests
+
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            results = [pool.submit(put_all) for _ in range(n_threads)]
+            digests = [result.result() for result in results]
+        assert all(d == [page_digest(page) for page in pages] for d in digests)
+        assert all(store.get(page_digest(page)) == page for page in pages)
+        assert len(list((tmp_path / "pages").glob("*/*"))) == len(pages)
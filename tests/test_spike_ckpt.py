@@ -1,6 +1,12 @@
 import pytest
 
+import numpy as np
+
 from tidalsim.util.spike_ckpt import *
+from tidalsim.cache_model.mtr import MTREntry
+from tidalsim.util.sparse_mem import PageStore, compact_dram_image
+from tidalsim.util.elf import ElfSegment, read_elf_segments, write_elf
+from tidalsim.util.spike_log import SpikeCommitInfo, Op
 
 
 class TestSpikeCkpt:
@@ -53,3 +59,152 @@ class TestSpikeCkpt:
             Path.cwd() / "0x80000000.100",
             Path.cwd() / "0x80000000.2000",
         ]
+
+    def test_partition_inst_points(self) -> None:
+        # Free dumps: every shard costs its last inst point, so extra spike processes don't help
+        assert partition_inst_points([100, 200, 300], 2, dump_cost=0) == [[100, 200, 300]]
+        assert partition_inst_points([100, 200, 300], 2, dump_cost=10) == [[100, 200], [300]]
+        # Expensive dumps: spread the dumps evenly
+        assert partition_inst_points([1, 2, 3, 4], 2, dump_cost=1000) == [[1, 2], [3, 4]]
+        # Extra shards that don't reduce the wall time aren't used
+        assert partition_inst_points([10, 20], 8, dump_cost=1) == [[10], [20]]
+        assert partition_inst_points([1, 2, 1000], 3, dump_cost=10) == [[1, 2], [1000]]
+        assert partition_inst_points([0, 1000], 2, dump_cost=1) == [[0], [1000]]
+        assert partition_inst_points([5], 1) == [[5]]
+        # Shards always cover every inst point in order
+        inst_points = [0, 3, 7, 100, 101, 5000, 5001, 9000]
+        for n_shards in range(1, 10):
+            shards = partition_inst_points(inst_points, n_shards, dump_cost=50)
+            assert len(shards) <= n_shards
+            assert [i for shard in shards for i in shard] == inst_points
+
+    def test_dump_dcache_ckpt(self, tmp_path: Path) -> None:
+        with (tmp_path / "mem.0x80000000.bin").open("wb") as f:
+            f.write(bytes(range(256)) * 64)
+        mtr = MTR(64, {(0x8000_0000 >> 6) + i: MTREntry(i, None) for i in range(16)})
+        params = [CacheParams(32, 64, 4, 2), CacheParams(32, 64, 8, 1)]
+        dump_dcache_ckpt(mtr, tmp_path, params, n_jobs=1)
+        assert (tmp_path / "dcache_tag_array0.bin").exists()
+        assert (tmp_path / "dcache_tag_array1.bin").exists()
+        assert (tmp_path / "dcache.4x2" / "dcache_tag_array1.bin").exists()
+        assert (tmp_path / "dcache.8x1" / "dcache_data_array7.bin").exists()
+        assert not (tmp_path / "dcache.8x1" / "dcache_tag_array1.bin").exists()
+
+    def test_dump_dcache_ckpt_sparse(self, tmp_path: Path) -> None:
+        # The DRAM dump was compacted, so the block data comes from the page store
+        ckpt_dir = tmp_path / "0x80000000.0"
+        ckpt_dir.mkdir()
+        dram = np.zeros(2 * 4096, dtype=np.uint8)
+        dram[4096 + 64] = 0xAB
+        compact_dram_image(dram, 0x8000_0000, PageStore(tmp_path / "pages"), ckpt_dir).dump(
+            ckpt_dir / DRAM_MANIFEST
+        )
+        assert ckpt_dram_file(ckpt_dir) == ckpt_dir / DRAM_MANIFEST
+        mtr = MTR(64, {(0x8000_1000 >> 6) + 1: MTREntry(1, None)})
+        dump_dcache_ckpt(mtr, ckpt_dir, [CacheParams(32, 64, 4, 1)], n_jobs=1)
+        with (ckpt_dir / "dcache_data_array0.bin").open("r") as f:
+            rows = [line.rstrip() for line in f]
+        assert int(rows[8], 2) == 0xAB
+
+    def test_dump_dcache_ckpts(self, tmp_path: Path) -> None:
+        ckpt_dirs = [tmp_path / "0x80000000.0", tmp_path / "0x80000000.100"]
+        mtrs = []
+        for i, ckpt_dir in enumerate(ckpt_dirs):
+            ckpt_dir.mkdir()
+            (ckpt_dir / "mem.0x80000000.bin").write_bytes(bytes([i + 1]) * 4096)
+            mtrs.append(MTR(64, {(0x8000_0000 >> 6) + i: MTREntry(1, None)}))
+        dump_dcache_ckpts(mtrs, ckpt_dirs, [CacheParams(32, 64, 4, 1)], n_jobs=2)
+        for i, ckpt_dir in enumerate(ckpt_dirs):
+            with (ckpt_dir / f"dcache_data_array0.bin").open("r") as f:
+                rows = [line.rstrip() for line in f]
+            # Set i holds the block, and the 8 rows of the block start at row 8 * i
+            assert int(rows[8 * i], 2) == i + 1
+
+    def test_dump_icache_ckpt(self, tmp_path: Path) -> None:
+        (tmp_path / "mem.0x80000000.bin").write_bytes(bytes(range(256)) * 4)
+        imtr = MTR(64, {(0x8000_0000 >> 6): MTREntry(0, None)})
+        dump_dcache_ckpt(imtr, tmp_path, [CacheParams(32, 64, 4, 1)], n_jobs=1, cache_name="icache")
+        assert (tmp_path / "icache_tag_array0.bin").exists()
+        assert (tmp_path / "icache_data_array7.bin").exists()
+        assert not (tmp_path / "dcache_tag_array0.bin").exists()
+
+    def test_dump_cache_hierarchy_ckpt(self, tmp_path: Path) -> None:
+        (tmp_path / "mem.0x80000000.bin").write_bytes(bytes(range(256)) * 64)
+        mtr = MTR(64, {(0x8000_0000 >> 6) + i: MTREntry(i, None) for i in range(16)})
+        dump_cache_hierarchy_ckpt(
+            mtr, tmp_path, [CacheParams(32, 64, 4, 1)], CacheParams(32, 64, 8, 2)
+        )
+        assert (tmp_path / "dcache_tag_array0.bin").exists()
+        assert (tmp_path / "l2_tag_array1.bin").exists()
+        assert (tmp_path / "l2_data_array15.bin").exists()
+
+    def test_read_loadarch_reg(self, tmp_path: Path) -> None:
+        n_lines = reg_dump(0).expected_lines
+        lines = [":"] + [f"0x{i:016x}" for i in range(2 * n_lines)]
+        (tmp_path / "loadarch").write_text("\n".join(lines))
+        satp_idx = reg_dump(0).cmds.index("reg 0 satp")
+        assert read_loadarch_reg(tmp_path / "loadarch", "satp") == satp_idx
+        assert read_loadarch_reg(tmp_path / "loadarch", "satp", hart=1) == n_lines + satp_idx
+
+    def test_clone_checkpoints(self, tmp_path: Path) -> None:
+        binary = tmp_path / "test.elf"
+        write_elf(
+            binary, [ElfSegment(0x8000_0000, b"\x13" * 8)], {"tohost": 0x10, "fromhost": 0x20}
+        )
+        loadarch_dir = tmp_path / "loadarchs"
+        loadarch_dir.mkdir()
+        n_lines = reg_dump(0).expected_lines
+        (loadarch_dir / "100.loadarch").write_text(
+            "".join([":\n"] + [f"0x{i:016x}\n" for i in range(n_lines)])
+        )
+        mtr = MTR(64, track_data=True)
+        mtr.update(SpikeCommitInfo(address=0x8000_2000, data=0xAB, op=Op.Store, size=1), 50)
+        ckpt_base_dir = tmp_path / "ckpts"
+        ckpt_base_dir.mkdir()
+        ready: List[Path] = []
+        clone_checkpoints(
+            binary, loadarch_dir, [100], [mtr], ckpt_base_dir, n_jobs=1, on_checkpoint=ready.append
+        )
+        ckpt_dir = ckpt_base_dir / "0x80000000.100"
+        assert ready == [ckpt_dir]
+        assert (ckpt_dir / "loadarch").read_text() == (loadarch_dir / "100.loadarch").read_text()
+        # The binary's image and the store from the trace
+        assert read_elf_segments(ckpt_dir / "mem.elf") == [
+            ElfSegment(0x8000_0000, b"\x13" * 8 + bytes(4096 - 8)),
+            ElfSegment(0x8000_2000, b"\xab" + bytes(4095)),
+        ]
+        with pytest.raises(RuntimeError):
+            clone_checkpoints(binary, loadarch_dir, [200], [mtr], ckpt_base_dir, n_jobs=1)
+
+    def test_clone_checkpoints_refused(self, tmp_path: Path) -> None:
+        binary = tmp_path / "test.elf"
+        tohost = 0x8000_1000
+        write_elf(
+            binary,
+            [ElfSegment(0x8000_0000, b"\x13" * 8)],
+            {"tohost": tohost, "fromhost": tohost + 8},
+        )
+        loadarch_dir = tmp_path / "loadarchs"
+        loadarch_dir.mkdir()
+        n_lines = reg_dump(0).expected_lines
+        for inst_point in [100, 200, 300]:
+            (loadarch_dir / f"{inst_point}.loadarch").write_text(
+                "".join([":\n"] + [f"0x{i:016x}\n" for i in range(n_lines)])
+            )
+        tracked = MTR(64, track_data=True)
+        tracked.update(SpikeCommitInfo(address=0x8000_2000, data=0xAB, op=Op.Store, size=1), 50)
+        # A load whose size (and so data) isn't known
+        unsized = tracked.merge(MTR(64, track_data=True))
+        unsized.update(SpikeCommitInfo(address=0x8000_3000, data=0, op=Op.Load), 150)
+        # A write to tohost, the host may have written memory behind the trace's back
+        host = tracked.merge(MTR(64, track_data=True))
+        host.update(SpikeCommitInfo(address=tohost, data=1, op=Op.Store, size=8), 250)
+        ckpt_base_dir = tmp_path / "ckpts"
+        ckpt_base_dir.mkdir()
+        refused = clone_checkpoints(
+            binary, loadarch_dir, [100, 200, 300], [tracked, unsized, host], ckpt_base_dir, n_jobs=1
+        )
+        assert refused == [200, 300]
+        assert (ckpt_base_dir / "0x80000000.100" / "mem.elf").exists()
+        assert not (ckpt_base_dir / "0x80000000.200").exists()
+        assert not (ckpt_base_dir / "0x80000000.300").exists()
@@ -14,7 +14,7 @@ core   0: 0x0000000080001a72 (0x00000613) li      a2, 0""".split("\n")
         assert result == [
             SpikeTraceEntry(0x8000_0104, "csrw", 0),
             SpikeTraceEntry(0x8000_0108, "jal", 1),
-            SpikeTraceEntry(0x8000_1A70, "c.addi", 2),
+            SpikeTraceEntry(0x8000_1A70, "c.addi", 2, inst_bytes=2),
             SpikeTraceEntry(0x8000_1A72, "li", 3),
         ]
 
@@ -29,8 +29,8 @@ core   0: 0x0000000080000000 (0x00004081) c.li    ra, 0
 core   0: 0x0000000080000002 (0x00004101) c.li    sp, 0""".split("\n")
         result = list(parse_spike_log(iter(lines), False))
         assert result == [
-            SpikeTraceEntry(0x8000_0000, "c.li", 0),
-            SpikeTraceEntry(0x8000_0002, "c.li", 1),
+            SpikeTraceEntry(0x8000_0000, "c.li", 0, inst_bytes=2),
+            SpikeTraceEntry(0x8000_0002, "c.li", 1, inst_bytes=2),
         ]
 
     def test_spike_log_stores(self) -> None:
@@ -44,12 +44,19 @@ core   0: 0x0000000080001a84 (0x00008412) c.mv    s0, tp
 core   0: 3 0x0000000080001a84 (0x8412) x8  0x0000000080023000""".split("\n")
         result = list(parse_spike_log(iter(lines), True))
         assert result == [
-            SpikeTraceEntry(0x8000_1A7E, "c.mv", 0, None),
-            SpikeTraceEntry(0x8000_1A80, "c.sdsp", 1, SpikeCommitInfo(0x8002_AFF0, 0x0, Op.Store)),
+            SpikeTraceEntry(0x8000_1A7E, "c.mv", 0, None, 2, priv=3),
             SpikeTraceEntry(
-                0x8000_1A82, "c.sdsp", 2, SpikeCommitInfo(0x8002_AFF8, 0x8000_010C, Op.Store)
+                0x8000_1A80, "c.sdsp", 1, SpikeCommitInfo(0x8002_AFF0, 0x0, Op.Store, 8), 2, priv=3
             ),
-            SpikeTraceEntry(0x8000_1A84, "c.mv", 3, None),
+            SpikeTraceEntry(
+                0x8000_1A82,
+                "c.sdsp",
+                2,
+                SpikeCommitInfo(0x8002_AFF8, 0x8000_010C, Op.Store, 8),
+                2,
+                priv=3,
+            ),
+            SpikeTraceEntry(0x8000_1A84, "c.mv", 3, None, 2, priv=3),
         ]
 
     def test_spike_log_loads(self) -> None:
@@ -60,9 +67,27 @@ core   0: 3 0x0000000080000442 (0x589c) x15 0x0000000000000001 mem 0x00000000800
         result = list(parse_spike_log(iter(lines), True))
         assert result == [
             SpikeTraceEntry(
-                0x8000_043E, "ld", 0, SpikeCommitInfo(0x8000_2020, 0x8000_1F50, Op.Load)
+                0x8000_043E, "ld", 0, SpikeCommitInfo(0x8000_2020, 0x8000_1F50, Op.Load, 8), priv=3
             ),
-            SpikeTraceEntry(0x8000_0442, "c.lw", 1, SpikeCommitInfo(0x8000_1F80, 0x1, Op.Load)),
+            SpikeTraceEntry(
+                0x8000_0442, "c.lw", 1, SpikeCommitInfo(0x8000_1F80, 0x1, Op.Load, 4), 2, priv=3
+            ),
+        ]
+
+    def test_spike_log_access_sizes(self) -> None:
+        lines = """core   0: 0x0000000080001000 (0x00b50023) sb      a1, 0(a0)
+core   0: 3 0x0000000080001000 (0x00b50023) mem 0x0000000080002001 0x7f
+core   0: 0x0000000080001004 (0x00b51123) sh      a1, 2(a0)
+core   0: 3 0x0000000080001004 (0x00b51123) mem 0x0000000080002002 0xbeef
+core   0: 0x0000000080001008 (0x00054583) lbu     a1, 0(a0)
+core   0: 3 0x0000000080001008 (0x00054583) x11 0x00000000000000ff mem 0x0000000080002000""".split(
+            "\n"
+        )
+        result = list(parse_spike_log(iter(lines), True))
+        assert [entry.commit_info for entry in result] == [
+            SpikeCommitInfo(0x8000_2001, 0x7F, Op.Store, 1),
+            SpikeCommitInfo(0x8000_2002, 0xBEEF, Op.Store, 2),
+            SpikeCommitInfo(0x8000_2000, 0xFF, Op.Load, 1),
         ]
 
     def test_spike_log_etc(self) -> None:
@@ -77,9 +102,33 @@ core   0: 3 0x0000000080000050 (0x00301073) c1_fflags 0x0000000000000000 c2_frm
         )
         result = list(parse_spike_log(iter(lines), True))
         assert result == [
-            SpikeTraceEntry(0x8000_0048, "addi", 0),
-            SpikeTraceEntry(0x8000_004C, "csrw", 1),
-            SpikeTraceEntry(0x8000_0050, "csrw", 2),
+            SpikeTraceEntry(0x8000_0048, "addi", 0, priv=3),
+            SpikeTraceEntry(0x8000_004C, "csrw", 1, priv=3),
+            SpikeTraceEntry(0x8000_0050, "csrw", 2, priv=3),
+        ]
+
+    def test_spike_log_atomics(self) -> None:
+        # Successful store conditionals and AMOs are recorded as stores, failed store conditionals
+        # don't access memory
+        lines = """core   0: 0x0000000080000a2c (0x18f5272f) sc.w    a4, a5, (a0)
+core   0: 3 0x0000000080000a2c (0x18f5272f) x14 0x0000000000000000 mem 0x0000000080002000 0x00000001
+core   0: 0x0000000080000a30 (0x00f7272f) amoadd.w a4, a5, (a4)
+core   0: 3 0x0000000080000a30 (0x00f7272f) x14 0x0000000000000001 mem 0x0000000080002000 mem 0x0000000080002000 0x00000002
+core   0: 0x0000000080000a34 (0x18f5272f) sc.w    a4, a5, (a0)
+core   0: 3 0x0000000080000a34 (0x18f5272f) x14 0x0000000000000001""".split("\n")
+        result = list(parse_spike_log(iter(lines), True))
+        assert result == [
+            SpikeTraceEntry(
+                0x8000_0A2C, "sc.w", 0, SpikeCommitInfo(0x8000_2000, 1, Op.Store, size=4), priv=3
+            ),
+            SpikeTraceEntry(
+                0x8000_0A30,
+                "amoadd.w",
+                1,
+                SpikeCommitInfo(0x8000_2000, 2, Op.Store, size=4),
+                priv=3,
+            ),
+            SpikeTraceEntry(0x8000_0A34, "sc.w", 2, priv=3),
         ]
 
     def test_spike_log_disasm_labels(self) -> None:
@@ -97,6 +146,6 @@ core   0: 0x0000000080000002 (0x00004101) c.li    sp, 0
 core   0: 3 0x0000000080000002 (0x4101) x2  0x0000000000000000""".split("\n")
         result = list(parse_spike_log(iter(lines), True))
         assert result == [
-            SpikeTraceEntry(0x8000_0000, "c.li", 0),
-            SpikeTraceEntry(0x8000_0002, "c.li", 1),
+            SpikeTraceEntry(0x8000_0000, "c.li", 0, inst_bytes=2, priv=3),
+            SpikeTraceEntry(0x8000_0002, "c.li", 1, inst_bytes=2, priv=3),
         ]
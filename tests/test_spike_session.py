@@ -0,0 +1,96 @@
+import pytest
+import os
+import stat
+from pathlib import Path
+
+from tidalsim.util.elf import ElfSegment, write_elf, read_elf_segments
+from tidalsim.util.loadarch import Loadarch
+from tidalsim.util.spike_session import *
+from tidalsim.util.spike_log import parse_spike_log
+
+# Stands in for spike in debug mode: the pc is 0x80000000 + 4 * <instructions stepped>,
+# and DRAM holds the number of instructions stepped when it's dumped. When it isn't told to suppress
+# the exit, the program exits after 50 instructions.
+FAKE_SPIKE = """#!/usr/bin/env python3
+import sys
+cmd_file = [a for a in sys.argv if a.startswith("--debug-cmd=")][0].split("=", 1)[1]
+PROGRAM_LENGTH = 50
+steps = 0
+with open(cmd_file) as cmds:
+    for cmd in cmds:
+        cmd = cmd.split()
+        out = []
+        if cmd[0] in ["r", "rs"]:
+            for _ in range(int(cmd[1])):
+                if cmd[0] == "r":
+                    pc = hex(0x80000000 + 4 * steps)
+                    print(f"core   0: {pc} (0x00000013) nop", file=sys.stderr)
+                    print(f"core   0: 3 {pc} (0x00000013)", file=sys.stderr, flush=True)
+                steps += 1
+                if "+suppress-exit" not in sys.argv and steps == PROGRAM_LENGTH:
+                    sys.exit(0)
+            out = [":"]
+        elif cmd[0] == "dump":
+            with open(cmd[1] + "/mem.0x80000000.bin", "wb") as f:
+                f.write(bytes([steps % 256]) * 4096 + bytes(4096))
+        elif cmd[0] == "pc":
+            out = [hex(0x80000000 + 4 * steps)]
+        elif cmd[0] == "vreg":
+            out = ["VLEN=128 bits; ELEN=64 bits"]
+            out += [f"v{i:<3}: [1]: 0x0  [0]: 0x0" for i in range(32)]
+        elif cmd[0] == "quit":
+            sys.exit(0)
+        elif cmd[0] != "until":
+            out = ["0x0"]
+        for line in out:
+            print(line, file=sys.stderr, flush=True)
+"""
+
+
+class TestSpikeSession:
+    @pytest.fixture
+    def binary(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        spike = bin_dir / "spike"
+        spike.write_text(FAKE_SPIKE)
+        spike.chmod(spike.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+        binary = tmp_path / "test.elf"
+        write_elf(
+            binary, [ElfSegment(0x8000_0000, b"\x13" * 4)], {"tohost": 0x10, "fromhost": 0x20}
+        )
+        return binary
+
+    def test_checkpoints(self, tmp_path: Path, binary: Path) -> None:
+        ckpt_base_dir = tmp_path / "ckpts"
+        ckpt_base_dir.mkdir()
+        with SpikeSession(binary, tmp_path) as session:
+            loadarch = session.checkpoint(10, ckpt_base_dir / "a")
+            assert loadarch.harts[0].pc == 0x8000_0000 + 4 * 10
+            assert Loadarch.read(ckpt_base_dir / "a" / "loadarch") == loadarch
+            # Only the distance to the next checkpoint is stepped
+            session.take_checkpoints([25, 40], ckpt_base_dir)
+            with pytest.raises(RuntimeError):
+                session.checkpoint(30, ckpt_base_dir / "b")
+        for inst_point in [25, 40]:
+            ckpt_dir = ckpt_base_dir / f"0x80000000.{inst_point}"
+            loadarch = Loadarch.from_bytes((ckpt_dir / "loadarch.bin").read_bytes())
+            assert loadarch.harts[0].pc == 0x8000_0000 + 4 * inst_point
+            # Only the non-zero page of DRAM is kept
+            assert read_elf_segments(ckpt_dir / "mem.elf") == [
+                ElfSegment(0x8000_0000, bytes([inst_point]) * 4096)
+            ]
+            assert not (ckpt_dir / "mem.0x80000000.bin").exists()
+
+    def test_trace_with_periodic_loadarchs(self, tmp_path: Path, binary: Path) -> None:
+        trace_file = tmp_path / "spike.full_trace"
+        inst_points = trace_with_periodic_loadarchs(
+            binary, tmp_path, trace_file, tmp_path / "loadarchs", period=20
+        )
+        assert inst_points == [0, 20, 40]
+        with trace_file.open("r") as f:
+            trace = list(parse_spike_log(f, full_commit_log=True))
+        assert [inst.pc for inst in trace] == [0x8000_0000 + 4 * i for i in range(50)]
+        loadarch = Loadarch.read(tmp_path / "loadarchs" / "40.loadarch")
+        assert loadarch.harts[0].pc == 0x8000_0000 + 4 * 40
@@ -0,0 +1,100 @@
+import pytest
+import struct
+
+import numpy as np
+from pathlib import Path
+
+from tidalsim.cache_model.cache import ArrayFormat
+from tidalsim.cache_model.mtr import MTR, MTREntry
+from tidalsim.cache_model.tlb import *
+from tidalsim.util.spike_log import SpikeTraceEntry, SpikeCommitInfo, Op
+
+
+class TestTLB:
+    base = 0x8000_0000
+    # Sv39 page tables in a 16 KiB memory image:
+    # root at page 0, level 1 table at page 1, level 0 table at page 2
+    # VPN 0x0_0000_0 maps to a 4 KiB page at 0x8000_3000
+    # VPN 0x0_0040_0 (vaddr 0x4000_0000) maps to a 1 GiB gigapage at 0x8000_0000
+    image = np.zeros(4 * 4096, dtype=np.uint8)
+
+    @classmethod
+    def setup_class(cls) -> None:
+        def write_pte(addr: int, ppn: int, flags: int) -> None:
+            offset = addr - cls.base
+            cls.image[offset : offset + 8] = np.frombuffer(
+                struct.pack("<Q", (ppn << 10) | flags), dtype=np.uint8
+            )
+
+        page_ppn = lambda i: (cls.base >> 12) + i
+        write_pte(cls.base + 0 * 8, page_ppn(1), PTE_V)
+        write_pte(cls.base + 1 * 8, cls.base >> 12, PTE_V | PTE_R | PTE_X | 0xC0)
+        write_pte(cls.base + 4096, page_ppn(2), PTE_V)
+        write_pte(cls.base + 2 * 4096, page_ppn(3), PTE_V | PTE_R | 0x4 | 0xC0)
+
+    satp = (8 << 60) | (base >> 12)
+
+    def test_walk_page_table(self) -> None:
+        assert walk_page_table(0x0, self.satp, self.image) == TLBEntry(
+            0x0, (self.base >> 12) + 3, 0, 0xC7
+        )
+        # A gigapage passes the low VPN bits through
+        assert walk_page_table(0x4_0123, self.satp, self.image) == TLBEntry(
+            0x4_0123, (self.base >> 12) + 0x123, 2, 0xCB
+        )
+        # Unmapped page
+        assert walk_page_table(0x1, self.satp, self.image) is None
+        assert walk_page_table(0x8_0000, self.satp, self.image) is None
+
+    def test_reconstruct_tlb(self, tmp_path: Path) -> None:
+        mtr = MTR(
+            PAGE_SIZE_BYTES,
+            {0x0: MTREntry(1, None), 0x4_0000: MTREntry(5, None), 0x1: MTREntry(10, None)},
+        )
+        tlb = reconstruct_tlb(mtr, parse_tlb_geometry("1x2"), self.satp, self.image)
+        # The unmapped page is the MRU one, but it's left out
+        assert [e.vpn if e else None for e in (tlb.entries[0][0], tlb.entries[1][0])] == [
+            0x4_0000,
+            0x0,
+        ]
+        tlb.dump(tmp_path, "dtlb", ArrayFormat.Hex)
+        rows = (tmp_path / "dtlb_entries.hex").read_text().splitlines()
+        assert len(rows) == 2
+        packed = int(rows[1], 16)
+        assert packed & ((1 << 27) - 1) == 0x0  # vpn
+        assert (packed >> 27) & ((1 << 44) - 1) == (self.base >> 12) + 3  # ppn
+        assert packed >> (27 + 44 + 8) == 0b100  # valid, level 0
+
+    def test_reconstruct_tlb_flushed(self) -> None:
+        mtr = MTR(PAGE_SIZE_BYTES, {0x0: MTREntry(1, None), 0x4_0000: MTREntry(5, None)})
+        # Page 0 was last touched before the sfence.vma at instruction 3
+        tlb = reconstruct_tlb(mtr, parse_tlb_geometry("1x2"), self.satp, self.image, flush_time=3)
+        assert [e.vpn if e else None for e in (tlb.entries[0][0], tlb.entries[1][0])] == [
+            0x4_0000,
+            None,
+        ]
+        # Bare translation
+        tlb = reconstruct_tlb(mtr, parse_tlb_geometry("1x2"), 0, self.image)
+        assert tlb.entries == [[None], [None]]
+
+
+def test_tlb_mtr_translated_accesses() -> None:
+    log = [
+        # M-mode accesses are physical
+        SpikeTraceEntry(0x8000_0000, "sd", 0, SpikeCommitInfo(0x8000_2000, 0, Op.Store, 8), priv=3),
+        SpikeTraceEntry(0x1000, "ld", 1, SpikeCommitInfo(0x3000, 0, Op.Load, 8), priv=1),
+        SpikeTraceEntry(0x1004, "sfence.vma", 2, priv=1),
+        SpikeTraceEntry(0x5000, "ld", 3, SpikeCommitInfo(0x6000, 0, Op.Load, 8), priv=0),
+    ]
+    earlier, later = TLBMTR(), TLBMTR()
+    for inst in log[:2]:
+        earlier.update(inst)
+    for inst in log[2:]:
+        later.update(inst)
+    assert earlier.dtlb.table == {0x3: MTREntry(1, None)}
+    assert earlier.itlb.table == {0x1: MTREntry(1, None)}
+    assert earlier.flush_time is None
+    merged = earlier.merge(later)
+    assert merged.flush_time == 2
+    assert set(merged.dtlb.table.keys()) == {0x3, 0x6}
+    assert set(merged.itlb.table.keys()) == {0x1, 0x5}
@@ -1,6 +1,6 @@
 import pytest
 
-from tidalsim.util.random import inst_points_to_inst_steps
+from tidalsim.util.random import inst_points_to_inst_steps, place_checkpoints
 
 
 class TestUtilRandom:
@@ -9,3 +9,10 @@ class TestUtilRandom:
         assert inst_points_to_inst_steps([100]) == [100]
         with pytest.raises(Exception):
             _ = inst_points_to_inst_steps([100, 1000, 900]) == [100, 900, 1000]
+
+    def test_place_checkpoints(self) -> None:
+        assert place_checkpoints([1000, 5000], 0, 1000) == [1000, 5000]
+        assert place_checkpoints([1000, 5000], 300, 1000) == [700, 4700]
+        # Intervals near the start get a shorter warmup instead of sharing a checkpoint
+        assert place_checkpoints([0, 1000, 2000, 8000], 2000, 1000) == [0, 1000, 2000, 6000]
+        assert place_checkpoints([2000, 3000], 2000, 1000) == [0, 1000]
@@ -0,0 +1,116 @@
+import pytest
+import copy
+import itertools
+import numpy as np
+from pathlib import Path
+
+from tidalsim.cache_model.mtr import *
+from tidalsim.cache_model.tlb import TLBMTR, PAGE_SIZE_BYTES
+from tidalsim.cache_model.warmup import *
+from tidalsim.bp_model.bp import BPParams, BranchPredictor, BranchPredictorTracker
+from tidalsim.util.random import inst_points_to_inst_steps
+from tidalsim.util.spike_log import SpikeTraceEntry, SpikeCommitInfo, Op, parse_spike_log
+
+
+class TestWarmupCkpts:
+    block_size = 64
+    log = [
+        SpikeTraceEntry(0x8000_0000, "c.lw", 0, SpikeCommitInfo(0x100, 0, Op.Load, 4), 2),
+        SpikeTraceEntry(0x8000_0002, "addi", 1),
+        SpikeTraceEntry(0x8000_1040, "sw", 2, SpikeCommitInfo(0x2200, 0, Op.Store, 4)),
+        SpikeTraceEntry(0x8000_0000, "c.lw", 3, SpikeCommitInfo(0x100, 0, Op.Load, 4), 2),
+    ]
+
+    def test_l1_ckpts(self) -> None:
+        ckpts = warmup_ckpts_from_inst_points(iter(self.log), self.block_size, [2, 4], icache=True)
+        # The L1d MTRs match the ones built from the memory accesses alone
+        assert ckpts.dcache == mtr_ckpts_from_inst_points(iter(self.log), self.block_size, [2, 4])
+        base = 0x8000_0000 >> 6
+        assert ckpts.icache == [
+            MTR(self.block_size, {base: MTREntry(1, None)}),
+            MTR(self.block_size, {base: MTREntry(3, None), (0x8000_1040 >> 6): MTREntry(2, None)}),
+        ]
+        assert ckpts.tlb is None
+
+    def test_tlb_ckpts(self) -> None:
+        ckpts = warmup_ckpts_from_inst_points(iter(self.log), self.block_size, [2, 4], tlb=True)
+        assert ckpts.icache is None
+        assert ckpts.tlb is not None
+        page = 0x8000_0000 >> 12
+        assert ckpts.tlb[0] == TLBMTR(
+            dtlb=MTR(PAGE_SIZE_BYTES, {0: MTREntry(0, None)}),
+            itlb=MTR(PAGE_SIZE_BYTES, {page: MTREntry(1, None)}),
+        )
+        assert ckpts.tlb[1].dtlb == MTR(
+            PAGE_SIZE_BYTES, {0: MTREntry(3, None), 2: MTREntry(None, 2)}
+        )
+        assert ckpts.tlb[1].itlb.table == {page: MTREntry(3, None), page + 1: MTREntry(2, None)}
+        # The L2 TLB sees both streams
+        assert set(ckpts.tlb[1].l2tlb().table.keys()) == {0, 2, page, page + 1}
+
+    def test_ckpts_sharded(self, tmp_path: Path) -> None:
+        # A loop of a store, a load and a backwards branch, the last iteration falls through into a call
+        lines = []
+        for i in range(4):
+            for pc, inst, commit in [
+                (
+                    0x8000_0000,
+                    "(0x00b52023) sw      a1, 0(a0)",
+                    f"mem 0x{0x8000_2000 + 64 * i:016x} 0x1",
+                ),
+                (
+                    0x8000_0004,
+                    "(0x00052583) lw      a1, 0(a0)",
+                    f"x11 0x1 mem 0x{0x8000_3000 + 4096 * i:016x}",
+                ),
+                (0x8000_0008, "(0xfe000ce3) beqz    zero, pc - 8", ""),
+            ]:
+                lines.append(f"core   0: 0x{pc:016x} {inst}")
+                lines.append(f"core   0: 1 0x{pc:016x} {inst.split()[0]} {commit}")
+        lines[-2] = "core   0: 0x0000000080000008 (0x008000ef) jal     pc + 0x8"
+        lines.append("core   0: 0x0000000080000010 (0x00000013) nop")
+        lines.append("core   0: 1 0x0000000080000010 (0x00000013)")
+        trace_file = tmp_path / "spike.trace"
+        trace_file.write_text("\n".join(lines) + "\n")
+        for inst_points in [[3, 6, 13], [2, 9, 13], [13]]:
+            with trace_file.open("r") as f:
+                sequential = warmup_ckpts_from_inst_points(
+                    parse_spike_log(f, True),
+                    self.block_size,
+                    inst_points,
+                    icache=True,
+                    tlb=True,
+                    bp=BPParams(btb_entries=2, bht_entries=16),
+                )
+            sharded = warmup_ckpts_from_inst_points_sharded(
+                trace_file,
+                True,
+                self.block_size,
+                inst_points,
+                n_jobs=2,
+                icache=True,
+                tlb=True,
+                bp=BPParams(btb_entries=2, bht_entries=16),
+            )
+            assert sharded.dcache == sequential.dcache
+            assert sharded.icache == sequential.icache
+            assert sharded.tlb == sequential.tlb
+            # The predictor is updated like a tracker that sees every instruction
+            tracker = BranchPredictorTracker(
+                BranchPredictor(BPParams(btb_entries=2, bht_entries=16))
+            )
+            with trace_file.open("r") as f:
+                spike_log = parse_spike_log(f, True)
+                reference = []
+                for step in inst_points_to_inst_steps(inst_points):
+                    for inst in itertools.islice(spike_log, step):
+                        tracker.update(inst)
+                    tracker.flush()
+                    reference.append(copy.deepcopy(tracker.bp))
+            assert sequential.bp is not None and sharded.bp is not None
+            for reference_bp, sequential_bp, sharded_bp in zip(
+                reference, sequential.bp, sharded.bp
+            ):
+                for name, value in vars(reference_bp).items():
+                    assert np.array_equal(value, vars(sequential_bp)[name]), name
+                    assert np.array_equal(value, vars(sharded_bp)[name]), name
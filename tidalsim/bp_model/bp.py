@@ -0,0 +1,240 @@
+from typing import Dict, List
+from enum import IntEnum
+from dataclasses import dataclass, field
+from pathlib import Path
+from math import ceil
+
+import numpy as np
+
+from tidalsim.cache_model.cache import ArrayFormat, format_array_rows
+from tidalsim.util.spike_log import SpikeTraceEntry, branches, jumps, calls, returns
+from tidalsim.util.random import clog2
+
+# A functional model of a Rocket-style branch predictor (BTB + BHT + RAS), updated with the resolved
+# outcome of every control instruction in the trace. All the predictor state is held in fixed-size
+# arrays, so it can be dumped as-is for state injection. Updates are applied in batches (one per trace
+# segment) with NumPy, so the trace pass only has to collect the control instructions.
+# The BHT is indexed gshare-style by the PC xor'ed with the global history, like Rocket's BHT
+# (which hashes [history_bits] of an [history_length] long history into the index).
+
+
+class ControlKind(IntEnum):
+    Jump = 0
+    Branch = 1
+    Call = 2
+    Return = 3
+
+
+# Map of every predicted instruction -> its ControlKind (as a plain int)
+control_kinds: Dict[str, int] = {
+    **{inst: int(ControlKind.Jump) for inst in jumps},
+    **{inst: int(ControlKind.Branch) for inst in branches},
+    **{inst: int(ControlKind.Call) for inst in calls},
+    **{inst: int(ControlKind.Return) for inst in returns},
+}
+
+
+@dataclass
+class BPParams:
+    # Defaults from Rocket's BTBParams / BHTParams
+    btb_entries: int = 28
+    bht_entries: int = 512
+    bht_counter_bits: int = 2
+    history_length: int = 8
+    history_bits: int = 3
+    ras_entries: int = 6
+    vaddr_bits: int = 39
+    bht_index_bits: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.bht_index_bits = clog2(self.bht_entries)
+        assert self.history_bits <= self.bht_index_bits
+        assert self.history_bits <= self.history_length
+
+
+@dataclass
+class BranchPredictor:
+    params: BPParams = field(default_factory=BPParams)
+    # BTB, fully associative with LRU replacement
+    # The entries are kept ordered from least to most recently used, and the valid entries are a prefix
+    btb_valid: np.ndarray = field(init=False)
+    btb_pc: np.ndarray = field(init=False)
+    btb_target: np.ndarray = field(init=False)
+    # Saturating counters, predict taken if the MSB is set
+    bht_counters: np.ndarray = field(init=False)
+    history: int = 0
+    # Circular return address stack, [ras_top] is the index of the most recent entry
+    ras: List[int] = field(init=False)
+    ras_count: int = 0
+    ras_top: int = 0
+
+    def __post_init__(self) -> None:
+        p = self.params
+        self.btb_valid = np.zeros(p.btb_entries, dtype=bool)
+        self.btb_pc = np.zeros(p.btb_entries, dtype=np.int64)
+        self.btb_target = np.zeros(p.btb_entries, dtype=np.int64)
+        self.bht_counters = np.zeros(p.bht_entries, dtype=np.uint8)
+        self.ras = [0] * p.ras_entries
+
+    # BHT index of each branch at [pcs], where [histories] is the global history before each branch
+    def bht_index(self, pcs: np.ndarray, histories: np.ndarray) -> np.ndarray:
+        p = self.params
+        histories = histories & ((1 << p.history_bits) - 1)
+        return ((pcs >> 1) ^ (histories << (p.bht_index_bits - p.history_bits))) & (
+            p.bht_entries - 1
+        )
+
+    # Update the BTB with the taken control instructions at [pcs] (in program order) and their [targets]
+    def update_btb(self, pcs: np.ndarray, targets: np.ndarray) -> None:
+        n_valid = int(self.btb_valid.sum())
+        all_pcs = np.concatenate([self.btb_pc[:n_valid], pcs])
+        all_targets = np.concatenate([self.btb_target[:n_valid], targets])
+        # An LRU BTB holds the [btb_entries] most recently updated pcs, with their latest targets
+        _, last_from_end = np.unique(all_pcs[::-1], return_index=True)
+        resident = np.sort(all_pcs.size - 1 - last_from_end)[-self.params.btb_entries :]
+        n_valid = resident.size
+        self.btb_valid[:n_valid] = True
+        self.btb_pc[:n_valid] = all_pcs[resident]
+        self.btb_target[:n_valid] = all_targets[resident]
+
+    # Update the BHT and the global history with the outcomes [taken] of the branches at [pcs]
+    def update_bht(self, pcs: np.ndarray, taken: np.ndarray) -> None:
+        p = self.params
+        n = pcs.size
+        if n == 0:
+            return
+        # The history bits (oldest first) followed by the new outcomes
+        prior = [(self.history >> i) & 1 for i in reversed(range(p.history_length))]
+        bits = np.concatenate([np.array(prior, dtype=np.int64), taken.astype(np.int64)])
+        histories = np.zeros(n, dtype=np.int64)
+        for i in range(p.history_bits):
+            start = p.history_length - 1 - i
+            histories |= bits[start : start + n] << i
+        self.history = sum(
+            bit << i for i, bit in enumerate(bits[::-1][: p.history_length].tolist())
+        )
+
+        # Each update of a counter is a map of its states, so the new value of every counter is the
+        # composition of its maps, computed with a segmented (Hillis-Steele) scan over the updates
+        # grouped by counter
+        indices = self.bht_index(pcs, histories)
+        order = np.argsort(indices, kind="stable")
+        indices = indices[order]
+        n_states = 1 << p.bht_counter_bits
+        steps = np.where(taken[order], 1, -1)
+        maps = np.clip(np.arange(n_states) + steps[:, None], 0, n_states - 1).astype(np.uint8)
+        offset = 1
+        while offset < n:
+            rows = np.flatnonzero(indices[offset:] == indices[:-offset]) + offset
+            if rows.size == 0:
+                break
+            maps[rows] = np.take_along_axis(maps[rows], maps[rows - offset], axis=1)
+            offset *= 2
+        last = np.flatnonzero(np.append(indices[1:] != indices[:-1], True))
+        counters = indices[last]
+        self.bht_counters[counters] = maps[last, self.bht_counters[counters]]
+
+    def push_ras(self, return_addr: int) -> None:
+        self.ras_top = (self.ras_top + 1) % self.params.ras_entries
+        self.ras[self.ras_top] = return_addr
+        self.ras_count = min(self.ras_count + 1, self.params.ras_entries)
+
+    def pop_ras(self) -> None:
+        if self.ras_count > 0:
+            self.ras_top = (self.ras_top - 1) % self.params.ras_entries
+            self.ras_count -= 1
+
+    # Update the predictor with control instructions (in program order) at [pcs], of size [inst_bytes]
+    # and of kind [kinds] (ControlKind), each of which was followed by the instruction at [next_pcs]
+    def update(
+        self, pcs: List[int], inst_bytes: List[int], kinds: List[int], next_pcs: List[int]
+    ) -> None:
+        n = len(next_pcs)
+        if n == 0:
+            return
+        pcs_array = np.array(pcs[:n], dtype=np.int64)
+        fallthroughs = pcs_array + np.array(inst_bytes[:n], dtype=np.int64)
+        kinds_array = np.array(kinds[:n], dtype=np.int8)
+        targets = np.array(next_pcs, dtype=np.int64)
+        taken = targets != fallthroughs
+        is_branch = kinds_array == ControlKind.Branch
+        self.update_bht(pcs_array[is_branch], taken[is_branch])
+        self.update_btb(pcs_array[taken], targets[taken])
+        # Calls and returns are rare, the RAS is updated one at a time
+        ras_ops = np.flatnonzero(kinds_array >= ControlKind.Call)
+        for kind, return_addr in zip(kinds_array[ras_ops].tolist(), fallthroughs[ras_ops].tolist()):
+            if kind == ControlKind.Call:
+                self.push_ras(return_addr)
+            else:
+                self.pop_ras()
+
+    # Rows of the BTB array: [valid | pc | target]
+    def btb_rows(self) -> np.ndarray:
+        vaddr_bits = self.params.vaddr_bits
+        vaddr_mask = (1 << vaddr_bits) - 1
+        n_bytes = ceil((1 + 2 * vaddr_bits) / 8)
+        rows = [
+            (
+                (((int(valid) << vaddr_bits) | (pc & vaddr_mask)) << vaddr_bits)
+                | (target & vaddr_mask)
+            ).to_bytes(n_bytes, byteorder="big")
+            for valid, pc, target in zip(
+                self.btb_valid.tolist(), self.btb_pc.tolist(), self.btb_target.tolist()
+            )
+        ]
+        return np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(-1, n_bytes)
+
+    # Dump the predictor arrays into [dir] as bp_{btb,bht,ras,history}.<fmt>
+    # The RAS is dumped from the top (most recent) entry down, with only [ras_count] valid entries
+    def dump(self, dir: Path, fmt: ArrayFormat = ArrayFormat.Bin) -> None:
+        p = self.params
+        ras_order = [(self.ras_top - i) % p.ras_entries for i in range(self.ras_count)]
+        ras = np.array([self.ras[i] for i in ras_order], dtype=">u8").view(np.uint8).reshape(-1, 8)
+        history = np.array([self.history], dtype=">u8").view(np.uint8).reshape(-1, 8)
+        arrays = {
+            "btb": (self.btb_rows(), 1 + 2 * p.vaddr_bits),
+            "bht": (
+                self.bht_counters.reshape(-1, 1),
+                p.bht_counter_bits,
+            ),
+            "ras": (ras, p.vaddr_bits),
+            "history": (history, p.history_length),
+        }
+        for name, (rows, width) in arrays.items():
+            with (dir / f"bp_{name}.{fmt.extension()}").open("wb") as f:
+                f.write(format_array_rows(rows, width, fmt))
+
+
+# Collects the control instructions of the trace for a [BranchPredictor], which is updated with them
+# on every [flush]. A control instruction's outcome is only known once the next instruction is seen,
+# so the last one is held until then. [update] is the reference for what the trace pass has to collect.
+# Only ints are collected, holding on to the trace entries makes the garbage collector much slower.
+@dataclass
+class BranchPredictorTracker:
+    bp: BranchPredictor = field(default_factory=BranchPredictor)
+    pcs: List[int] = field(default_factory=list)
+    inst_bytes: List[int] = field(default_factory=list)
+    kinds: List[int] = field(default_factory=list)
+    # The pc of the instruction following each control instruction, one shorter than [pcs] if the
+    # last one is pending
+    next_pcs: List[int] = field(default_factory=list)
+
+    def pending(self) -> bool:
+        return len(self.next_pcs) < len(self.pcs)
+
+    def update(self, inst: SpikeTraceEntry) -> None:
+        if self.pending():
+            self.next_pcs.append(inst.pc)
+        kind = control_kinds.get(inst.decoded_inst)
+        if kind is not None:
+            self.pcs.append(inst.pc)
+            self.inst_bytes.append(inst.inst_bytes)
+            self.kinds.append(kind)
+
+    # Apply every resolved control instruction to the predictor
+    def flush(self) -> None:
+        n = len(self.next_pcs)
+        self.bp.update(self.pcs, self.inst_bytes, self.kinds, self.next_pcs)
+        for collected in [self.pcs, self.inst_bytes, self.kinds]:
+            del collected[:n]
+        self.next_pcs.clear()
@@ -4,7 +4,7 @@ from pathlib import Path
 from math import ceil
 from enum import IntEnum, Enum
 
-from more_itertools import chunked
+import numpy as np
 
 from tidalsim.util.random import clog2
 
@@ -22,6 +22,37 @@ class Array(Enum):
     Data = 1
 
 
+# File formats for dumped cache arrays
+class ArrayFormat(Enum):
+    Bin = 0  # one binary string per row, read with $readmemb
+    Hex = 1  # one hex string per row, read with $readmemh
+    Raw = 2  # rows packed back to back as little-endian bytes
+
+    def extension(self) -> str:
+        return {ArrayFormat.Bin: "bin", ArrayFormat.Hex: "hex", ArrayFormat.Raw: "raw"}[self]
+
+
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+
+# Format every row of an array for dumping. [rows] is a (n_rows, n_bytes) array of bytes with the MSB byte
+# first and each row is [width_bits] wide. The text formats are newline separated without a trailing newline.
+def format_array_rows(rows: np.ndarray, width_bits: int, fmt: ArrayFormat) -> bytes:
+    n_rows, n_bytes = rows.shape
+    if fmt == ArrayFormat.Raw:
+        raw_bytes = ceil(width_bits / 8)
+        return np.ascontiguousarray(rows[:, n_bytes - raw_bytes :][:, ::-1]).tobytes()
+    if fmt == ArrayFormat.Bin:
+        bits = np.unpackbits(rows, axis=1)
+        chars = bits[:, bits.shape[1] - width_bits :] + ord("0")
+    else:
+        assert fmt == ArrayFormat.Hex
+        nibbles = np.stack([rows >> 4, rows & 0xF], axis=2).reshape(n_rows, -1)
+        chars = HEX_DIGITS[nibbles[:, nibbles.shape[1] - ceil(width_bits / 4) :]]
+    lines = np.hstack([chars.astype(np.uint8), np.full((n_rows, 1), ord("\n"), dtype=np.uint8)])
+    return lines.tobytes()[:-1]
+
+
 @dataclass
 class CacheBlock:
     data: int
@@ -58,37 +89,67 @@ class CacheParams:
         self.coherency_mask = (1 << self.coherency_bits) - 1
         self.data_rows_per_set = self.block_size_bytes // self.data_bus_bytes
 
+    # Short name for this cache geometry, e.g. '64x4' for 64 sets and 4 ways
+    def geometry_str(self) -> str:
+        return f"{self.n_sets}x{self.n_ways}"
 
-@dataclass
+
+# Parse a cache geometry given as '<n_sets>x<n_ways>' (e.g. '64x4') into CacheParams
+def parse_cache_geometry(
+    geometry: str, phys_addr_bits: int = 32, block_size_bytes: int = 64
+) -> CacheParams:
+    n_sets, n_ways = geometry.lower().split("x")
+    return CacheParams(phys_addr_bits, block_size_bytes, n_sets=int(n_sets), n_ways=int(n_ways))
+
+
+@dataclass(eq=False)
 class CacheState:
     params: CacheParams
-    # the cache array is first indexed by way, then by set
-    array: List[List[CacheBlock]] = field(init=False)
+    # the cache arrays are first indexed by way, then by set
+    tags: np.ndarray = field(init=False)  # (n_ways, n_sets) of uint64
+    coherency: np.ndarray = field(init=False)  # (n_ways, n_sets) of uint8 (CohStatus)
+    data: np.ndarray = field(init=False)  # (n_ways, n_sets, block_size_bytes) of uint8
 
     def __post_init__(self) -> None:
-        self.array = [
-            [CacheBlock(0, 0, CohStatus.Nothing) for _ in range(self.params.n_sets)]
-            for _ in range(self.params.n_ways)
-        ]
+        shape = (self.params.n_ways, self.params.n_sets)
+        self.tags = np.zeros(shape, dtype=np.uint64)
+        self.coherency = np.full(shape, CohStatus.Nothing, dtype=np.uint8)
+        self.data = np.zeros(shape + (self.params.block_size_bytes,), dtype=np.uint8)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CacheState):
+            return NotImplemented
+        return (
+            self.params == other.params
+            and np.array_equal(self.tags, other.tags)
+            and np.array_equal(self.coherency, other.coherency)
+            and np.array_equal(self.data, other.data)
+        )
+
+    # A single cache block, with its data as a little-endian integer
+    def block(self, way_idx: int, set_idx: int) -> CacheBlock:
+        return CacheBlock(
+            data=int.from_bytes(self.data[way_idx, set_idx].tobytes(), byteorder="little"),
+            tag=int(self.tags[way_idx, set_idx]),
+            coherency=CohStatus(int(self.coherency[way_idx, set_idx])),
+        )
 
     def fill_with_structured_data(self) -> None:
-        for way_idx, way in enumerate(self.array):
-            for set_idx in range(self.params.n_sets):
-                tag_bottom_bits = (way_idx * self.params.n_sets) + set_idx
-                # put a '1' in the top bit of the tag, just to make sure we can set it during injection
-                tag = (1 << (self.params.tag_bits - 1)) | tag_bottom_bits
-                # Fill data array with unique data in every byte position
-                data_bytes = [
-                    way_idx * self.params.block_size_bytes
-                    + set_idx * self.params.block_size_bytes
-                    + i
-                    + 1
-                    for i in range(self.params.block_size_bytes)
-                ]
-                data = 0
-                for i, byte in enumerate(data_bytes):
-                    data = data | ((byte & 0xFF) << (i * 8))
-                self.array[way_idx][set_idx] = CacheBlock(data, tag, CohStatus.Dirty)
+        ways = np.arange(self.params.n_ways, dtype=np.uint64)[:, np.newaxis]
+        sets = np.arange(self.params.n_sets, dtype=np.uint64)[np.newaxis, :]
+        tag_bottom_bits = (ways * self.params.n_sets) + sets
+        # put a '1' in the top bit of the tag, just to make sure we can set it during injection
+        self.tags[:, :] = np.uint64(1 << (self.params.tag_bits - 1)) | tag_bottom_bits
+        self.coherency[:, :] = CohStatus.Dirty
+        # Fill data array with unique data in every byte position
+        block_size = self.params.block_size_bytes
+        data_bytes = (
+            ways[:, :, np.newaxis].astype(np.int64) * block_size
+            + sets[:, :, np.newaxis].astype(np.int64) * block_size
+            + np.arange(block_size)[np.newaxis, np.newaxis, :]
+            + 1
+        )
+        self.data[:, :, :] = data_bytes & 0xFF
 
     def way_idx_iterator(self, reverse_ways: bool) -> Iterable[int]:
         return reversed(range(self.params.n_ways)) if reverse_ways else range(self.params.n_ways)
@@ -99,83 +160,72 @@ class CacheState:
     def array_pretty_str(self, array: Array, reverse_ways: bool = True) -> str:
         def inner() -> Iterator[str]:
             yield f"Ways: {self.ways_str(reverse_ways)}"
+            way_idxs = list(self.way_idx_iterator(reverse_ways))
             for set_idx in range(self.params.n_sets):
-                cache_blocks = [
-                    self.array[way_idx][set_idx] for way_idx in self.way_idx_iterator(reverse_ways)
-                ]
                 if array == Array.Tag:
                     # +2 tag_hex_chars to account for the leading '0x'
                     tag_blocks = [
-                        f"{block.tag:#0{self.params.tag_hex_chars + 2}x} {block.coherency.name}"
-                        for block in cache_blocks
+                        f"{int(self.tags[way_idx, set_idx]):#0{self.params.tag_hex_chars + 2}x}"
+                        f" {CohStatus(int(self.coherency[way_idx, set_idx])).name}"
+                        for way_idx in way_idxs
                     ]
                     tag_str = ", ".join(tag_blocks)
                     yield f"Set {set_idx:02d}: [{tag_str}]"
                 else:
                     assert array == Array.Data
-                    # +2 data_hex_chars to account for the leading '0x'
+                    # Data blocks are printed MSB first, so reverse the little-endian byte order
                     data_blocks = [
-                        f"{block.data:#0{self.params.data_hex_chars + 2}x}"
-                        for block in cache_blocks
+                        "0x" + self.data[way_idx, set_idx, ::-1].tobytes().hex()
+                        for way_idx in way_idxs
                     ]
                     data_str = "\n".join(data_blocks)
                     yield f"Set {set_idx:02d}: [\n{data_str}\n]"
 
         return "\n".join([x for x in inner()])
 
-    def tag_array_binary_str(self, way_idx: int) -> str:
-        def inner() -> Iterator[str]:
-            for set_idx in range(self.params.n_sets):
-                cache_block = self.array[way_idx][set_idx]
-                tag = cache_block.tag & self.params.tag_mask
-                coherency = int(cache_block.coherency) & self.params.coherency_mask
-                tag_array_data = (coherency << self.params.tag_bits) | tag
-                yield f"{{:0{self.params.tag_bits + self.params.coherency_bits}b}}".format(
-                    tag_array_data
-                )
+    # Tag array entries for [way_idx], each entry is the coherency bits on top of the tag bits
+    def tag_array_entries(self, way_idx: int) -> np.ndarray:
+        tags = self.tags[way_idx] & np.uint64(self.params.tag_mask)
+        coherency = self.coherency[way_idx].astype(np.uint64) & np.uint64(
+            self.params.coherency_mask
+        )
+        return (coherency << np.uint64(self.params.tag_bits)) | tags
 
-        return "\n".join([x for x in inner()])
+    def tag_array_binary_str(self, way_idx: int) -> str:
+        entries = self.tag_array_entries(way_idx)
+        rows = entries.astype(">u8").view(np.uint8).reshape(-1, 8)
+        width = self.params.tag_bits + self.params.coherency_bits
+        return format_array_rows(rows, width, ArrayFormat.Bin).decode("ascii")
 
-    def dump_tag_arrays(self, dir: Path, prefix: str) -> None:
+    def dump_tag_arrays(self, dir: Path, prefix: str, fmt: ArrayFormat = ArrayFormat.Bin) -> None:
+        width = self.params.tag_bits + self.params.coherency_bits
         for way_idx in range(self.params.n_ways):
-            tag_array_bin = self.tag_array_binary_str(way_idx)
-            with (dir / f"{prefix}{way_idx}.bin").open("w") as f:
-                f.write(tag_array_bin)
+            rows = self.tag_array_entries(way_idx).astype(">u8").view(np.uint8).reshape(-1, 8)
+            with (dir / f"{prefix}{way_idx}.{fmt.extension()}").open("wb") as f:
+                f.write(format_array_rows(rows, width, fmt))
         with (dir / f"{prefix}.pretty").open("w") as f:
             f.write(self.array_pretty_str(Array.Tag))
 
-    def data_array_binary_str(self, way_idx: int) -> str:
-        rows_per_set = self.params.block_size_bytes // self.params.data_bus_bytes
+    # The data array for a given way is [data_bus_bytes] wide and has enough rows to hold n_sets sets
+    # Returns the rows for [way_idx] as a (n_sets * data_rows_per_set, data_bus_bytes) array of bytes,
+    # LSB byte first
+    def data_array_rows(self, way_idx: int) -> np.ndarray:
+        return self.data[way_idx].reshape(-1, self.params.data_bus_bytes)
 
-        def inner() -> Iterator[str]:
-            for set_idx in range(self.params.n_sets):
-                cache_block = self.array[way_idx][set_idx]
-                # data is params.block_size_bytes wide
-                data = cache_block.data
-                # The data array for a given way is 8B wide and has enough entries to hold n_sets sets
-                # This means data must be split into 8B wide rows
-                for i in range(rows_per_set):
-                    row = data & ((1 << (self.params.data_bus_bytes * 8)) - 1)
-                    yield f"{{:0{self.params.data_bus_bytes*8}b}}".format(row)
-                    data = data >> (self.params.data_bus_bytes * 8)
-
-        return "\n".join([x for x in inner()])
+    def data_array_binary_str(self, way_idx: int) -> str:
+        # Each row is printed MSB byte first
+        rows = self.data_array_rows(way_idx)[:, ::-1]
+        width = self.params.data_bus_bytes * 8
+        return format_array_rows(rows, width, ArrayFormat.Bin).decode("ascii")
 
-    def dump_data_arrays(self, dir: Path, prefix: str) -> None:
+    def dump_data_arrays(self, dir: Path, prefix: str, fmt: ArrayFormat = ArrayFormat.Bin) -> None:
         for way_idx in range(self.params.n_ways):
-            bin_for_way = self.data_array_binary_str(way_idx).split("\n")
-            data_to_write: List[List[str]] = [[] for _ in range(self.params.data_bus_bytes)]
-            for line in bin_for_way:
-                # We must slice each line byte-wise since the L1d is made up of byte-wise RAMs
-                line_bytes_chunked = ["".join(x) for x in list(chunked(line, 8, strict=True))]
-                # Each line goes from MSB byte to LSB byte but the RAMs are from LSB byte to MSB byte
-                line_bytes = list(reversed(line_bytes_chunked))
-                for byte_idx in range(self.params.data_bus_bytes):
-                    data_to_write[byte_idx].append(line_bytes[byte_idx])
+            rows = self.data_array_rows(way_idx)
+            # The L1d data array is made up of byte-wide RAMs, so every byte lane gets its own file
             for byte_idx in range(self.params.data_bus_bytes):
-                with (dir / f"{prefix}{way_idx*self.params.data_bus_bytes + byte_idx}.bin").open(
-                    "w"
-                ) as f:
-                    f.write("\n".join(data_to_write[byte_idx]))
+                lane = rows[:, byte_idx : byte_idx + 1]
+                file_idx = way_idx * self.params.data_bus_bytes + byte_idx
+                with (dir / f"{prefix}{file_idx}.{fmt.extension()}").open("wb") as f:
+                    f.write(format_array_rows(lane, 8, fmt))
         with (dir / f"{prefix}.pretty").open("w") as f:
             f.write(self.array_pretty_str(Array.Data))
@@ -1,12 +1,26 @@
-from typing import Iterator, TypeAlias, Dict, Optional, List, Tuple, BinaryIO
+from typing import Iterator, TypeAlias, Dict, Optional, List, Tuple, BinaryIO, Union
 from dataclasses import dataclass, field
 import copy
+import io
 import itertools
+import mmap
+import os
 from pathlib import Path
 
+from joblib import Parallel, delayed
+import numpy as np
+
 from tidalsim.cache_model.cache import CacheParams, CacheState, CohStatus, Array
-from tidalsim.util.spike_log import SpikeTraceEntry, SpikeCommitInfo, Op
+from tidalsim.util.spike_log import (
+    SpikeTraceEntry,
+    SpikeCommitInfo,
+    Op,
+    parse_spike_log,
+    spike_log_inst_offsets,
+)
 from tidalsim.util.random import clog2, inst_points_to_inst_steps
+from tidalsim.util.elf import elf_memory_image
+from tidalsim.util.sparse_mem import PAGE_SIZE_BYTES, MemoryImage, SparseImage, load_sparse_mem
 
 # This "Memory Timestamp Record" data structure tracks memory accesses and at a given point
 # can tell you which cache blocks will be resident for a particular cache configuration.
@@ -15,12 +29,63 @@ from tidalsim.util.random import clog2, inst_points_to_inst_steps
 CacheBlockAddr: TypeAlias = int
 
 
+# Memory-map a DRAM image (e.g. spike's mem.0x80000000.bin) read-only and return a zero-copy view of it
+# Only the pages that are actually indexed are read from disk
+def map_dram_image(dram_bin: Union[Path, BinaryIO]) -> np.ndarray:
+    if isinstance(dram_bin, Path):
+        with dram_bin.open("rb") as f:
+            return map_dram_image(f)
+    if os.fstat(dram_bin.fileno()).st_size == 0:
+        # Empty files can't be mapped
+        return np.zeros(0, dtype=np.uint8)
+    # The mapping stays alive as long as the array that views it
+    dram_map = mmap.mmap(dram_bin.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(dram_map, dtype=np.uint8)
+
+
+# Load the DRAM image in [dram_file], which is either a dense image (mapped with [map_dram_image])
+# or the manifest of a sparse image (see tidalsim.util.sparse_mem), which is read through its page map
+def load_dram_image(dram_file: Path) -> MemoryImage:
+    if dram_file.suffix == ".json":
+        return load_sparse_mem(dram_file)
+    return map_dram_image(dram_file)
+
+
+# Gather the [block_size_bytes] long blocks that start at each of [offsets] out of the memory
+# [image] with a single fancy-indexing operation. Bytes past the end of the image read as 0.
+def gather_blocks(image: MemoryImage, offsets: np.ndarray, block_size_bytes: int) -> np.ndarray:
+    assert np.all(offsets >= 0), "Cache blocks must lie within the memory image"
+    if isinstance(image, SparseImage):
+        return image.gather_blocks(offsets, block_size_bytes)
+    idxs = offsets[:, np.newaxis] + np.arange(block_size_bytes)
+    in_bounds = idxs < len(image)
+    blocks = np.zeros(idxs.shape, dtype=np.uint8)
+    blocks[in_bounds] = image[idxs[in_bounds]]
+    return blocks
+
+
 @dataclass
 class MTREntry:
-    last_readtime: Optional[int]  # will become a List[Optional[int]] in multicore MTR
+    last_readtime: Optional[int]  # per-hart in multicore MTR, see MulticoreMTREntry
     last_writetime: Optional[int]
     last_writer: Optional[int] = None  # only used in multicore MTR
 
+    # Combine this entry with [other], which was recorded over a later (or the same) segment of the trace
+    # The timestamps are absolute instruction counts, so the later timestamp always wins
+    def merge(self, other: "MTREntry") -> "MTREntry":
+        def later(a: Optional[int], b: Optional[int]) -> Optional[int]:
+            if a is None or b is None:
+                return b if a is None else a
+            return max(a, b)
+
+        last_writetime = later(self.last_writetime, other.last_writetime)
+        last_writer = (
+            other.last_writer
+            if other.last_writetime is not None and other.last_writetime == last_writetime
+            else self.last_writer
+        )
+        return MTREntry(later(self.last_readtime, other.last_readtime), last_writetime, last_writer)
+
     def get_last_touched_time(self) -> int:
         # Treat read and write access times identically for now
         last_writetime = self.last_writetime if self.last_writetime is not None else 0
@@ -37,6 +102,14 @@ class MTR:
     block_size_bytes: int
     table: Dict[CacheBlockAddr, MTREntry] = field(default_factory=lambda: {})
     byte_offset_bits: int = field(init=False)
+    # If [track_data] is set, the contents of every touched block are tracked using the store data and
+    # load data in the commit log. [block_valid] is a bitmask of the bytes in each block that were seen
+    # in the trace, the other bytes still hold whatever the binary initialized them to.
+    track_data: bool = False
+    block_data: Dict[CacheBlockAddr, bytearray] = field(default_factory=lambda: {})
+    block_valid: Dict[CacheBlockAddr, int] = field(default_factory=lambda: {})
+    # Number of accesses whose data couldn't be tracked (their size isn't known from the commit log)
+    untracked_accesses: int = 0
 
     def __post_init__(self) -> None:
         self.byte_offset_bits = clog2(self.block_size_bytes)
@@ -55,45 +128,272 @@ class MTR:
         else:
             self.table[block_addr].last_writetime = timestamp
 
-    # Reconstruct the state of a particular cache configuration given by [params] and load
-    # the cache with data from [dram_bin] which is a binary file containing DRAM contents and
-    # assume the base of DRAM is at [dram_base]
-    def as_cache(
-        self, params: CacheParams, dram_bin: Optional[BinaryIO] = None, dram_base: int = 0x8000_0000
-    ) -> CacheState:
+        if self.track_data:
+            if commit.size is None:
+                self.untracked_accesses += 1
+            else:
+                self.update_data(commit.address, commit.data, commit.size)
+
+    # Record an instruction fetch of [inst_bytes] at [pc] as a read of the block(s) holding it
+    # This is how an I-cache MTR is built: every committed instruction reads its fetch block
+    def update_fetch(self, pc: int, inst_bytes: int, timestamp: int) -> None:
+        first_block = self.get_block_addr(pc)
+        last_block = self.get_block_addr(pc + inst_bytes - 1)
+        for block_addr in range(first_block, last_block + 1):
+            entry = self.table.get(block_addr)
+            if entry is None:
+                self.table[block_addr] = MTREntry(timestamp, None)
+            else:
+                entry.last_readtime = timestamp
+
+    # Record the [size] bytes of [data] (little-endian) that were stored to / loaded from [address]
+    # Loads are recorded too, since they also capture memory written by something other than the harts
+    # (e.g. the host writing fromhost)
+    def update_data(self, address: int, data: int, size: int) -> None:
+        value = (data & ((1 << (size * 8)) - 1)).to_bytes(size, byteorder="little")
+        while size > 0:
+            # Misaligned accesses can straddle two blocks
+            block_addr = self.get_block_addr(address)
+            offset = address & (self.block_size_bytes - 1)
+            n_bytes = min(size, self.block_size_bytes - offset)
+            if block_addr not in self.block_data:
+                self.block_data[block_addr] = bytearray(self.block_size_bytes)
+                self.block_valid[block_addr] = 0
+            self.block_data[block_addr][offset : offset + n_bytes] = value[:n_bytes]
+            self.block_valid[block_addr] |= ((1 << n_bytes) - 1) << offset
+            address += n_bytes
+            value = value[n_bytes:]
+            size -= n_bytes
+
+    # Merge [other], an MTR built from a segment of the trace that comes after the one this MTR was
+    # built from, into a *new* MTR. Merging is associative, so MTRs built from adjacent trace
+    # segments can be combined in any grouping.
+    def merge(self, other: "MTR") -> "MTR":
+        assert self.block_size_bytes == other.block_size_bytes
+        table = {block_addr: copy.copy(entry) for block_addr, entry in self.table.items()}
+        for block_addr, entry in other.table.items():
+            table[block_addr] = (
+                table[block_addr].merge(entry) if block_addr in table else copy.copy(entry)
+            )
+        # Bytes seen in the later segment override the earlier ones
+        block_data = {block_addr: bytearray(data) for block_addr, data in self.block_data.items()}
+        block_valid = self.block_valid.copy()
+        for block_addr, data in other.block_data.items():
+            other_valid = other.block_valid[block_addr]
+            if block_addr not in block_data:
+                block_data[block_addr] = bytearray(data)
+                block_valid[block_addr] = other_valid
+                continue
+            merged = block_data[block_addr]
+            for i in range(self.block_size_bytes):
+                if (other_valid >> i) & 1:
+                    merged[i] = data[i]
+            block_valid[block_addr] |= other_valid
+        return MTR(
+            self.block_size_bytes,
+            table,
+            track_data=self.track_data or other.track_data,
+            block_data=block_data,
+            block_valid=block_valid,
+            untracked_accesses=self.untracked_accesses + other.untracked_accesses,
+        )
+
+    # Block addresses sorted from most recently touched to least recently touched
+    # This ordering doesn't depend on the cache geometry, so it can be shared when reconstructing
+    # many cache configurations from the same MTR
+    def recency_order(self) -> List[CacheBlockAddr]:
+        return [block_addr for block_addr, _ in sorted(self.table.items(), key=lambda x: x[1])]
+
+    # The blocks that are resident in an LRU cache with [params] given the [recency_order] of the blocks
+    # Returns the way indices, set indices, and block addresses of the resident blocks
+    def resident_blocks(
+        self, params: CacheParams, recency_order: List[CacheBlockAddr]
+    ) -> Tuple[List[int], List[int], List[CacheBlockAddr]]:
         def get_set_idx(block_addr: CacheBlockAddr) -> int:
             return block_addr & ((1 << params.set_bits) - 1)
 
-        def get_cache_block(byte_addr: int) -> int:
-            if dram_bin is None:
-                return 0
-            else:
-                dram_bin.seek(byte_addr - dram_base)
-                data = dram_bin.read(params.block_size_bytes)
-                return int.from_bytes(data, byteorder="little")
+        # Walk the blocks from most to least recently touched and fill each set's ways in that order,
+        # this leaves the [n_ways] most recently used blocks of every set resident (LRU)
+        ways_filled = [0] * params.n_sets
+        way_idxs: List[int] = []
+        set_idxs: List[int] = []
+        resident_block_addrs: List[CacheBlockAddr] = []
+        for block_addr in recency_order:
+            set_idx = get_set_idx(block_addr)
+            way_idx = ways_filled[set_idx]
+            if way_idx == params.n_ways:
+                continue
+            ways_filled[set_idx] += 1
+            way_idxs.append(way_idx)
+            set_idxs.append(set_idx)
+            resident_block_addrs.append(block_addr)
+        return way_idxs, set_idxs, resident_block_addrs
 
+    # Reconstruct the state of a particular cache configuration given by [params] and load
+    # the cache with data from [dram_bin] which is a binary file containing DRAM contents (or an
+    # already mapped image from [map_dram_image]) and assume the base of DRAM is at [dram_base]
+    # If no [dram_bin] is given and this MTR tracks data, the block contents come from the trace
+    # instead, on top of [initial_image] (memory contents at [dram_base] before the program ran,
+    # see [elf_memory_image])
+    # [recency_order] can be passed in if it was already computed with [self.recency_order()]
+    def as_cache(
+        self,
+        params: CacheParams,
+        dram_bin: Optional[Union[BinaryIO, MemoryImage]] = None,
+        dram_base: int = 0x8000_0000,
+        recency_order: Optional[List[CacheBlockAddr]] = None,
+        initial_image: Optional[np.ndarray] = None,
+    ) -> CacheState:
         assert params.block_size_bytes == self.block_size_bytes
         cache = CacheState(params)
-        # Group block addresses by set
-        block_addrs = sorted(self.table.keys(), key=get_set_idx)
-        sets = itertools.groupby(block_addrs, key=get_set_idx)
-        for set_idx, set_block_addrs in sets:
-            set_mtr_entries: List[Tuple[CacheBlockAddr, MTREntry]] = [
-                (a, self.table[a]) for a in set_block_addrs
-            ]
-            # Figure out which addrs should be resident in this cache using LRU
-            set_mtr_entries.sort(key=lambda x: x[1])
-            resident_block_addrs = [x[0] for x in set_mtr_entries[: params.n_ways]]
-            for way_idx, block_addr in enumerate(resident_block_addrs):
-                # Shift away the set bits and mask the tag bits
-                tag = (block_addr >> params.set_bits) & params.tag_mask
-                cache_block = cache.array[way_idx][set_idx]
-                cache_block.tag = tag
-                cache_block.coherency = CohStatus.Dirty
-                byte_address = block_addr << params.offset_bits
-                cache_block.data = get_cache_block(byte_address)
+        if recency_order is None:
+            recency_order = self.recency_order()
+        way_idxs, set_idxs, resident_block_addrs = self.resident_blocks(params, recency_order)
+
+        # Fill in all the resident blocks at once
+        ways = np.array(way_idxs, dtype=np.intp)
+        sets = np.array(set_idxs, dtype=np.intp)
+        block_addrs = np.array(resident_block_addrs, dtype=np.uint64)
+        # Shift away the set bits and mask the tag bits
+        cache.tags[ways, sets] = (block_addrs >> np.uint64(params.set_bits)) & np.uint64(
+            params.tag_mask
+        )
+        # A single core holds every block exclusively: written blocks are Dirty and clean blocks are Trunk
+        written = np.array(
+            [
+                self.table[block_addr].last_writetime is not None
+                for block_addr in resident_block_addrs
+            ],
+            dtype=bool,
+        )
+        cache.coherency[ways, sets] = np.where(written, CohStatus.Dirty, CohStatus.Trunk)
+        if len(resident_block_addrs) == 0:
+            return cache
+        offsets = (block_addrs.astype(np.int64) << params.offset_bits) - dram_base
+        if dram_bin is not None:
+            dram = (
+                dram_bin
+                if isinstance(dram_bin, (np.ndarray, SparseImage))
+                else map_dram_image(dram_bin)
+            )
+            cache.data[ways, sets] = gather_blocks(dram, offsets, params.block_size_bytes)
+        elif initial_image is not None or self.track_data:
+            if initial_image is not None:
+                cache.data[ways, sets] = gather_blocks(
+                    initial_image, offsets, params.block_size_bytes
+                )
+            # Overlay the bytes seen in the trace (if any)
+            for way_idx, set_idx, block_addr in zip(way_idxs, set_idxs, resident_block_addrs):
+                if block_addr not in self.block_data:
+                    continue
+                tracked, valid = self.tracked_block(block_addr)
+                np.copyto(cache.data[way_idx, set_idx], tracked, where=valid)
         return cache
 
+    # The bytes of [block_addr] seen in the trace, and a mask of which of them were seen
+    def tracked_block(self, block_addr: CacheBlockAddr) -> Tuple[np.ndarray, np.ndarray]:
+        valid_bytes = (self.block_size_bytes + 7) // 8
+        valid = np.unpackbits(
+            np.frombuffer(
+                self.block_valid[block_addr].to_bytes(valid_bytes, byteorder="little"),
+                dtype=np.uint8,
+            ),
+            bitorder="little",
+        )[: self.block_size_bytes].astype(bool)
+        return np.frombuffer(self.block_data[block_addr], dtype=np.uint8), valid
+
+    # The contents of DRAM ([dram_size] bytes starting at [dram_base]) at this MTR's point in the trace:
+    # the [initial_image] of the binary (based at [dram_base]) overlaid with every byte seen in the trace.
+    # Only the pages of [page_size] bytes that hold initialized or traced bytes are built, they're returned
+    # as a map of page offset (in bytes from [dram_base]) -> page contents.
+    # This requires an MTR that tracks data, and it doesn't see memory written by anything other than the
+    # committed instructions (e.g. the host servicing syscalls through HTIF) or accesses that weren't
+    # tracked (see [untracked_accesses]).
+    def memory_pages(
+        self,
+        initial_image: np.ndarray,
+        dram_base: int = 0x8000_0000,
+        dram_size: int = 0x1000_0000,
+        page_size: int = PAGE_SIZE_BYTES,
+    ) -> Dict[int, np.ndarray]:
+        assert self.track_data
+        assert page_size % self.block_size_bytes == 0 and dram_size % page_size == 0
+        pages: Dict[int, np.ndarray] = {}
+        initial_image = initial_image[:dram_size]
+        for page_offset in range(0, initial_image.size, page_size):
+            initial_page = initial_image[page_offset : page_offset + page_size]
+            if initial_page.any():
+                page = np.zeros(page_size, dtype=np.uint8)
+                page[: initial_page.size] = initial_page
+                pages[page_offset] = page
+        for block_addr in self.block_data:
+            offset = (block_addr << self.byte_offset_bits) - dram_base
+            if offset < 0 or offset + self.block_size_bytes > dram_size:
+                continue
+            page_offset = offset - offset % page_size
+            page = pages.get(page_offset)
+            if page is None:
+                page = pages[page_offset] = np.zeros(page_size, dtype=np.uint8)
+            tracked, valid = self.tracked_block(block_addr)
+            block_offset = offset - page_offset
+            np.copyto(
+                page[block_offset : block_offset + self.block_size_bytes], tracked, where=valid
+            )
+        return pages
+
+    # Reconstruct many cache configurations (which must share a block size) from this MTR
+    # The recency ordering is only computed once and shared by all configurations
+    def as_caches(
+        self,
+        params: List[CacheParams],
+        dram_bin: Optional[Union[BinaryIO, MemoryImage]] = None,
+        dram_base: int = 0x8000_0000,
+        initial_image: Optional[np.ndarray] = None,
+    ) -> List[CacheState]:
+        recency_order = self.recency_order()
+        if dram_bin is not None and not isinstance(dram_bin, (np.ndarray, SparseImage)):
+            dram_bin = map_dram_image(dram_bin)
+        return [self.as_cache(p, dram_bin, dram_base, recency_order, initial_image) for p in params]
+
+    # Reconstruct a two level hierarchy: the L1 caches [l1_params] (e.g. a sweep of L1d geometries)
+    # backed by the L2 [l2_params]. Every access in the trace is assumed to have touched both levels.
+    # If [inclusive], a block can only be in the L1 if it's also in the L2 (the L2 back-invalidates
+    # the L1 on eviction), so each L1 is filled from the recency order of the L2's resident blocks.
+    # Otherwise, the L1s and the L2 are reconstructed independently.
+    # The L2 coherency state follows the inclusive cache's directory: blocks held by any of the L1s
+    # are Trunk (the L1 owns them), other blocks are Dirty if they were written and Trunk otherwise
+    # (like [as_cache]).
+    # Returns (L1 cache states, L2 cache state)
+    def as_cache_hierarchy(
+        self,
+        l1_params: List[CacheParams],
+        l2_params: CacheParams,
+        dram_bin: Optional[Union[BinaryIO, MemoryImage]] = None,
+        dram_base: int = 0x8000_0000,
+        inclusive: bool = True,
+        initial_image: Optional[np.ndarray] = None,
+    ) -> Tuple[List[CacheState], CacheState]:
+        assert len(l1_params) > 0
+        recency_order = self.recency_order()
+        if dram_bin is not None and not isinstance(dram_bin, (np.ndarray, SparseImage)):
+            dram_bin = map_dram_image(dram_bin)
+        l2 = self.as_cache(l2_params, dram_bin, dram_base, recency_order, initial_image)
+        l2_ways, l2_sets, l2_block_addrs = self.resident_blocks(l2_params, recency_order)
+
+        l1_order = recency_order
+        if inclusive:
+            l2_resident = set(l2_block_addrs)
+            l1_order = [block_addr for block_addr in recency_order if block_addr in l2_resident]
+        l1s = [self.as_cache(p, dram_bin, dram_base, l1_order, initial_image) for p in l1_params]
+
+        l1_resident = set(
+            itertools.chain.from_iterable(self.resident_blocks(p, l1_order)[2] for p in l1_params)
+        )
+        for way_idx, set_idx, block_addr in zip(l2_ways, l2_sets, l2_block_addrs):
+            if block_addr in l1_resident:
+                l2.coherency[way_idx, set_idx] = CohStatus.Trunk
+        return l1s, l2
+
 
 # Given a spike log, an initial MTR state and the number of instructions to pull from
 # the spike log, return a *new* MTR state after consuming instructions from the log iterator
@@ -109,12 +409,113 @@ def mtr_ckpts_from_spike_log(
 
 
 def mtr_ckpts_from_inst_points(
-    spike_log: Iterator[SpikeTraceEntry], block_size: int, inst_points: List[int]
+    spike_log: Iterator[SpikeTraceEntry],
+    block_size: int,
+    inst_points: List[int],
+    track_data: bool = False,
 ) -> List[MTR]:
-    mtr = MTR(block_size)
+    mtr = MTR(block_size, track_data=track_data)
     mtr_ckpts: List[MTR] = [mtr]
     inst_steps = inst_points_to_inst_steps(inst_points)
     for step in inst_steps:
         new_mtr = mtr_ckpts_from_spike_log(spike_log, mtr_ckpts[-1], step)
         mtr_ckpts.append(new_mtr)
     return mtr_ckpts[1:]
+
+
+# Build a segment-local MTR from the memory accesses of a single trace segment
+def mtr_from_accesses(
+    block_size: int, accesses: List[Tuple[SpikeCommitInfo, int]], track_data: bool = False
+) -> MTR:
+    mtr = MTR(block_size, track_data=track_data)
+    for commit_info, timestamp in accesses:
+        mtr.update(commit_info, timestamp)
+    return mtr
+
+
+# Build a segment-local MTR from the [n_insts] instructions of the spike log [spike_log_file]
+# starting at instruction [first_inst], whose line is at byte [offset] of the log
+def _mtr_from_spike_log_range(
+    spike_log_file: Path,
+    full_commit_log: bool,
+    offset: int,
+    first_inst: int,
+    n_insts: int,
+    block_size: int,
+    track_data: bool,
+) -> MTR:
+    mtr = MTR(block_size, track_data=track_data)
+    with spike_log_file.open("rb") as f:
+        f.seek(offset)
+        spike_log = parse_spike_log(io.TextIOWrapper(f), full_commit_log, first_inst)
+        for inst in itertools.islice(spike_log, n_insts):
+            if inst.commit_info:
+                mtr.update(inst.commit_info, inst.inst_count)
+    return mtr
+
+
+# Same result as [mtr_ckpts_from_inst_points] on the parsed [spike_log_file], but the trace is
+# sharded at the [inst_points]: every one of the [n_jobs] worker processes seeks to the start of
+# its shards in the log, parses them and builds a segment-local MTR for each. Each checkpoint is
+# the prefix merge of the shards before it.
+def mtr_ckpts_from_inst_points_sharded(
+    spike_log_file: Path,
+    full_commit_log: bool,
+    block_size: int,
+    inst_points: List[int],
+    n_jobs: int = -1,
+    track_data: bool = False,
+) -> List[MTR]:
+    shard_starts = [0] + inst_points[:-1]
+    offsets = spike_log_inst_offsets(spike_log_file, full_commit_log, shard_starts)
+    shards: List[MTR] = Parallel(n_jobs=n_jobs)(
+        delayed(_mtr_from_spike_log_range)(
+            spike_log_file, full_commit_log, offset, start, step, block_size, track_data
+        )
+        for offset, start, step in zip(
+            offsets, shard_starts, inst_points_to_inst_steps(inst_points)
+        )
+    )  # type: ignore
+    return list(itertools.accumulate(shards, MTR.merge))
+
+
+def _reconstruct_cache(
+    mtr: MTR,
+    params: CacheParams,
+    dram_bin_file: Optional[Path],
+    dram_base: int,
+    recency_order: List[CacheBlockAddr],
+    elf_file: Optional[Path],
+) -> CacheState:
+    # Every worker maps the DRAM image itself
+    dram = None if dram_bin_file is None else load_dram_image(dram_bin_file)
+    initial_image = None if elf_file is None else elf_memory_image(elf_file, dram_base)
+    return mtr.as_cache(params, dram, dram_base, recency_order, initial_image)
+
+
+# Reconstruct every cache configuration in [params] from a single [mtr], loading cache block data
+# from [dram_bin_file] if given. Otherwise, if [mtr] tracks data, the block data comes from the trace
+# on top of the initial memory image of the binary [elf_file].
+# The configurations must share a block size.
+# The recency ordering is computed once and the configurations are reconstructed in parallel
+# in [n_jobs] worker processes.
+def reconstruct_caches(
+    mtr: MTR,
+    params: List[CacheParams],
+    dram_bin_file: Optional[Path] = None,
+    dram_base: int = 0x8000_0000,
+    n_jobs: int = -1,
+    elf_file: Optional[Path] = None,
+) -> List[CacheState]:
+    assert all(p.block_size_bytes == mtr.block_size_bytes for p in params)
+    recency_order = mtr.recency_order()
+    if n_jobs == 1 or len(params) == 1:
+        return [
+            _reconstruct_cache(mtr, p, dram_bin_file, dram_base, recency_order, elf_file)
+            for p in params
+        ]
+    caches: List[CacheState] = Parallel(n_jobs=n_jobs)(
+        delayed(_reconstruct_cache)(mtr, p, dram_bin_file, dram_base, recency_order, elf_file)
+        for p in params
+    )  # type: ignore
+    return caches
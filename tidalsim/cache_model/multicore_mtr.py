@@ -0,0 +1,155 @@
+from typing import Dict, Iterator, List, Optional, Set
+from dataclasses import dataclass, field
+from pathlib import Path
+import copy
+import itertools
+
+from joblib import Parallel, delayed
+
+from tidalsim.cache_model.cache import CacheParams, CacheState, CohStatus
+from tidalsim.cache_model.mtr import MTR, MTREntry, CacheBlockAddr, load_dram_image
+from tidalsim.util.spike_log import SpikeTraceEntry, SpikeCommitInfo, Op
+from tidalsim.util.random import clog2, inst_points_to_inst_steps
+
+# A multicore MTR tracks the last read time of every block per hart, and the last write to the
+# block (and which hart did it). Each hart has a private L1 and the harts are kept coherent
+# with a write-invalidate protocol, so after a write by hart w at time t:
+#   - w holds the block, and no other hart does until it reads the block after t
+#   - a hart that read the block before t had its copy invalidated
+# This is enough to reconstruct each hart's L1 and the coherency state of its blocks:
+#   - a block held by a single hart is Dirty if that hart was the last writer, otherwise Trunk
+#   - a block held by more than one hart is Branch in all of them (the writer was probed to Branch)
+
+
+@dataclass
+class MulticoreMTREntry:
+    # Map of hart -> last time that hart read the block
+    last_readtimes: Dict[int, int] = field(default_factory=lambda: {})
+    last_writetime: Optional[int] = None
+    last_writer: Optional[int] = None
+
+    # Combine this entry with [other], which was recorded over a later segment of the trace
+    def merge(self, other: "MulticoreMTREntry") -> "MulticoreMTREntry":
+        last_readtimes = self.last_readtimes.copy()
+        for hart, readtime in other.last_readtimes.items():
+            last_readtimes[hart] = max(readtime, last_readtimes.get(hart, readtime))
+        if other.last_writetime is not None and (
+            self.last_writetime is None or other.last_writetime >= self.last_writetime
+        ):
+            return MulticoreMTREntry(last_readtimes, other.last_writetime, other.last_writer)
+        return MulticoreMTREntry(last_readtimes, self.last_writetime, self.last_writer)
+
+    # The entry as seen by [hart]'s private cache, or None if [hart] doesn't hold the block
+    def hart_entry(self, hart: int) -> Optional[MTREntry]:
+        readtime = self.last_readtimes.get(hart)
+        if self.last_writer == hart:
+            return MTREntry(readtime, self.last_writetime, self.last_writer)
+        if readtime is not None and (self.last_writetime is None or readtime > self.last_writetime):
+            # A read after the last write (by another hart), the block is clean in this hart
+            return MTREntry(readtime, None)
+        return None
+
+
+@dataclass
+class MulticoreMTR:
+    block_size_bytes: int
+    n_harts: int
+    table: Dict[CacheBlockAddr, MulticoreMTREntry] = field(default_factory=lambda: {})
+    byte_offset_bits: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.byte_offset_bits = clog2(self.block_size_bytes)
+
+    def update(self, commit: SpikeCommitInfo, timestamp: int, hart: int) -> None:
+        assert hart < self.n_harts
+        block_addr = commit.address >> self.byte_offset_bits
+        entry = self.table.setdefault(block_addr, MulticoreMTREntry())
+        if commit.op is Op.Load:
+            entry.last_readtimes[hart] = timestamp
+        else:
+            entry.last_writetime = timestamp
+            entry.last_writer = hart
+
+    # Merge [other], built from a later segment of the trace, into a *new* MulticoreMTR
+    def merge(self, other: "MulticoreMTR") -> "MulticoreMTR":
+        assert self.block_size_bytes == other.block_size_bytes and self.n_harts == other.n_harts
+        table = {block_addr: copy.deepcopy(entry) for block_addr, entry in self.table.items()}
+        for block_addr, entry in other.table.items():
+            table[block_addr] = (
+                table[block_addr].merge(entry) if block_addr in table else copy.deepcopy(entry)
+            )
+        return MulticoreMTR(self.block_size_bytes, self.n_harts, table)
+
+    # A single-core MTR holding only the blocks [hart]'s private cache can hold
+    def hart_view(self, hart: int) -> MTR:
+        table = {}
+        for block_addr, entry in self.table.items():
+            hart_entry = entry.hart_entry(hart)
+            if hart_entry is not None:
+                table[block_addr] = hart_entry
+        return MTR(self.block_size_bytes, table)
+
+    # Reconstruct every hart's private cache with [params], in [n_jobs] worker processes
+    # The block data comes from [dram_bin_file] (if given) which is based at [dram_base]
+    # Returns one cache state per hart
+    def as_caches(
+        self,
+        params: CacheParams,
+        dram_bin_file: Optional[Path] = None,
+        dram_base: int = 0x8000_0000,
+        n_jobs: int = -1,
+    ) -> List[CacheState]:
+        views = [self.hart_view(hart) for hart in range(self.n_harts)]
+        recency_orders = [view.recency_order() for view in views]
+        # Which harts actually hold each block after LRU replacement in their own cache
+        residents: List[Set[CacheBlockAddr]] = [
+            set(view.resident_blocks(params, order)[2])
+            for view, order in zip(views, recency_orders)
+        ]
+        holders: Dict[CacheBlockAddr, int] = {}
+        for resident in residents:
+            for block_addr in resident:
+                holders[block_addr] = holders.get(block_addr, 0) + 1
+        shared = [
+            [block_addr for block_addr in resident if holders[block_addr] > 1]
+            for resident in residents
+        ]
+        caches: List[CacheState] = Parallel(n_jobs=n_jobs)(
+            delayed(_reconstruct_hart_cache)(
+                view, params, order, shared_blocks, dram_bin_file, dram_base
+            )
+            for view, order, shared_blocks in zip(views, recency_orders, shared)
+        )  # type: ignore
+        return caches
+
+
+def _reconstruct_hart_cache(
+    view: MTR,
+    params: CacheParams,
+    recency_order: List[CacheBlockAddr],
+    shared_blocks: List[CacheBlockAddr],
+    dram_bin_file: Optional[Path],
+    dram_base: int,
+) -> CacheState:
+    dram = None if dram_bin_file is None else load_dram_image(dram_bin_file)
+    # The single-core reconstruction marks blocks Dirty (written by this hart) or Trunk (clean)
+    cache = view.as_cache(params, dram, dram_base, recency_order)
+    shared_set = set(shared_blocks)
+    for way_idx, set_idx, block_addr in zip(*view.resident_blocks(params, recency_order)):
+        if block_addr in shared_set:
+            cache.coherency[way_idx, set_idx] = CohStatus.Branch
+    return cache
+
+
+# Build multicore MTR checkpoints at the [inst_points], which count instructions across all harts
+def multicore_mtr_ckpts_from_inst_points(
+    spike_log: Iterator[SpikeTraceEntry], block_size: int, inst_points: List[int], n_harts: int
+) -> List[MulticoreMTR]:
+    mtr = MulticoreMTR(block_size, n_harts)
+    mtr_ckpts: List[MulticoreMTR] = []
+    for step in inst_points_to_inst_steps(inst_points):
+        for inst in itertools.islice(spike_log, step):
+            if inst.commit_info:
+                mtr.update(inst.commit_info, inst.inst_count, inst.hart)
+        mtr_ckpts.append(copy.deepcopy(mtr))
+    return mtr_ckpts
@@ -0,0 +1,210 @@
+from typing import Iterator, List, Dict, Optional, Sequence
+from dataclasses import dataclass, field
+
+import numpy as np
+from pandera.typing import DataFrame
+
+from tidalsim.util.spike_log import SpikeTraceEntry
+from tidalsim.util.random import clog2
+from tidalsim.modeling.schemas import EmbeddingSchema
+
+# Reuse (stack) distance analysis over the memory accesses in a spike commit log.
+# The reuse distance of an access is the number of *distinct* cache blocks (in the same set) touched
+# since the previous access to the same block. An LRU cache with [n_ways] ways per set hits on an access
+# iff its reuse distance (computed within its set) is < [n_ways], so a reuse distance histogram gives
+# the miss ratio of every cache size in one pass over the trace.
+#
+# Instead of walking an LRU stack (O(N * M)), every block's last access time is marked in a Fenwick tree,
+# and the reuse distance is the number of marks between the previous access and now (O(N log N)).
+
+# Number of log2 buckets in the per-interval histograms, bucket 0 holds distance 0 and bucket i
+# holds distances in [2^(i-1), 2^i). The last bucket absorbs all larger distances.
+N_LOG2_BUCKETS = 32
+
+
+class FenwickTree:
+    # [size] is the initial capacity, the tree doubles in size whenever an index past the end is updated
+    def __init__(self, size: int = 1024) -> None:
+        self.values: List[int] = [0] * size
+        self.tree: List[int] = [0] * (size + 1)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _grow(self, min_size: int) -> None:
+        size = len(self.values)
+        while size < min_size:
+            size *= 2
+        self.values.extend([0] * (size - len(self.values)))
+        # Rebuild the tree in O(N)
+        self.tree = [0] + self.values.copy()
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    # Add [delta] to the value at [idx]
+    def add(self, idx: int, delta: int) -> None:
+        if idx >= len(self.values):
+            self._grow(idx + 1)
+        self.values[idx] += delta
+        i = idx + 1
+        size = len(self.values)
+        while i <= size:
+            self.tree[i] += delta
+            i += i & -i
+
+    # Sum of the values in [0, idx)
+    def prefix_sum(self, idx: int) -> int:
+        i = min(idx, len(self.values))
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+@dataclass
+class ReuseDistanceTracker:
+    n_sets: int = 1  # n_sets = 1 is a fully associative cache
+    # The per-set Fenwick trees are indexed by the per-set access count
+    trees: Dict[int, FenwickTree] = field(default_factory=lambda: {})
+    set_access_counts: Dict[int, int] = field(default_factory=lambda: {})
+    # Map of block address -> the per-set access count when it was last touched
+    last_access: Dict[int, int] = field(default_factory=lambda: {})
+
+    # Record an access to [block_addr] and return its reuse distance, or None if this is the first
+    # time the block was touched (a cold access)
+    def access(self, block_addr: int) -> Optional[int]:
+        set_idx = block_addr % self.n_sets
+        if set_idx not in self.trees:
+            self.trees[set_idx] = FenwickTree()
+            self.set_access_counts[set_idx] = 0
+        tree = self.trees[set_idx]
+        now = self.set_access_counts[set_idx]
+        self.set_access_counts[set_idx] = now + 1
+
+        distance: Optional[int] = None
+        last = self.last_access.get(block_addr)
+        if last is not None:
+            # Every distinct block touched since [last] has exactly one mark in (last, now)
+            distance = tree.prefix_sum(now) - tree.prefix_sum(last + 1)
+            tree.add(last, -1)
+        tree.add(now, 1)
+        self.last_access[block_addr] = now
+        return distance
+
+
+def log2_bucket(distance: int) -> int:
+    return min(distance.bit_length(), N_LOG2_BUCKETS - 1)
+
+
+@dataclass
+class ReuseProfile:
+    block_size_bytes: int
+    n_sets: int
+    interval_length: int
+    # [distance_counts][d] = number of accesses with reuse distance d (within their set)
+    distance_counts: np.ndarray
+    # Number of accesses to blocks that were never touched before
+    cold_accesses: int
+    # One row per interval of [interval_length] instructions, the first N_LOG2_BUCKETS columns are the
+    # log2-bucketed reuse distance histogram and the last column counts cold accesses
+    interval_histograms: np.ndarray
+
+    def total_accesses(self) -> int:
+        return int(self.distance_counts.sum()) + self.cold_accesses
+
+    # Miss ratio of an LRU cache with [self.n_sets] sets for every associativity in [n_ways]
+    # With [self.n_sets] = 1, [n_ways] is the capacity in blocks of a fully associative cache
+    def miss_ratio_curve(self, n_ways: Sequence[int]) -> np.ndarray:
+        total = self.total_accesses()
+        if total == 0:
+            return np.zeros(len(n_ways))
+        hits_within = np.concatenate([[0], np.cumsum(self.distance_counts)])
+        ways = np.minimum(np.asarray(n_ways), len(self.distance_counts))
+        hits = hits_within[ways]
+        return (total - hits) / total
+
+    def miss_ratio(self, n_ways: int) -> float:
+        return float(self.miss_ratio_curve([n_ways])[0])
+
+
+# Run the reuse distance analysis over the memory accesses in [trace], which must come from a full
+# commit log (spike -l --log-commits). A profile is produced for every set count in [set_counts]
+# in a single pass. Per-interval histograms use the same [interval_length] chunking as
+# [spike_trace_to_embedding_df] so their rows line up with the embedding dataframe.
+def reuse_profiles_from_spike_log(
+    trace: Iterator[SpikeTraceEntry],
+    block_size_bytes: int,
+    interval_length: int,
+    set_counts: List[int] = [1],
+) -> List[ReuseProfile]:
+    offset_bits = clog2(block_size_bytes)
+    trackers = [ReuseDistanceTracker(n_sets) for n_sets in set_counts]
+    distance_counts: List[List[int]] = [[] for _ in set_counts]
+    cold_accesses = [0 for _ in set_counts]
+    interval_histograms: List[List[np.ndarray]] = [[] for _ in set_counts]
+    n_insts = 0
+
+    for entry in trace:
+        n_insts = entry.inst_count + 1
+        if entry.commit_info is None:
+            continue
+        interval_idx = entry.inst_count // interval_length
+        block_addr = entry.commit_info.address >> offset_bits
+        for i, tracker in enumerate(trackers):
+            histograms = interval_histograms[i]
+            while len(histograms) <= interval_idx:
+                histograms.append(np.zeros(N_LOG2_BUCKETS + 1, dtype=np.int64))
+            distance = tracker.access(block_addr)
+            if distance is None:
+                cold_accesses[i] += 1
+                histograms[interval_idx][N_LOG2_BUCKETS] += 1
+            else:
+                counts = distance_counts[i]
+                if distance >= len(counts):
+                    counts.extend([0] * (distance + 1 - len(counts)))
+                counts[distance] += 1
+                histograms[interval_idx][log2_bucket(distance)] += 1
+
+    n_intervals = -(-n_insts // interval_length)
+    profiles = []
+    for i, n_sets in enumerate(set_counts):
+        histograms = interval_histograms[i]
+        while len(histograms) < n_intervals:
+            histograms.append(np.zeros(N_LOG2_BUCKETS + 1, dtype=np.int64))
+        profiles.append(
+            ReuseProfile(
+                block_size_bytes=block_size_bytes,
+                n_sets=n_sets,
+                interval_length=interval_length,
+                distance_counts=np.array(distance_counts[i], dtype=np.int64),
+                cold_accesses=cold_accesses[i],
+                interval_histograms=(
+                    np.vstack(histograms)
+                    if histograms
+                    else np.zeros((0, N_LOG2_BUCKETS + 1), dtype=np.int64)
+                ),
+            )
+        )
+    return profiles
+
+
+# Append each interval's reuse distance histogram (as a fraction of that interval's memory accesses)
+# to its BBV embedding, and renormalize the combined embedding to unit L2 norm
+def append_reuse_features(
+    embedding_df: DataFrame[EmbeddingSchema], profile: ReuseProfile
+) -> DataFrame[EmbeddingSchema]:
+    assert len(embedding_df) == profile.interval_histograms.shape[0]
+
+    def features(histogram: np.ndarray) -> np.ndarray:
+        total = histogram.sum()
+        return histogram / total if total > 0 else histogram.astype(np.float64)
+
+    embeddings = [
+        np.concatenate([embedding, features(histogram)])
+        for embedding, histogram in zip(embedding_df["embedding"], profile.interval_histograms)
+    ]
+    embeddings = [e / np.linalg.norm(e) for e in embeddings]
+    return embedding_df.assign(embedding=embeddings)  # type: ignore
@@ -0,0 +1,184 @@
+from typing import List, Optional
+from dataclasses import dataclass, field
+from pathlib import Path
+from math import ceil
+
+import numpy as np
+
+from tidalsim.cache_model.cache import CacheParams, ArrayFormat, format_array_rows
+from tidalsim.cache_model.mtr import MTR
+from tidalsim.util.spike_log import SpikeTraceEntry
+from tidalsim.util.sparse_mem import MemoryImage, read_image
+
+# A functional model of the TLBs. A TLB is a cache of page translations, so the recency of every
+# virtual page is tracked with an MTR at page granularity: the DTLB MTR sees the (virtual) addresses of
+# the memory accesses in the commit log and the ITLB MTR sees the fetched PCs. The resident pages of a
+# TLB geometry are reconstructed from the MTR just like a cache, and they are translated by walking the
+# page tables in the checkpoint's memory image.
+# Only accesses that are translated enter the MTRs: M-mode accesses are physical, so they are filtered by
+# the privilege mode recorded in the commit log, and the pages touched before the last sfence.vma (which
+# also follows every satp write that turns translation on) were flushed from the TLBs.
+
+PAGE_SIZE_BYTES = 4096
+PAGE_OFFSET_BITS = 12
+PTE_BYTES = 8
+PTE_PPN_BITS = 44
+PTE_FLAG_BITS = 8  # V R W X U G A D
+PTE_V = 1 << 0
+PTE_R = 1 << 1
+PTE_X = 1 << 3
+PRV_M = 3
+
+# satp.MODE -> number of page table levels
+SATP_MODE_LEVELS = {8: 3, 9: 4, 10: 5}  # Sv39, Sv48, Sv57
+
+
+# Parse a TLB geometry given as '<n_sets>x<n_ways>' (e.g. '1x32' for a 32 entry fully associative TLB)
+# TLBs are indexed by virtual page, so the address width is the virtual address width [vaddr_bits]
+def parse_tlb_geometry(geometry: str, vaddr_bits: int = 39) -> CacheParams:
+    n_sets, n_ways = geometry.lower().split("x")
+    return CacheParams(vaddr_bits, PAGE_SIZE_BYTES, n_sets=int(n_sets), n_ways=int(n_ways))
+
+
+@dataclass
+class TLBMTR:
+    dtlb: MTR = field(default_factory=lambda: MTR(PAGE_SIZE_BYTES))
+    itlb: MTR = field(default_factory=lambda: MTR(PAGE_SIZE_BYTES))
+    # instruction count of the last sfence.vma, pages last touched before it aren't in the TLBs
+    flush_time: Optional[int] = None
+
+    # Instructions without a privilege mode (not from a full commit log) are assumed to be translated
+    def update(self, inst: SpikeTraceEntry) -> None:
+        if inst.decoded_inst == "sfence.vma":
+            self.flush_time = inst.inst_count
+        if inst.priv == PRV_M:
+            return
+        self.itlb.update_fetch(inst.pc, inst.inst_bytes, inst.inst_count)
+        if inst.commit_info:
+            self.dtlb.update(inst.commit_info, inst.inst_count)
+
+    def merge(self, other: "TLBMTR") -> "TLBMTR":
+        flush_time = other.flush_time if other.flush_time is not None else self.flush_time
+        return TLBMTR(self.dtlb.merge(other.dtlb), self.itlb.merge(other.itlb), flush_time)
+
+    # The L2 TLB is shared by data accesses and fetches, so its recency comes from both streams
+    # (this ignores the L1 TLBs filtering the accesses that reach it)
+    def l2tlb(self) -> MTR:
+        return self.dtlb.merge(self.itlb)
+
+
+@dataclass
+class TLBEntry:
+    vpn: int
+    ppn: int
+    # level of the leaf PTE, 0 = 4 KiB page, 1 = 2 MiB megapage, ...
+    level: int
+    # V R W X U G A D bits of the leaf PTE
+    flags: int
+
+
+# Walk the page tables rooted at [satp] for the virtual page [vpn] in the memory [image] that starts at
+# [image_base]. Returns None if the translation faults or the page tables aren't in the image.
+def walk_page_table(
+    vpn: int, satp: int, image: MemoryImage, image_base: int = 0x8000_0000
+) -> Optional[TLBEntry]:
+    levels = SATP_MODE_LEVELS[satp >> 60]
+    table_addr = (satp & ((1 << PTE_PPN_BITS) - 1)) << PAGE_OFFSET_BITS
+    for level in reversed(range(levels)):
+        pte_offset = table_addr + ((vpn >> (9 * level)) & 0x1FF) * PTE_BYTES - image_base
+        if pte_offset < 0 or pte_offset + PTE_BYTES > len(image):
+            return None
+        pte = int.from_bytes(read_image(image, pte_offset, PTE_BYTES).tobytes(), "little")
+        if not pte & PTE_V:
+            return None
+        ppn = (pte >> 10) & ((1 << PTE_PPN_BITS) - 1)
+        if pte & (PTE_R | PTE_X):
+            # A leaf, the low VPN bits of a superpage pass through
+            superpage_mask = (1 << (9 * level)) - 1
+            return TLBEntry(
+                vpn, (ppn & ~superpage_mask) | (vpn & superpage_mask), level, pte & 0xFF
+            )
+        table_addr = ppn << PAGE_OFFSET_BITS
+    return None
+
+
+@dataclass
+class TLBState:
+    params: CacheParams
+    # indexed by way, then by set
+    entries: List[List[Optional[TLBEntry]]] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.entries = [[None] * self.params.n_sets for _ in range(self.params.n_ways)]
+
+    def entry_bits(self) -> int:
+        vpn_bits = self.params.phys_addr_bits - PAGE_OFFSET_BITS
+        return 1 + 2 + PTE_FLAG_BITS + PTE_PPN_BITS + vpn_bits
+
+    # Every entry is packed as [valid | level (2b) | flags (8b) | ppn (44b) | vpn]
+    # Rows are ordered by set, then by way
+    def entry_rows(self) -> np.ndarray:
+        vpn_bits = self.params.phys_addr_bits - PAGE_OFFSET_BITS
+        n_bytes = ceil(self.entry_bits() / 8)
+        rows = []
+        for set_idx in range(self.params.n_sets):
+            for way_idx in range(self.params.n_ways):
+                entry = self.entries[way_idx][set_idx]
+                packed = 0
+                if entry is not None:
+                    packed = (1 << 2) | entry.level
+                    packed = (packed << PTE_FLAG_BITS) | entry.flags
+                    packed = (packed << PTE_PPN_BITS) | entry.ppn
+                    packed = (packed << vpn_bits) | (entry.vpn & ((1 << vpn_bits) - 1))
+                rows.append(list(packed.to_bytes(n_bytes, byteorder="big")))
+        return np.array(rows, dtype=np.uint8).reshape(-1, n_bytes)
+
+    def pretty_str(self) -> str:
+        lines = []
+        for set_idx in range(self.params.n_sets):
+            for way_idx in range(self.params.n_ways):
+                entry = self.entries[way_idx][set_idx]
+                if entry is not None:
+                    lines.append(
+                        f"Set {set_idx:02d} Way {way_idx:02d}: vpn {entry.vpn:#x} -> ppn"
+                        f" {entry.ppn:#x} (level {entry.level}, flags {entry.flags:#04x})"
+                    )
+        return "\n".join(lines)
+
+    def dump(self, dir: Path, name: str, fmt: ArrayFormat = ArrayFormat.Bin) -> None:
+        with (dir / f"{name}_entries.{fmt.extension()}").open("wb") as f:
+            f.write(format_array_rows(self.entry_rows(), self.entry_bits(), fmt))
+        with (dir / f"{name}_entries.pretty").open("w") as f:
+            f.write(self.pretty_str())
+
+
+# Reconstruct the TLB with geometry [params] from the page-granularity [mtr], translating every
+# resident page with the page tables rooted at [satp] in the memory [image]
+# Pages last touched before [flush_time] (see [TLBMTR.flush_time]) and pages that don't translate are
+# left out, and the TLB is empty if [satp] turns translation off
+def reconstruct_tlb(
+    mtr: MTR,
+    params: CacheParams,
+    satp: int,
+    image: MemoryImage,
+    image_base: int = 0x8000_0000,
+    flush_time: Optional[int] = None,
+) -> TLBState:
+    assert params.block_size_bytes == mtr.block_size_bytes == PAGE_SIZE_BYTES
+    tlb = TLBState(params)
+    if (satp >> 60) not in SATP_MODE_LEVELS:
+        return tlb
+    ways_filled = [0] * params.n_sets
+    for vpn in mtr.recency_order():
+        if flush_time is not None and mtr.table[vpn].get_last_touched_time() < flush_time:
+            # Pages are in recency order, so every page after this one was flushed too
+            break
+        set_idx = vpn & (params.n_sets - 1)
+        if ways_filled[set_idx] == params.n_ways:
+            continue
+        entry = walk_page_table(vpn, satp, image, image_base)
+        if entry is None:
+            continue
+        tlb.entries[ways_filled[set_idx]][set_idx] = entry
+        ways_filled[set_idx] += 1
+    return tlb
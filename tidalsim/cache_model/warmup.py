@@ -0,0 +1,193 @@
+from typing import Iterator, List, Optional
+from dataclasses import dataclass, field
+from pathlib import Path
+import itertools
+import copy
+import io
+
+from joblib import Parallel, delayed
+
+from tidalsim.cache_model.mtr import MTR
+from tidalsim.cache_model.tlb import TLBMTR
+from tidalsim.bp_model.bp import (
+    BPParams,
+    BranchPredictor,
+    BranchPredictorTracker,
+    control_kinds,
+)
+from tidalsim.util.spike_log import SpikeTraceEntry, parse_spike_log, spike_log_inst_offsets
+from tidalsim.util.random import inst_points_to_inst_steps
+
+
+@dataclass
+class WarmupCkpts:
+    # One entry per inst point for each model, None if the model wasn't requested
+    dcache: List[MTR]
+    icache: Optional[List[MTR]] = None
+    tlb: Optional[List[TLBMTR]] = None
+    bp: Optional[List[BranchPredictor]] = None
+
+
+# The segment-local warmup models of one trace segment
+@dataclass
+class WarmupShard:
+    dcache: MTR
+    icache: Optional[MTR] = None
+    tlb: Optional[TLBMTR] = None
+    # The control instructions of the segment, laid out like the lists of [BranchPredictorTracker]
+    # ([bp_next_pcs] is one shorter than [bp_pcs] if the last one is resolved in the next segment)
+    bp_pcs: List[int] = field(default_factory=list)
+    bp_inst_bytes: List[int] = field(default_factory=list)
+    bp_kinds: List[int] = field(default_factory=list)
+    bp_next_pcs: List[int] = field(default_factory=list)
+    # pc of the first instruction of the segment, None if the segment is empty
+    first_pc: Optional[int] = None
+
+
+# Build the warmup models requested by [icache], [tlb] and [bp] (and always the L1d MTR) from the next
+# [n_insts] instructions of [spike_log]
+def warmup_shard(
+    spike_log: Iterator[SpikeTraceEntry],
+    n_insts: int,
+    block_size: int,
+    track_data: bool = False,
+    icache: bool = False,
+    tlb: bool = False,
+    bp: bool = False,
+) -> WarmupShard:
+    shard = WarmupShard(
+        MTR(block_size, track_data=track_data),
+        MTR(block_size) if icache else None,
+        TLBMTR() if tlb else None,
+    )
+    dmtr, imtr, tlb_mtr = shard.dcache, shard.icache, shard.tlb
+    bp_pcs, bp_inst_bytes, bp_kinds, bp_next_pcs = (
+        shard.bp_pcs,
+        shard.bp_inst_bytes,
+        shard.bp_kinds,
+        shard.bp_next_pcs,
+    )
+    bp_pending = False
+    for inst in itertools.islice(spike_log, n_insts):
+        if shard.first_pc is None:
+            shard.first_pc = inst.pc
+        if imtr is not None:
+            imtr.update_fetch(inst.pc, inst.inst_bytes, inst.inst_count)
+        if tlb_mtr is not None:
+            tlb_mtr.update(inst)
+        if bp_pending:
+            bp_next_pcs.append(inst.pc)
+            bp_pending = False
+        if bp:
+            kind = control_kinds.get(inst.decoded_inst)
+            if kind is not None:
+                bp_pcs.append(inst.pc)
+                bp_inst_bytes.append(inst.inst_bytes)
+                bp_kinds.append(kind)
+                bp_pending = True
+        if inst.commit_info:
+            dmtr.update(inst.commit_info, inst.inst_count)
+    return shard
+
+
+# [warmup_shard] on the [n_insts] instructions of the spike log [spike_log_file] starting at instruction
+# [first_inst], whose line is at byte [offset] of the log
+def _warmup_shard_from_spike_log_range(
+    spike_log_file: Path,
+    full_commit_log: bool,
+    offset: int,
+    first_inst: int,
+    n_insts: int,
+    block_size: int,
+    track_data: bool,
+    icache: bool,
+    tlb: bool,
+    bp: bool,
+) -> WarmupShard:
+    with spike_log_file.open("rb") as f:
+        f.seek(offset)
+        spike_log = parse_spike_log(io.TextIOWrapper(f), full_commit_log, first_inst)
+        return warmup_shard(spike_log, n_insts, block_size, track_data, icache, tlb, bp)
+
+
+# Combine the [shards] of consecutive trace segments into the warmup checkpoints at the end of each
+# segment: every MTR checkpoint is the prefix merge of the shards before it. The branch predictor
+# can't be built from segments, so it's updated with the control instructions of each segment in one
+# batch and snapshotted instead (a control instruction right at an inst point is only applied once
+# its successor is seen).
+def _warmup_ckpts_from_shards(shards: List[WarmupShard], bp: Optional[BPParams]) -> WarmupCkpts:
+    bp_ckpts: List[BranchPredictor] = []
+    if bp is not None:
+        bp_tracker = BranchPredictorTracker(BranchPredictor(bp))
+        for shard in shards:
+            if bp_tracker.pending() and shard.first_pc is not None:
+                bp_tracker.next_pcs.append(shard.first_pc)
+            bp_tracker.pcs.extend(shard.bp_pcs)
+            bp_tracker.inst_bytes.extend(shard.bp_inst_bytes)
+            bp_tracker.kinds.extend(shard.bp_kinds)
+            bp_tracker.next_pcs.extend(shard.bp_next_pcs)
+            bp_tracker.flush()
+            bp_ckpts.append(copy.deepcopy(bp_tracker.bp))
+    imtr_shards = [shard.icache for shard in shards if shard.icache is not None]
+    tlb_shards = [shard.tlb for shard in shards if shard.tlb is not None]
+    return WarmupCkpts(
+        dcache=list(itertools.accumulate([shard.dcache for shard in shards], MTR.merge)),
+        icache=list(itertools.accumulate(imtr_shards, MTR.merge)) if imtr_shards else None,
+        tlb=list(itertools.accumulate(tlb_shards, TLBMTR.merge)) if tlb_shards else None,
+        bp=bp_ckpts if bp is not None else None,
+    )
+
+
+# Build the functional warmup checkpoints of every requested model at the [inst_points] in a single
+# pass over [spike_log]: the L1d MTR (from the memory accesses), the L1i MTR (from the fetch of every
+# instruction) if [icache], the TLB MTRs if [tlb], and the branch predictor with geometry [bp] if given.
+def warmup_ckpts_from_inst_points(
+    spike_log: Iterator[SpikeTraceEntry],
+    block_size: int,
+    inst_points: List[int],
+    track_data: bool = False,
+    icache: bool = False,
+    tlb: bool = False,
+    bp: Optional[BPParams] = None,
+) -> WarmupCkpts:
+    shards = [
+        warmup_shard(spike_log, step, block_size, track_data, icache, tlb, bp is not None)
+        for step in inst_points_to_inst_steps(inst_points)
+    ]
+    return _warmup_ckpts_from_shards(shards, bp)
+
+
+# Same result as [warmup_ckpts_from_inst_points] on the parsed [spike_log_file], but the trace is
+# sharded at the [inst_points] like [mtr_ckpts_from_inst_points_sharded]: each of the [n_jobs] worker
+# processes seeks to its shards in the log, parses them and builds every segment-local model
+def warmup_ckpts_from_inst_points_sharded(
+    spike_log_file: Path,
+    full_commit_log: bool,
+    block_size: int,
+    inst_points: List[int],
+    n_jobs: int = -1,
+    track_data: bool = False,
+    icache: bool = False,
+    tlb: bool = False,
+    bp: Optional[BPParams] = None,
+) -> WarmupCkpts:
+    shard_starts = [0] + inst_points[:-1]
+    offsets = spike_log_inst_offsets(spike_log_file, full_commit_log, shard_starts)
+    shards: List[WarmupShard] = Parallel(n_jobs=n_jobs)(
+        delayed(_warmup_shard_from_spike_log_range)(
+            spike_log_file,
+            full_commit_log,
+            offset,
+            start,
+            step,
+            block_size,
+            track_data,
+            icache,
+            tlb,
+            bp is not None,
+        )
+        for offset, start, step in zip(
+            offsets, shard_starts, inst_points_to_inst_steps(inst_points)
+        )
+    )  # type: ignore
+    return _warmup_ckpts_from_shards(shards, bp)
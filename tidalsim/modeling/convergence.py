@@ -0,0 +1,84 @@
+from pathlib import Path
+from statistics import NormalDist
+from typing import List, Optional, Tuple
+import math
+
+from tidalsim.util.job_sched import JobMonitor
+
+
+# Tails the perf.csv an RTL simulation is writing (one row of instret/cycles per perf sample window)
+# and stops the simulation once its IPC has converged. The IPC of a sample is the mean IPC of its windows
+# after the first [warmup_insts] instructions, as in [tidalsim.modeling.extrapolation]. It has converged
+# when the half-width of its [confidence] confidence interval (normal approximation over at least
+# [min_windows] windows) is within [tolerance] of the mean, relative to the mean.
+class IPCConvergence(JobMonitor):
+    def __init__(
+        self,
+        perf_file: Path,
+        tolerance: float,
+        confidence: float = 0.95,
+        min_windows: int = 10,
+        warmup_insts: int = 0,
+    ) -> None:
+        assert min_windows >= 2
+        self.perf_file = perf_file
+        self.tolerance = tolerance
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.confidence = confidence
+        self.min_windows = min_windows
+        self.warmup_insts = warmup_insts
+        self.start()
+
+    def start(self) -> None:
+        # bytes of [perf_file] that have been parsed, always at the end of a complete row
+        self.offset = 0
+        self.columns: Optional[List[str]] = None
+        self.inst_count = 0
+        self.ipcs: List[float] = []
+
+    # Parse the complete rows that were appended to [perf_file] since the last call
+    def _read_rows(self) -> None:
+        if not self.perf_file.exists():
+            return
+        with self.perf_file.open("rb") as f:
+            f.seek(self.offset)
+            new = f.read()
+        end = new.rfind(b"\n") + 1
+        self.offset += end
+        for line in new[:end].decode().splitlines():
+            values = [v.strip() for v in line.split(",")]
+            if self.columns is None:
+                self.columns = values
+                continue
+            row = dict(zip(self.columns, values))
+            instret, cycles = int(row["instret"]), int(row["cycles"])
+            # Like the extrapolation, only count the windows that end past the warmup
+            self.inst_count += instret
+            if self.inst_count > self.warmup_insts and cycles > 0:
+                self.ipcs.append(instret / cycles)
+
+    # Mean IPC and the half-width of its confidence interval
+    def estimate(self) -> Tuple[float, float]:
+        n = len(self.ipcs)
+        mean = sum(self.ipcs) / n
+        if n < 2:
+            return mean, math.inf
+        std = math.sqrt(sum((ipc - mean) ** 2 for ipc in self.ipcs) / (n - 1))
+        return mean, self.z * std / math.sqrt(n)
+
+    def poll(self) -> Optional[str]:
+        self._read_rows()
+        if len(self.ipcs) < self.min_windows:
+            return None
+        mean, half_width = self.estimate()
+        if mean == 0 or half_width > self.tolerance * mean:
+            return None
+        return (
+            f"IPC {mean:.4f} +/- {half_width:.4f} ({self.confidence:.0%} confidence) after"
+            f" {len(self.ipcs)} windows, {self.inst_count} instructions"
+        )
+
+    # The simulator was killed, drop any partially written row so perf.csv can still be parsed
+    def stop(self) -> None:
+        with self.perf_file.open("r+b") as f:
+            f.truncate(self.offset)
@@ -1,5 +1,6 @@
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Tuple, List, cast, Tuple, Optional
+from typing import Dict, Tuple, List, cast, Tuple, Optional
 import logging
 
 import numpy as np
@@ -28,15 +29,20 @@ def analyze_tidalsim_results(
         .nth(0)
         .sort_values("cluster_id")
     )
+    # Each sampled interval's checkpoint may have been placed before the interval (see
+    # [tidalsim.util.random.place_checkpoints]), in which case its RTL simulation starts with a
+    # detailed warmup prefix that isn't part of the interval
+    samples = read_sample_placement(cluster_dir / "checkpoints")
     ipcs = []
     for index, row in simulated_points.iterrows():
-        perf_file = cluster_dir / "checkpoints" / f"0x80000000.{row['inst_start']}" / "perf.csv"
+        ckpt_inst, prefix_insts = samples.get(row["inst_start"], (row["inst_start"], 0))
+        perf_file = cluster_dir / "checkpoints" / f"0x80000000.{ckpt_inst}" / "perf.csv"
         perf_data = pd.read_csv(perf_file)
         perf_data["ipc"] = perf_data["instret"] / perf_data["cycles"]
         perf_data["inst_count"] = np.cumsum(perf_data["instret"])
-        # Find the first row where more than [detailed_warmup_insts] have elapsed, and only begin tracking IPC from that row onwards
+        # Find the first row where more than [detailed_warmup_insts] have elapsed past the prefix, and only begin tracking IPC from that row onwards
         # mypy can't infer the type of [start_point] correctly
-        start_point = (perf_data["inst_count"] > detailed_warmup_insts).idxmax()
+        start_point = (perf_data["inst_count"] > prefix_insts + detailed_warmup_insts).idxmax()
         # mypy can't say that perf_data[start_point:] is a legal slice
         ipc: float = np.nanmean(perf_data[start_point:]["ipc"])  # type: ignore
         ipcs.append(ipc)
@@ -78,6 +84,37 @@ def analyze_tidalsim_results(
         return estimated_perf_df, None
 
 
+SAMPLE_PLACEMENT_FILE = "samples.csv"
+
+
+# Record where the checkpoint of each sampled interval was placed in [checkpoint_dir]: the interval starts
+# at [interval_starts] and its checkpoint at [ckpt_insts], so its RTL simulation begins with
+# (interval start - checkpoint) instructions of detailed warmup
+def write_sample_placement(
+    checkpoint_dir: Path, interval_starts: List[int], ckpt_insts: List[int]
+) -> None:
+    pd.DataFrame({
+        "inst_start": interval_starts,
+        "ckpt_inst": ckpt_insts,
+        "warmup_insts": [start - ckpt for start, ckpt in zip(interval_starts, ckpt_insts)],
+    }).to_csv(checkpoint_dir / SAMPLE_PLACEMENT_FILE, index=False)
+
+
+# Map of interval start -> (checkpoint inst, warmup insts) from [write_sample_placement]
+# Empty if the checkpoints were placed at the start of their intervals.
+def read_sample_placement(checkpoint_dir: Path) -> Dict[int, Tuple[int, int]]:
+    placement_file = checkpoint_dir / SAMPLE_PLACEMENT_FILE
+    if not placement_file.exists():
+        return {}
+    placement = pd.read_csv(placement_file)
+    return {
+        int(inst_start): (int(ckpt_inst), int(warmup_insts))
+        for inst_start, ckpt_inst, warmup_insts in zip(
+            placement["inst_start"], placement["ckpt_inst"], placement["warmup_insts"]
+        )
+    }
+
+
 def parse_golden_perf(perf_csv: Path) -> DataFrame[GoldenPerfSchema]:
     perf_data = pd.read_csv(perf_csv)
     golden_perf_df: DataFrame[GoldenPerfSchema] = perf_data.assign(
@@ -85,3 +122,56 @@ def parse_golden_perf(perf_csv: Path) -> DataFrame[GoldenPerfSchema]:
         inst_count=lambda x: np.cumsum(x["instret"].to_numpy()),
     )  # type: ignore
     return golden_perf_df
+
+
+# A segment of the parallel golden simulation, see [golden_segments]
+@dataclass
+class GoldenSegment:
+    # first instruction of the segment in the golden timeline
+    start: int
+    # number of instructions of the timeline covered by this segment
+    length: int
+    # instruction the segment's checkpoint is taken at, [start] - [ckpt_inst] instructions of detailed
+    # warmup are simulated before the measured part of the segment
+    ckpt_inst: int
+
+    @property
+    def warmup_insts(self) -> int:
+        return self.start - self.ckpt_inst
+
+
+# Split a program of [n_insts] instructions into segments of [segment_length] instructions that can be
+# simulated in RTL concurrently. Each segment's checkpoint is taken [warmup_insts] instructions
+# before the segment starts (or at instruction 0), so the overlap with the previous segment warms up
+# the microarchitectural state that isn't injected.
+def golden_segments(n_insts: int, segment_length: int, warmup_insts: int) -> List[GoldenSegment]:
+    assert segment_length > 0
+    return [
+        GoldenSegment(start, min(segment_length, n_insts - start), max(0, start - warmup_insts))
+        for start in range(0, n_insts, segment_length)
+    ]
+
+
+# Combine the perf.csv of every segment of the parallel golden simulation ([perf_files] and [segments]
+# line up) into a single golden timeline. Each segment's perf sample windows that end within its warmup
+# are dropped, and so are the windows that start past its end (except for the last segment, which runs
+# until the program exits). The sample period should divide the warmup and segment lengths, so the
+# windows of every segment line up with the timeline.
+def stitch_golden_perf(
+    perf_files: List[Path], segments: List[GoldenSegment]
+) -> DataFrame[GoldenPerfSchema]:
+    assert len(perf_files) == len(segments)
+    segment_dfs = []
+    for i, (perf_file, segment) in enumerate(zip(perf_files, segments)):
+        perf_data = pd.read_csv(perf_file)
+        window_end = np.cumsum(perf_data["instret"].to_numpy())
+        keep = window_end > segment.warmup_insts
+        if i != len(segments) - 1:
+            keep &= window_end - perf_data["instret"] < segment.warmup_insts + segment.length
+        segment_dfs.append(perf_data[keep])
+    perf_data = pd.concat(segment_dfs, ignore_index=True)
+    golden_perf_df: DataFrame[GoldenPerfSchema] = perf_data.assign(
+        ipc=lambda x: x["instret"] / x["cycles"],
+        inst_count=lambda x: np.cumsum(x["instret"].to_numpy()),
+    )  # type: ignore
+    return golden_perf_df
@@ -0,0 +1,99 @@
+import sys
+import hashlib
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from tidalsim.util.loadarch import Loadarch
+from tidalsim.util.elf import read_elf_segments
+
+# A stand-in for a state injection RTL simulator, so the sampling flow can be run and benchmarked
+# without RTL or simulator licenses. It takes the same plusargs as the Chipyard harness (the ones it
+# doesn't know about are ignored), reads the injected state (+loadarch, +loadmem and the cache arrays
+# in +checkpoint-dir) and writes a synthetic perf.csv to +perf-file.
+# The IPC is a deterministic function of the injected state: every checkpoint gets its own base IPC,
+# and the first windows run slower, more so if the caches weren't injected (cold caches).
+# +fake-latency=<seconds> sleeps that long before every perf sample window, to stand in for
+# the simulator's speed. Without +max-instructions, the program 'exits' after +fake-exit-insts.
+
+
+def parse_plusargs(argv: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    plusargs: Dict[str, str] = {}
+    positional: List[str] = []
+    for arg in argv:
+        if arg.startswith("+"):
+            key, _, value = arg[1:].partition("=")
+            plusargs[key] = value
+        else:
+            positional.append(arg)
+    return plusargs, positional
+
+
+# Hash the injected arch state and DRAM image, so the same checkpoint always gets the same performance
+def injected_state_digest(plusargs: Dict[str, str]) -> bytes:
+    h = hashlib.blake2b(digest_size=8)
+    loadarch = Path(plusargs["loadarch"])
+    if len(Loadarch.read(loadarch).harts) == 0:
+        raise RuntimeError(f"{loadarch} doesn't hold the state of any hart")
+    h.update(loadarch.read_bytes())
+    for segment in read_elf_segments(Path(plusargs["loadmem"])):
+        h.update(segment.paddr.to_bytes(8, "little"))
+        h.update(bytes(segment.data))
+    return h.digest()
+
+
+# Whether any cache arrays were injected from +checkpoint-dir
+def injected_caches(plusargs: Dict[str, str]) -> bool:
+    if "checkpoint-dir" not in plusargs:
+        return False
+    arrays = Path(plusargs["checkpoint-dir"]).glob("*_array*")
+    return any(len(array.read_bytes()) > 0 for array in arrays)
+
+
+# Fraction in [0, 1) derived from [digest] and [salt]
+def unit_hash(digest: bytes, salt: int) -> float:
+    h = hashlib.blake2b(digest + salt.to_bytes(8, "little"), digest_size=8).digest()
+    return int.from_bytes(h, "little") / 2**64
+
+
+def main():
+    plusargs, _ = parse_plusargs(sys.argv[1:])
+    perf_file = Path(plusargs["perf-file"])
+    period = int(plusargs["perf-sample-period"])
+    max_cycles = int(plusargs.get("max-cycles", "10000000"))
+    latency_s = float(plusargs.get("fake-latency", "0"))
+    if "max-instructions" in plusargs:
+        n_insts = int(plusargs["max-instructions"])
+    else:
+        n_insts = int(plusargs.get("fake-exit-insts", "1000000"))
+
+    digest = injected_state_digest(plusargs)
+    base_ipc = 0.4 + unit_hash(digest, 0)
+    cold_penalty = 0.1 if injected_caches(plusargs) else 0.5
+
+    cycles = 0
+    insts = 0
+    with perf_file.open("w") as f:
+        f.write("cycles,instret\n")
+        f.flush()
+        window = 0
+        while insts < n_insts:
+            time.sleep(latency_s)
+            instret = min(period, n_insts - insts)
+            warmup = 1 - cold_penalty * math.exp(-insts / (4 * period))
+            noise = 1 + 0.04 * (unit_hash(digest, window + 1) - 0.5)
+            window_cycles = max(1, round(instret / (base_ipc * warmup * noise)))
+            cycles += window_cycles
+            if cycles > max_cycles:
+                print(f"*** FAILED *** (timeout, seed 0) after {max_cycles} cycles")
+                sys.exit(1)
+            insts += instret
+            f.write(f"{window_cycles},{instret}\n")
+            f.flush()
+            window += 1
+    print(f"Simulated {insts} instructions in {cycles} cycles")
+
+
+if __name__ == "__main__":
+    main()
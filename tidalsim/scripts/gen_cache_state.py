@@ -25,6 +25,16 @@ def main():
     parser.add_argument("--n-sets", type=int, default=64, help="Number of sets")
     parser.add_argument("--n-ways", type=int, default=4, help="Number of ways")
     parser.add_argument("--dir", type=str, required=True, help="Directory in which to dump things")
+    parser.add_argument(
+        "--array-format",
+        type=str,
+        choices=["bin", "hex", "raw"],
+        default="bin",
+        help=(
+            "File format of the dumped cache arrays: bin ($readmemb), hex ($readmemh) or raw"
+            " (packed little-endian bytes) [default bin]"
+        ),
+    )
     args = parser.parse_args()
     data_dir = Path(args.dir)
     data_dir.mkdir(exist_ok=True)
@@ -32,5 +42,6 @@ def main():
     params = CacheParams(args.phys_addr_bits, args.block_size, args.n_sets, args.n_ways)
     state = CacheState(params)
     state.fill_with_structured_data()
-    state.dump_tag_arrays(data_dir, "dcache_tag_array")
-    state.dump_data_arrays(data_dir, "dcache_data_array")
+    fmt = ArrayFormat[args.array_format.capitalize()]
+    state.dump_tag_arrays(data_dir, "dcache_tag_array", fmt)
+    state.dump_data_arrays(data_dir, "dcache_data_array", fmt)
@@ -1,11 +1,23 @@
 import argparse
+import os
 from pathlib import Path
 import logging
 
 from tidalsim.util.spike_ckpt import *
+from tidalsim.util.spike_session import SpikeSession
 from tidalsim.util.cli import *
 from tidalsim.util.spike_log import parse_spike_log
-from tidalsim.cache_model.mtr import MTR, mtr_ckpts_from_inst_points
+from tidalsim.cache_model.cache import parse_cache_geometry, ArrayFormat
+from tidalsim.cache_model.mtr import (
+    MTR,
+    mtr_ckpts_from_inst_points,
+    mtr_ckpts_from_inst_points_sharded,
+)
+from tidalsim.cache_model.multicore_mtr import MulticoreMTR, multicore_mtr_ckpts_from_inst_points
+from tidalsim.cache_model.warmup import (
+    warmup_ckpts_from_inst_points,
+    warmup_ckpts_from_inst_points_sharded,
+)
 
 # This is a rewrite of the script here: https://github.com/ucb-bar/chipyard/blob/main/scripts/generate-ckpt.sh
 
@@ -49,52 +61,213 @@ def main():
             " can be a list e.g. --inst-points 100 1000 2000"
         ),
     )
+    parser.add_argument(
+        "--spike-shards",
+        type=int,
+        default=1,
+        help=(
+            "Number of spike processes that take the checkpoints concurrently, -1 for one per"
+            " core [default 1]"
+        ),
+    )
     parser.add_argument(
         "--cache-warmup", action="store_true", help="Generate checkpoints for L1d warmup too"
     )
+    parser.add_argument(
+        "--single-spike-run",
+        action="store_true",
+        help=(
+            "Log the commits and take the checkpoints in the same spike run (requires"
+            " --cache-warmup and sorted inst points)"
+        ),
+    )
+    parser.add_argument(
+        "--mtr-jobs",
+        type=int,
+        default=1,
+        help=(
+            "Number of worker processes used to build MTR checkpoints by sharding the trace at"
+            " the inst points [default 1 (sequential)]"
+        ),
+    )
+    parser.add_argument(
+        "--icache-warmup",
+        action="store_true",
+        help="Generate checkpoints for L1i warmup too (requires --cache-warmup)",
+    )
+    parser.add_argument(
+        "--icache-geometry",
+        type=str,
+        default="64x4",
+        help="L1i geometry to reconstruct from each I-cache MTR checkpoint [default 64x4]",
+    )
+    parser.add_argument(
+        "--trace-cache-data",
+        action="store_true",
+        help=(
+            "Take L1d block data from the store/load data in the full commit log (on top of the"
+            " binary's initial memory image) instead of reading spike's DRAM dumps"
+        ),
+    )
+    parser.add_argument(
+        "--dcache-geometry",
+        type=str,
+        nargs="+",
+        default=["64x4"],
+        help=(
+            "L1d geometries to reconstruct from each MTR checkpoint as <n_sets>x<n_ways>. The first"
+            " geometry is dumped into the checkpoint directory and, if more than one is given,"
+            " every geometry is also dumped into a dcache.<n_sets>x<n_ways> subdirectory"
+            " [default 64x4]"
+        ),
+    )
+    parser.add_argument(
+        "--array-format",
+        type=str,
+        choices=["bin", "hex", "raw"],
+        default="bin",
+        help=(
+            "File format of the dumped cache arrays: bin ($readmemb), hex ($readmemh) or raw"
+            " (packed little-endian bytes) [default bin]"
+        ),
+    )
     args = parser.parse_args()
     assert args.pc is not None and args.inst_points is not None
+    assert not args.icache_warmup or args.cache_warmup, "--icache-warmup requires --cache-warmup"
+    assert (
+        not args.single_spike_run or args.cache_warmup
+    ), "--single-spike-run requires --cache-warmup"
+    assert args.n_harts == 1 or not (
+        args.icache_warmup or args.trace_cache_data
+    ), "--icache-warmup and --trace-cache-data are only supported with a single hart"
     dest_dir = Path(args.dest_dir)
     dest_dir.mkdir(exist_ok=True)
     binary = Path(args.binary)
     assert binary.is_file()
     inst_points = [int(x) for x in args.inst_points]
+    spike_shards = args.spike_shards if args.spike_shards > 0 else (os.cpu_count() or 1)
 
     # Store checkpoints in the base directory associated with the binary
     base_dir = dest_dir / f"{binary.name}.loadarch"
     base_dir.mkdir(exist_ok=True)
 
     mtr_ckpts: Optional[List[MTR]] = None
+    imtr_ckpts: Optional[List[MTR]] = None
+    multicore_mtr_ckpts: Optional[List[MulticoreMTR]] = None
     if args.cache_warmup:
-        # Run spike to get a full commit log
-        spike_cmd = get_spike_cmd(
-            binary,
-            args.n_harts,
-            args.isa,
-            debug_file=None,
-            inst_log=True,
-            commit_log=True,
-            suppress_exit=False,
-        )
         spike_trace_file = base_dir / "spike.full_trace"
-        run_cmd_pipe(spike_cmd, cwd=base_dir, stderr=spike_trace_file)
+        if args.single_spike_run:
+            # Take the architectural checkpoints in the same spike run that logs the commits
+            with spike_trace_file.open("w") as trace:
+                with SpikeSession(
+                    binary, base_dir, args.n_harts, args.isa, args.pc, trace
+                ) as session:
+                    session.take_checkpoints(inst_points, base_dir)
+        else:
+            # Run spike to get a full commit log
+            spike_cmd = get_spike_cmd(
+                binary,
+                args.n_harts,
+                args.isa,
+                debug_file=None,
+                inst_log=True,
+                commit_log=True,
+                suppress_exit=False,
+            )
+            run_cmd_pipe(spike_cmd, cwd=base_dir, stderr=spike_trace_file)
         # Generate MTR checkpoints which will be converted into cache checkpoints later
         with spike_trace_file.open("r") as f:
             spike_trace_log = parse_spike_log(f, full_commit_log=True)
-            mtr_ckpts = mtr_ckpts_from_inst_points(
-                spike_trace_log, block_size=64, inst_points=inst_points
-            )
+            if args.n_harts > 1:
+                # Every hart gets its own L1d, kept coherent with the other harts' L1ds
+                multicore_mtr_ckpts = multicore_mtr_ckpts_from_inst_points(
+                    spike_trace_log, block_size=64, inst_points=inst_points, n_harts=args.n_harts
+                )
+            elif args.icache_warmup:
+                if args.mtr_jobs == 1:
+                    warmup_ckpts = warmup_ckpts_from_inst_points(
+                        spike_trace_log,
+                        block_size=64,
+                        inst_points=inst_points,
+                        track_data=args.trace_cache_data,
+                        icache=True,
+                    )
+                else:
+                    warmup_ckpts = warmup_ckpts_from_inst_points_sharded(
+                        spike_trace_file,
+                        full_commit_log=True,
+                        block_size=64,
+                        inst_points=inst_points,
+                        n_jobs=args.mtr_jobs,
+                        track_data=args.trace_cache_data,
+                        icache=True,
+                    )
+                mtr_ckpts, imtr_ckpts = warmup_ckpts.dcache, warmup_ckpts.icache
+            elif args.mtr_jobs == 1:
+                mtr_ckpts = mtr_ckpts_from_inst_points(
+                    spike_trace_log,
+                    block_size=64,
+                    inst_points=inst_points,
+                    track_data=args.trace_cache_data,
+                )
+            else:
+                mtr_ckpts = mtr_ckpts_from_inst_points_sharded(
+                    spike_trace_file,
+                    full_commit_log=True,
+                    block_size=64,
+                    inst_points=inst_points,
+                    n_jobs=args.mtr_jobs,
+                    track_data=args.trace_cache_data,
+                )
 
     # Generate all the architectural checkpoints with loadarch + DRAM content files
-    gen_checkpoints(binary, args.pc, inst_points, base_dir, int(args.n_harts), args.isa)
+    if not args.single_spike_run:
+        gen_checkpoints(
+            binary,
+            args.pc,
+            inst_points,
+            base_dir,
+            int(args.n_harts),
+            args.isa,
+            n_shards=spike_shards,
+        )
     ckpt_dirs: List[Path] = get_ckpt_dirs(base_dir, args.pc, inst_points)
 
     if args.cache_warmup:
-        cache_params = CacheParams(phys_addr_bits=32, block_size_bytes=64, n_sets=64, n_ways=4)
-        assert mtr_ckpts
-        for mtr, ckpt_dir in zip(mtr_ckpts, ckpt_dirs):
-            cache_state: CacheState
-            with (ckpt_dir / "mem.0x80000000.bin").open("rb") as f:
-                cache_state = mtr.as_cache(cache_params, f, dram_base=0x8000_0000)
-            cache_state.dump_data_arrays(ckpt_dir, "dcache_data_array")
-            cache_state.dump_tag_arrays(ckpt_dir, "dcache_tag_array")
+        cache_params = [
+            parse_cache_geometry(g, phys_addr_bits=32, block_size_bytes=64)
+            for g in args.dcache_geometry
+        ]
+        if multicore_mtr_ckpts:
+            logging.info("Reconstructing every hart's L1d state for each checkpoint")
+            for multicore_mtr, ckpt_dir in zip(multicore_mtr_ckpts, ckpt_dirs):
+                dump_multicore_dcache_ckpt(
+                    multicore_mtr,
+                    ckpt_dir,
+                    cache_params,
+                    fmt=ArrayFormat[args.array_format.capitalize()],
+                )
+        else:
+            assert mtr_ckpts
+            logging.info("Reconstructing L1d state for each checkpoint")
+            dump_dcache_ckpts(
+                mtr_ckpts,
+                ckpt_dirs,
+                cache_params,
+                fmt=ArrayFormat[args.array_format.capitalize()],
+                elf=(binary if args.trace_cache_data else None),
+            )
+            if imtr_ckpts:
+                logging.info("Reconstructing L1i state for each checkpoint")
+                dump_dcache_ckpts(
+                    imtr_ckpts,
+                    ckpt_dirs,
+                    [
+                        parse_cache_geometry(
+                            args.icache_geometry, phys_addr_bits=32, block_size_bytes=64
+                        )
+                    ],
+                    fmt=ArrayFormat[args.array_format.capitalize()],
+                    elf=(binary if args.trace_cache_data else None),
+                    cache_name="icache",
+                )
@@ -0,0 +1,46 @@
+import argparse
+import logging
+from pathlib import Path
+
+from tidalsim.util.executor import run_queue_worker
+
+# A worker of a simulator farm: runs the tasks (checkpoint conversion, cache reconstruction and RTL
+# simulations) that tidalsim --job-queue puts in the job queue on shared storage. Start any number of them,
+# on any machine that sees the queue directory (and the checkpoint directories, unless tidalsim copies them
+# with --queue-copy-artifacts).
+
+
+def main():
+    logging.basicConfig(
+        format="%(levelname)s - %(filename)s:%(lineno)d - %(message)s", level=logging.INFO
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="sim-worker",
+        description="Run the tasks in a tidalsim job queue",
+    )
+    parser.add_argument(
+        "--queue-dir", type=Path, required=True, help="Job queue directory on shared storage"
+    )
+    parser.add_argument(
+        "--name", type=str, default=None, help="Name of this worker [default <hostname>.<pid>]"
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=0.2,
+        help="Seconds between polls of the queue [default 0.2]",
+    )
+    parser.add_argument(
+        "--idle-exit",
+        type=float,
+        default=None,
+        help="Exit after this many seconds without a task [default never]",
+    )
+    args = parser.parse_args()
+    # The worker also exits when a file named 'stop' is created in the queue directory
+    run_queue_worker(args.queue_dir.resolve(), args.name, args.poll_interval, args.idle_exit)
+
+
+if __name__ == "__main__":
+    main()
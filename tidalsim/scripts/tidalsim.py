@@ -1,8 +1,13 @@
 import argparse
+import atexit
+from dataclasses import dataclass
+import functools
+import os
 from pathlib import Path
 import shutil
 import stat
 import sys
+from typing import Callable, Dict, List, Optional
 from joblib import Parallel, delayed
 import logging
 import pdb
@@ -12,46 +17,572 @@ import numpy as np
 
 from tidalsim.util.cli import run_cmd, run_cmd_capture, run_cmd_pipe, run_cmd_pipe_stdout
 from tidalsim.util.spike_ckpt import *
-from tidalsim.util.spike_log import parse_spike_log
+from tidalsim.util.spike_session import trace_with_periodic_loadarchs
+from tidalsim.util.rtl_sim import SimBackend, VCSBackend, FakeSimBackend, rtl_sim_timeouts
+from tidalsim.util.job_sched import JobScheduler, JobStatus, SimJob, failed_jobs
+from tidalsim.util.pipeline import CheckpointPipeline
+from tidalsim.util.executor import Executor, LocalQueueWorkers, QueueExecutor
+from tidalsim.util.spike_log import parse_spike_log, spike_log_inst_count
 from tidalsim.bb.spike import spike_trace_to_bbs, spike_trace_to_embedding_df, BasicBlocks
 from tidalsim.bb.elf import objdump_to_bbs
 from tidalsim.util.pickle import dump, load
-from tidalsim.util.random import inst_points_to_inst_steps
+from tidalsim.util.random import inst_points_to_inst_steps, place_checkpoints
 from tidalsim.modeling.clustering import *
 from tidalsim.modeling.schemas import *
-from tidalsim.cache_model.mtr import mtr_ckpts_from_inst_points, MTR
+from tidalsim.modeling.convergence import IPCConvergence
+from tidalsim.modeling.extrapolation import (
+    GoldenSegment,
+    golden_segments,
+    stitch_golden_perf,
+    write_sample_placement,
+)
+from tidalsim.cache_model.cache import parse_cache_geometry, ArrayFormat
+from tidalsim.cache_model.reuse import ReuseProfile, reuse_profiles_from_spike_log
+from tidalsim.cache_model.mtr import (
+    mtr_ckpts_from_inst_points,
+    mtr_ckpts_from_inst_points_sharded,
+    MTR,
+)
+from tidalsim.cache_model.warmup import (
+    WarmupCkpts,
+    warmup_ckpts_from_inst_points,
+    warmup_ckpts_from_inst_points_sharded,
+)
+from tidalsim.cache_model.tlb import TLBMTR, parse_tlb_geometry
+from tidalsim.bp_model.bp import BPParams, BranchPredictor
 
 
-def run_rtl_sim(
-    simulator: Path,
-    perf_file: Path,
-    perf_sample_period: int,
-    max_instructions: Optional[int],
-    chipyard_root: Path,
+# Where the RTL simulations run and the limits they're scheduled within
+@dataclass
+class SimResources:
+    backend: SimBackend
+    max_mem_gb: float
+    max_cpus: int
+    max_attempts: int
+    # RTL simulations go through [queue_executor], the other tasks only when the workers share storage
+    queue_executor: Optional[QueueExecutor] = None
+    shared_executor: Optional[Executor] = None
+
+    # A scheduler for RTL simulations that keeps their status in [status_file]
+    def scheduler(self, status_file: Path) -> JobScheduler:
+        return JobScheduler(
+            status_file,
+            max_mem_gb=self.max_mem_gb,
+            max_cpus=self.max_cpus,
+            max_attempts=self.max_attempts,
+            executor=self.queue_executor,
+        )
+
+
+# Set up the RTL simulator backend and, with --job-queue, the executors that hand work to the job
+# queue's workers (starting --local-workers of them on this machine)
+def sim_resources(args: argparse.Namespace) -> SimResources:
+    sim_backend: SimBackend
+    if args.sim_backend == "vcs":
+        assert args.simulator and args.chipyard_root, "vcs needs --simulator and --chipyard-root"
+        simulator = Path(args.simulator).resolve()
+        assert simulator.exists() and simulator.is_file()
+        chipyard_root = Path(args.chipyard_root).resolve()
+        assert chipyard_root.is_dir()
+        sim_backend = VCSBackend(simulator, chipyard_root)
+    else:
+        sim_backend = FakeSimBackend(args.fake_sim_latency)
+    sim = SimResources(
+        sim_backend,
+        max_mem_gb=args.max_sim_mem_gb
+        or (0.9 * os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**30),
+        max_cpus=args.max_sim_jobs or os.cpu_count() or 1,
+        max_attempts=args.sim_attempts,
+    )
+    if args.job_queue:
+        queue_dir = Path(args.job_queue).resolve()
+        sim.queue_executor = QueueExecutor(queue_dir, copy_artifacts=args.queue_copy_artifacts)
+        if not args.queue_copy_artifacts:
+            sim.shared_executor = sim.queue_executor
+        elif args.early_stop_tolerance is not None:
+            logging.warning(
+                "RTL simulations can't be stopped early when their perf files are only copied back"
+                " at the end, --early-stop-tolerance is ignored"
+            )
+        if args.local_workers > 0:
+            logging.info(f"Starting {args.local_workers} workers for the job queue in {queue_dir}")
+            atexit.register(LocalQueueWorkers(queue_dir, args.local_workers).close)
+    else:
+        assert args.local_workers == 0, "--local-workers requires --job-queue"
+    return sim
+
+
+# Files an RTL simulation of the checkpoint in [ckpt_dir] reads, copied to the workers if they don't
+# share storage with this machine
+def ckpt_sim_inputs(ckpt_dir: Path) -> List[Path]:
+    return [ckpt_dir / "loadarch", ckpt_dir / "mem.elf"] + sorted(ckpt_dir.glob("*_array*"))
+
+
+# Run the full RTL simulation of [binary] (the golden reference) in [golden_sim_dir], either as a
+# single simulation from instruction 0 or, with --golden-segment-length, see [run_golden_segments]
+def run_golden_sim(
+    args: argparse.Namespace,
+    binary: Path,
+    spike_trace_file: Path,
+    full_commit_log: bool,
+    golden_sim_dir: Path,
+    dcache_params: List[CacheParams],
+    sim: SimResources,
+    n_harts: int,
+    isa: str,
+    spike_shards: int,
+) -> None:
+    golden_sim_dir.mkdir(exist_ok=True)
+    golden_perf_file = golden_sim_dir / "perf.csv"
+    logging.info(f"Running full RTL simulation of {binary} in {golden_sim_dir}")
+
+    if golden_perf_file.exists() and golden_perf_file.is_file():
+        logging.info(
+            f"Golden performance results already exist in {golden_sim_dir}, not-rerunning RTL"
+            " simulation"
+        )
+    elif args.golden_segment_length is None:
+        logging.info(f"Taking spike checkpoint at instruction 0 to inject into RTL simulation")
+        gen_checkpoints(
+            binary,
+            start_pc=0x8000_0000,
+            inst_points=[0],
+            ckpt_base_dir=golden_sim_dir,
+            n_harts=n_harts,
+            isa=isa,
+        )
+        inst_0_ckpt = golden_sim_dir / "0x80000000.0"
+        golden_sim_cmd = sim.backend.cmd(
+            perf_file=golden_perf_file,
+            perf_sample_period=args.interval_length,
+            max_instructions=None,
+            binary=(inst_0_ckpt / "mem.elf"),
+            loadarch=(inst_0_ckpt / "loadarch"),
+            suppress_exit=False,
+            checkpoint_dir=None,
+        )
+        run_cmd(golden_sim_cmd, golden_sim_dir)
+    else:
+        run_golden_segments(
+            args,
+            binary,
+            spike_trace_file,
+            full_commit_log,
+            golden_sim_dir,
+            dcache_params,
+            sim,
+            n_harts,
+            isa,
+            spike_shards,
+        )
+
+
+# Simulate segments of the program concurrently from spike checkpoints along the way and stitch their
+# performance metrics into the golden perf.csv in [golden_sim_dir]
+def run_golden_segments(
+    args: argparse.Namespace,
     binary: Path,
-    loadarch: Path,
-    cwd: Path,
-    suppress_exit: bool,
-    checkpoint_dir: Optional[Path],
-    timeout_cycles: int = 10_000_000,
+    spike_trace_file: Path,
+    full_commit_log: bool,
+    golden_sim_dir: Path,
+    dcache_params: List[CacheParams],
+    sim: SimResources,
+    n_harts: int,
+    isa: str,
+    spike_shards: int,
 ) -> None:
-    max_insts_str = f"+max-instructions={max_instructions}" if max_instructions is not None else ""
-    checkpoint_dir_str = (
-        f"+checkpoint-dir={checkpoint_dir.resolve()}" if checkpoint_dir is not None else ""
+    segment_length = args.golden_segment_length
+    warmup_insts = (
+        args.golden_warmup_insts if args.golden_warmup_insts is not None else args.interval_length
+    )
+    assert (
+        segment_length % args.interval_length == 0 and warmup_insts % args.interval_length == 0
+    ), "The golden segment and warmup lengths must be multiples of the interval length"
+    assert warmup_insts < segment_length
+    n_insts = spike_log_inst_count(spike_trace_file, full_commit_log)
+    segments = golden_segments(n_insts, segment_length, warmup_insts)
+    segment_insts = [segment.ckpt_inst for segment in segments]
+    segments_dir = golden_sim_dir / "segments"
+    segments_dir.mkdir(exist_ok=True)
+    segment_ckpts = get_ckpt_dirs(segments_dir, 0x8000_0000, segment_insts)
+    logging.info(
+        f"Taking spike checkpoints at instructions {segment_insts} for {len(segments)}"
+        " golden simulation segments"
+    )
+    gen_checkpoints(
+        binary,
+        start_pc=0x8000_0000,
+        inst_points=segment_insts,
+        ckpt_base_dir=segments_dir,
+        n_harts=n_harts,
+        isa=isa,
+        n_shards=spike_shards,
+        executor=sim.shared_executor,
+    )
+    if args.cache_warmup:
+        logging.info("Reconstructing L1d state for each golden segment")
+        with spike_trace_file.open("r") as f:
+            segment_mtrs = mtr_ckpts_from_inst_points(
+                parse_spike_log(f, full_commit_log),
+                block_size=64,
+                inst_points=segment_insts,
+            )
+        dump_dcache_ckpts(
+            segment_mtrs,
+            segment_ckpts,
+            dcache_params,
+            fmt=ArrayFormat[args.array_format.capitalize()],
+        )
+
+    def segment_rtl_sim_job(i: int, segment: GoldenSegment, ckpt: Path) -> SimJob:
+        last = i == len(segments) - 1
+        sim_insts = segment.warmup_insts + segment.length
+        timeout_cycles, timeout_s = rtl_sim_timeouts(
+            sim_insts, args.sim_max_cpi, args.sim_min_cycles_per_s
+        )
+        cmd = sim.backend.cmd(
+            perf_file=(ckpt / "perf.csv"),
+            perf_sample_period=args.interval_length,
+            # The last segment runs until the program exits
+            max_instructions=None if last else sim_insts,
+            binary=(ckpt / "mem.elf"),
+            loadarch=(ckpt / "loadarch"),
+            suppress_exit=not last,
+            checkpoint_dir=(ckpt if args.cache_warmup else None),
+            timeout_cycles=timeout_cycles,
+        )
+        return SimJob(
+            name=ckpt.name,
+            cmd=cmd,
+            cwd=ckpt,
+            outputs=[ckpt / "perf.csv"],
+            mem_gb=args.sim_mem_gb,
+            expected_cost=sim_insts,
+            timeout_s=timeout_s,
+            log_file=ckpt / "rtl_sim.log",
+            inputs=ckpt_sim_inputs(ckpt),
+        )
+
+    logging.info(f"Running {len(segments)} golden simulation segments in parallel")
+    with sim.scheduler(golden_sim_dir / "rtl_sim_status.json") as scheduler:
+        status = scheduler.run([
+            segment_rtl_sim_job(i, segment, ckpt)
+            for i, (segment, ckpt) in enumerate(zip(segments, segment_ckpts))
+        ])
+    failed = failed_jobs(status)
+    if len(failed) > 0:
+        raise RuntimeError(
+            f"RTL simulation of golden segments {', '.join(failed)} failed, rerunning will"
+            " only simulate the unfinished segments"
+        )
+    golden_perf_file = golden_sim_dir / "perf.csv"
+    golden_perf_df = stitch_golden_perf([c / "perf.csv" for c in segment_ckpts], segments)
+    golden_perf_df[["cycles", "instret"]].to_csv(golden_perf_file, index=False)
+    logging.info(f"Stitched the golden segments' performance metrics into {golden_perf_file}")
+
+
+# Build the warmup models of the [checkpoints] at [checkpoint_insts] from the commit log in
+# [spike_trace_file], or load the ones a previous run saved in the checkpoint directories
+def gen_warmup_ckpts(
+    args: argparse.Namespace,
+    spike_trace_file: Path,
+    full_commit_log: bool,
+    checkpoints: List[Path],
+    checkpoint_insts: List[int],
+) -> WarmupCkpts:
+    ckpt_files = ["mtr.pickle"]
+    if args.icache_warmup:
+        ckpt_files.append("imtr.pickle")
+    if args.tlb_warmup:
+        ckpt_files.append("tlb_mtr.pickle")
+    if args.bp_warmup:
+        ckpt_files.append("bp.pickle")
+    if all((c / f).exists() for c in checkpoints for f in ckpt_files):
+        logging.info(f"MTR checkpoints already exist for each interval to simulate")
+        warmup = WarmupCkpts(
+            [load(c / "mtr.pickle") for c in checkpoints],
+            [load(c / "imtr.pickle") for c in checkpoints] if args.icache_warmup else None,
+            [load(c / "tlb_mtr.pickle") for c in checkpoints] if args.tlb_warmup else None,
+            [load(c / "bp.pickle") for c in checkpoints] if args.bp_warmup else None,
+        )
+        if not args.trace_cache_data or all(m.track_data for m in warmup.dcache):
+            return warmup
+        logging.info("MTR checkpoints don't hold trace data, regenerating them")
+
+    logging.info(f"Generating MTR checkpoints at inst points {checkpoint_insts}")
+    if args.icache_warmup or args.tlb_warmup or args.bp_warmup:
+        # All the warmup models are built in the same pass over the trace
+        bp_params = BPParams() if args.bp_warmup else None
+        if args.mtr_jobs == 1:
+            with spike_trace_file.open("r") as f:
+                warmup = warmup_ckpts_from_inst_points(
+                    parse_spike_log(f, full_commit_log),
+                    block_size=64,
+                    inst_points=checkpoint_insts,
+                    track_data=args.trace_cache_data,
+                    icache=args.icache_warmup,
+                    tlb=args.tlb_warmup,
+                    bp=bp_params,
+                )
+        else:
+            warmup = warmup_ckpts_from_inst_points_sharded(
+                spike_trace_file,
+                full_commit_log,
+                block_size=64,
+                inst_points=checkpoint_insts,
+                n_jobs=args.mtr_jobs,
+                track_data=args.trace_cache_data,
+                icache=args.icache_warmup,
+                tlb=args.tlb_warmup,
+                bp=bp_params,
+            )
+    elif args.mtr_jobs == 1:
+        with spike_trace_file.open("r") as f:
+            warmup = WarmupCkpts(
+                mtr_ckpts_from_inst_points(
+                    parse_spike_log(f, full_commit_log),
+                    block_size=64,
+                    inst_points=checkpoint_insts,
+                    track_data=args.trace_cache_data,
+                )
+            )
+    else:
+        warmup = WarmupCkpts(
+            mtr_ckpts_from_inst_points_sharded(
+                spike_trace_file,
+                full_commit_log,
+                block_size=64,
+                inst_points=checkpoint_insts,
+                n_jobs=args.mtr_jobs,
+                track_data=args.trace_cache_data,
+            )
+        )
+    for mtr_ckpt, ckpt_dir in zip(warmup.dcache, checkpoints):
+        dump(mtr_ckpt, ckpt_dir / "mtr.pickle")
+        with (ckpt_dir / "mtr.pretty").open("w") as f:
+            pprint.pprint(mtr_ckpt, stream=f)
+    for imtr_ckpt, ckpt_dir in zip(warmup.icache or [], checkpoints):
+        dump(imtr_ckpt, ckpt_dir / "imtr.pickle")
+    for tlb_mtr_ckpt, ckpt_dir in zip(warmup.tlb or [], checkpoints):
+        dump(tlb_mtr_ckpt, ckpt_dir / "tlb_mtr.pickle")
+    for bp_ckpt, ckpt_dir in zip(warmup.bp or [], checkpoints):
+        dump(bp_ckpt, ckpt_dir / "bp.pickle")
+    return warmup
+
+
+# The RTL simulation of the checkpoint in [checkpoint_dir], run by a [JobScheduler]
+# It runs the detailed warmup prefix of [prefix_insts] instructions before the interval and the interval
+def checkpoint_rtl_sim_job(
+    args: argparse.Namespace,
+    backend: SimBackend,
+    prefix_insts: Dict[Path, int],
+    checkpoint_dir: Path,
+) -> SimJob:
+    sim_insts = prefix_insts[checkpoint_dir] + args.interval_length
+    timeout_cycles, timeout_s = rtl_sim_timeouts(
+        sim_insts, args.sim_max_cpi, args.sim_min_cycles_per_s
+    )
+    # Early stopping needs finer perf sample windows to estimate the IPC's variance
+    perf_sample_period = max(
+        1, args.interval_length // (10 if args.early_stop_tolerance is None else 100)
+    )
+    monitor = None
+    if args.early_stop_tolerance is not None and not args.queue_copy_artifacts:
+        monitor = IPCConvergence(
+            checkpoint_dir / "perf.csv",
+            args.early_stop_tolerance,
+            args.early_stop_confidence,
+            args.early_stop_min_windows,
+            prefix_insts[checkpoint_dir],
+        )
+    cmd = backend.cmd(
+        perf_file=(checkpoint_dir / "perf.csv"),
+        perf_sample_period=perf_sample_period,
+        max_instructions=sim_insts,
+        binary=(checkpoint_dir / "mem.elf"),
+        loadarch=(checkpoint_dir / "loadarch"),
+        suppress_exit=True,
+        checkpoint_dir=(checkpoint_dir if args.cache_warmup else None),
+        timeout_cycles=timeout_cycles,
     )
-    # +no_hart0_msip = with loadarch, the target should begin execution immediately without
-    #   an interrupt required to jump out of the bootrom
-    rtl_sim_cmd = (
-        f"{simulator}             +permissive             +dramsim            "
-        f" +dramsim_ini_dir={chipyard_root.resolve()}/generators/testchipip/src/main/resources/dramsim2_ini"
-        "             +no_hart0_msip             +ntb_random_seed_automatic            "
-        f" +max-cycles={timeout_cycles}             +perf-sample-period={perf_sample_period}       "
-        f"      +perf-file={perf_file.resolve()}             {max_insts_str}            "
-        f" +loadmem={binary.resolve()}             +loadarch={loadarch.resolve()}            "
-        f" {checkpoint_dir_str}             +permissive-off            "
-        f" {'+suppress-exit' if suppress_exit else ''}             {binary.resolve()}"
+    return SimJob(
+        name=checkpoint_dir.name,
+        cmd=cmd,
+        cwd=checkpoint_dir,
+        outputs=[checkpoint_dir / "perf.csv"],
+        mem_gb=args.sim_mem_gb,
+        expected_cost=sim_insts,
+        timeout_s=timeout_s,
+        log_file=checkpoint_dir / "rtl_sim.log",
+        monitor=monitor,
+        inputs=ckpt_sim_inputs(checkpoint_dir),
+    )
+
+
+# Take the arch checkpoints at [checkpoint_insts] under [checkpoint_dir] with spike, calling
+# [on_checkpoint] with every checkpoint once it's ready (including the ones a previous run took)
+# With the register checkpoints of the single spike run in [loadarch_dir], the checkpoints are cloned
+# from them and the trace data in [mtr_ckpts] instead, and spike only takes the ones that can't be
+# cloned (see [clone_checkpoints])
+def take_arch_checkpoints(
+    binary: Path,
+    checkpoint_insts: List[int],
+    checkpoint_dir: Path,
+    loadarch_dir: Optional[Path],
+    mtr_ckpts: Optional[List[MTR]],
+    n_harts: int,
+    isa: str,
+    spike_shards: int,
+    executor: Optional[Executor] = None,
+    on_checkpoint: Optional[Callable[[Path], None]] = None,
+) -> None:
+    checkpoints = get_ckpt_dirs(checkpoint_dir, 0x8000_0000, checkpoint_insts)
+    # Cache this result if all the checkpoints are already available
+    if all((c / "loadarch").exists() and (c / "mem.elf").exists() for c in checkpoints):
+        logging.info("Checkpoints already exist, not rerunning spike")
+        if on_checkpoint is not None:
+            for c in checkpoints:
+                on_checkpoint(c)
+        return
+    spike_insts = checkpoint_insts
+    if loadarch_dir is not None:
+        assert mtr_ckpts
+        logging.info("Building arch checkpoints from the register checkpoints and the trace data")
+        spike_insts = clone_checkpoints(
+            binary,
+            loadarch_dir,
+            checkpoint_insts,
+            mtr_ckpts,
+            ckpt_base_dir=checkpoint_dir,
+            on_checkpoint=on_checkpoint,
+        )
+    if spike_insts:
+        logging.info("Generating arch checkpoints with spike")
+        gen_checkpoints(
+            binary,
+            start_pc=0x8000_0000,
+            inst_points=spike_insts,
+            ckpt_base_dir=checkpoint_dir,
+            n_harts=n_harts,
+            isa=isa,
+            n_shards=spike_shards,
+            on_checkpoint=on_checkpoint,
+            executor=executor,
+        )
+
+
+# Reconstruct the caches of every checkpoint in [checkpoints] as described by [params]: the L1d
+# (+ L2) from the [warmup] MTRs of the data accesses and the L1i from the MTRs of the fetches (if any)
+def dump_warmup_caches(
+    checkpoints: List[Path], params: CkptStateParams, warmup: WarmupCkpts
+) -> None:
+    source = "" if params.elf is None else " from the commit log"
+    logging.info(f"Reconstructing L1d state for each checkpoint{source}")
+    if params.l2_params:
+        dump_cache_hierarchy_ckpts(
+            warmup.dcache,
+            checkpoints,
+            params.dcache_params,
+            params.l2_params,
+            inclusive=params.l2_inclusive,
+            fmt=params.fmt,
+            elf=params.elf,
+        )
+    else:
+        dump_dcache_ckpts(
+            warmup.dcache, checkpoints, params.dcache_params, fmt=params.fmt, elf=params.elf
+        )
+    if warmup.icache:
+        logging.info(f"Reconstructing L1i state for each checkpoint{source}")
+        dump_dcache_ckpts(
+            warmup.icache,
+            checkpoints,
+            params.icache_params,
+            fmt=params.fmt,
+            elf=params.elf,
+            cache_name="icache",
+        )
+
+
+# Take the arch checkpoints with [take_checkpoints] (see [take_arch_checkpoints]), then reconstruct
+# the [warmup] state of every checkpoint as described by [params] and run all their RTL simulations
+# (built by [sim_job]), keeping the simulations' status in [checkpoint_dir]
+def run_rtl_sims(
+    checkpoints: List[Path],
+    take_checkpoints: Callable[[], None],
+    params: CkptStateParams,
+    warmup: Optional[WarmupCkpts],
+    sim: SimResources,
+    sim_job: Callable[[Path], SimJob],
+    checkpoint_dir: Path,
+) -> Dict[str, JobStatus]:
+    # With trace data, the cache states don't depend on spike's DRAM dumps, so they can be
+    # reconstructed before (and independently of) spike checkpointing
+    if warmup is not None and params.elf is not None:
+        dump_warmup_caches(checkpoints, params, warmup)
+
+    take_checkpoints()
+
+    # Reconstruct cache states using the MTR checkpoints and the memory bin files dumped from spike
+    if warmup is not None and params.elf is None:
+        dump_warmup_caches(checkpoints, params, warmup)
+
+    # The TLB entries are translated with the page tables in each checkpoint's DRAM dump
+    if warmup is not None and warmup.tlb:
+        assert params.tlb_params is not None
+        logging.info("Reconstructing TLB state for each checkpoint")
+        dtlb_params, itlb_params, l2tlb_params = params.tlb_params
+        dump_tlb_ckpts(
+            warmup.tlb, checkpoints, dtlb_params, itlb_params, l2tlb_params, fmt=params.fmt
+        )
+
+    # Run each checkpoint in RTL sim and extract perf metrics
+    # The scheduler skips the checkpoints whose simulation finished in a previous run
+    logging.info("Running parallel RTL simulations to collect performance metrics for checkpoints")
+    with sim.scheduler(checkpoint_dir / "rtl_sim_status.json") as scheduler:
+        return scheduler.run([sim_job(c) for c in checkpoints])
+
+
+# Same as [run_rtl_sims], but every checkpoint goes through the reconstruction of its warmup state
+# (see [dump_ckpt_state]) and RTL simulation as soon as spike has dumped it (or it's been cloned from
+# the trace), through a [CheckpointPipeline]
+def run_pipelined_rtl_sims(
+    checkpoints: List[Path],
+    take_checkpoints: Callable[[Callable[[Path], None]], None],
+    params: CkptStateParams,
+    warmup: Optional[WarmupCkpts],
+    sim: SimResources,
+    sim_job: Callable[[Path], SimJob],
+    checkpoint_dir: Path,
+) -> Dict[str, JobStatus]:
+    logging.info("Pipelining spike checkpointing, cache reconstruction and RTL simulation")
+    # Only the state of its own checkpoint is sent to each post-processing worker
+    ckpt_states = (
+        {
+            c: (
+                warmup.dcache[i],
+                warmup.icache[i] if warmup.icache else None,
+                warmup.tlb[i] if warmup.tlb else None,
+            )
+            for i, c in enumerate(checkpoints)
+        }
+        if warmup is not None
+        else {}
     )
-    run_cmd(rtl_sim_cmd, cwd)
+    with sim.scheduler(checkpoint_dir / "rtl_sim_status.json") as scheduler:
+        pipeline = CheckpointPipeline(scheduler, sim_job, os.cpu_count() or 1, sim.shared_executor)
+
+        def on_checkpoint(ckpt_dir: Path) -> None:
+            if warmup is not None:
+                mtr, imtr, tlb_mtr = ckpt_states[ckpt_dir]
+                pipeline.checkpoint_ready(
+                    ckpt_dir, dump_ckpt_state, ckpt_dir, params, mtr, imtr, tlb_mtr
+                )
+            else:
+                pipeline.checkpoint_ready(ckpt_dir)
+
+        take_checkpoints(on_checkpoint)
+        return pipeline.wait()
 
 
 def main():
@@ -76,11 +607,54 @@ def main():
     parser.add_argument(
         "--simulator",
         type=str,
-        required=True,
-        help="Path to the RTL simulator binary with state injection support",
+        default=None,
+        help="Path to the RTL simulator binary with state injection support (required with vcs)",
+    )
+    parser.add_argument(
+        "--chipyard-root",
+        type=str,
+        default=None,
+        help="Path to the base of Chipyard (required with vcs)",
+    )
+    parser.add_argument(
+        "--sim-backend",
+        type=str,
+        choices=["vcs", "fake"],
+        default="vcs",
+        help=(
+            "Simulator the checkpoints are replayed on: vcs (the --simulator built by Chipyard) or"
+            " fake (the deterministic stand-in fake-rtl-sim, no RTL needed) [default vcs]"
+        ),
+    )
+    parser.add_argument(
+        "--fake-sim-latency",
+        type=float,
+        default=0.0,
+        help="Seconds the fake simulator takes per perf sample window [default 0]",
     )
     parser.add_argument(
-        "--chipyard-root", type=str, required=True, help="Path to the base of Chipyard"
+        "--job-queue",
+        type=str,
+        default=None,
+        help=(
+            "Job queue directory on storage shared with the simulator farm: the RTL simulations,"
+            " checkpoint conversion and pipelined cache reconstruction are run by the sim-worker"
+            " processes polling it, instead of on this machine [default off]"
+        ),
+    )
+    parser.add_argument(
+        "--queue-copy-artifacts",
+        action="store_true",
+        help=(
+            "The workers don't see the checkpoint directories: copy each RTL simulation's inputs"
+            " and outputs through the job queue, and only run the RTL simulations on the workers"
+        ),
+    )
+    parser.add_argument(
+        "--local-workers",
+        type=int,
+        default=0,
+        help="Start this many sim-worker processes on this machine for --job-queue [default 0]",
     )
     parser.add_argument(
         "--dest-dir", type=str, required=True, help="Directory in which checkpoints are dumped"
@@ -94,6 +668,34 @@ def main():
         action="store_true",
         help="Run full RTL simulation of the binary and save performance metrics",
     )
+    parser.add_argument(
+        "--golden-segment-length",
+        type=int,
+        default=None,
+        help=(
+            "With --golden-sim, split the program into segments of this many instructions (a"
+            " multiple of the interval length) that are simulated concurrently from spike"
+            " checkpoints and stitched together [default one full-length simulation]"
+        ),
+    )
+    parser.add_argument(
+        "--golden-warmup-insts",
+        type=int,
+        default=None,
+        help=(
+            "Instructions before each golden segment that are simulated to warm it up, but not"
+            " counted (a multiple of the interval length) [default the interval length]"
+        ),
+    )
+    parser.add_argument(
+        "--spike-shards",
+        type=int,
+        default=1,
+        help=(
+            "Number of spike processes that take the checkpoints concurrently, -1 for one per"
+            " core [default 1]"
+        ),
+    )
     parser.add_argument(
         "--cache-warmup",
         action="store_true",
@@ -101,21 +703,257 @@ def main():
             "Use functional warmup to initialize the L1d cache at the start of each RTL simulation"
         ),
     )
+    parser.add_argument(
+        "--mtr-jobs",
+        type=int,
+        default=1,
+        help=(
+            "Number of worker processes used to build MTR checkpoints by sharding the trace at"
+            " the checkpoint inst points [default 1 (sequential)]"
+        ),
+    )
+    parser.add_argument(
+        "--icache-warmup",
+        action="store_true",
+        help=(
+            "Also functionally warm up the L1i cache from the fetched PCs in the commit log"
+            " (requires --cache-warmup)"
+        ),
+    )
+    parser.add_argument(
+        "--icache-geometry",
+        type=str,
+        default="64x4",
+        help="L1i geometry to reconstruct from each I-cache MTR checkpoint [default 64x4]",
+    )
+    parser.add_argument(
+        "--l2-warmup",
+        action="store_true",
+        help=(
+            "Also reconstruct the L2 from the L1d MTR checkpoints and dump l2_*_array files"
+            " (requires --cache-warmup)"
+        ),
+    )
+    parser.add_argument(
+        "--l2-geometry",
+        type=str,
+        default="1024x8",
+        help="L2 geometry as <n_sets>x<n_ways> [default 1024x8 (512 KiB)]",
+    )
+    parser.add_argument(
+        "--l2-non-inclusive",
+        action="store_true",
+        help="Reconstruct the L1d independently of the L2 instead of enforcing inclusion",
+    )
+    parser.add_argument(
+        "--tlb-warmup",
+        action="store_true",
+        help=(
+            "Also functionally warm up the TLBs from the commit log and dump the entries"
+            " translated with each checkpoint's page tables (requires --cache-warmup)"
+        ),
+    )
+    parser.add_argument(
+        "--dtlb-geometry", type=str, default="1x32", help="L1 DTLB geometry [default 1x32]"
+    )
+    parser.add_argument(
+        "--itlb-geometry", type=str, default="1x32", help="L1 ITLB geometry [default 1x32]"
+    )
+    parser.add_argument(
+        "--l2tlb-geometry",
+        type=str,
+        default=None,
+        help="L2 TLB geometry, no L2 TLB is dumped if not given [default none]",
+    )
+    parser.add_argument(
+        "--bp-warmup",
+        action="store_true",
+        help=(
+            "Also functionally warm up a Rocket-style branch predictor (BTB/BHT/RAS) from the"
+            " commit log and dump its arrays (requires --cache-warmup)"
+        ),
+    )
+    parser.add_argument(
+        "--trace-cache-data",
+        action="store_true",
+        help=(
+            "Take L1d block data from the store/load data in the full commit log (on top of the"
+            " binary's initial memory image) instead of reading spike's DRAM dumps"
+        ),
+    )
+    parser.add_argument(
+        "--single-spike-run",
+        action="store_true",
+        help=(
+            "Collect the commit log and the register state at every interval in a single spike"
+            " run, and build the checkpoints from those and the trace data instead of running"
+            " spike again (requires --trace-cache-data)"
+        ),
+    )
+    parser.add_argument(
+        "--dcache-geometry",
+        type=str,
+        nargs="+",
+        default=["64x4"],
+        help=(
+            "L1d geometries to reconstruct from each MTR checkpoint as <n_sets>x<n_ways>. The first"
+            " geometry is dumped into the checkpoint directory and, if more than one is given,"
+            " every geometry is also dumped into a dcache.<n_sets>x<n_ways> subdirectory"
+            " [default 64x4]"
+        ),
+    )
+    parser.add_argument(
+        "--reuse-profile",
+        action="store_true",
+        help=(
+            "Run reuse distance analysis over the full commit log and report the miss ratio of"
+            " each L1d geometry (requires --cache-warmup)"
+        ),
+    )
+    parser.add_argument(
+        "--array-format",
+        type=str,
+        choices=["bin", "hex", "raw"],
+        default="bin",
+        help=(
+            "File format of the dumped cache arrays: bin ($readmemb), hex ($readmemh) or raw"
+            " (packed little-endian bytes) [default bin]"
+        ),
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help=(
+            "Reconstruct the caches of each checkpoint and start its RTL simulation as soon as"
+            " spike has dumped it, instead of running every phase for all checkpoints before the"
+            " next"
+        ),
+    )
+    parser.add_argument(
+        "--early-stop-tolerance",
+        type=float,
+        default=None,
+        help=(
+            "Stop each RTL simulation once the confidence interval of its IPC is within this"
+            " fraction of the IPC (e.g. 0.02), instead of always running the full interval"
+            " [default off]"
+        ),
+    )
+    parser.add_argument(
+        "--early-stop-confidence",
+        type=float,
+        default=0.95,
+        help=(
+            "Confidence level of the IPC confidence interval for --early-stop-tolerance [default"
+            " 0.95]"
+        ),
+    )
+    parser.add_argument(
+        "--early-stop-min-windows",
+        type=int,
+        default=10,
+        help=(
+            "Perf sample windows an RTL simulation must run before it can be stopped early"
+            " [default 10]"
+        ),
+    )
+    parser.add_argument(
+        "--detailed-warmup-insts",
+        type=int,
+        default=0,
+        help=(
+            "Place each sampled interval's checkpoint this many instructions before the interval."
+            " The RTL simulation runs them as detailed warmup before the interval, and they're"
+            " excluded from its IPC (a multiple of the interval length with --single-spike-run)"
+            " [default 0]"
+        ),
+    )
+    parser.add_argument(
+        "--sim-mem-gb",
+        type=float,
+        default=12.0,
+        help="Memory used by one RTL simulation in GB [default 12]",
+    )
+    parser.add_argument(
+        "--max-sim-mem-gb",
+        type=float,
+        default=None,
+        help=(
+            "Memory that all concurrent RTL simulations may use in GB [default 90%% of physical"
+            " memory]"
+        ),
+    )
+    parser.add_argument(
+        "--max-sim-jobs",
+        type=int,
+        default=None,
+        help="Maximum number of concurrent RTL simulations [default one per core]",
+    )
+    parser.add_argument(
+        "--sim-attempts",
+        type=int,
+        default=2,
+        help="Number of times a failing RTL simulation is attempted [default 2]",
+    )
+    parser.add_argument(
+        "--sim-max-cpi",
+        type=float,
+        default=20.0,
+        help=(
+            "Cycles per instruction past which an RTL simulation is considered hung, sets"
+            " +max-cycles [default 20]"
+        ),
+    )
+    parser.add_argument(
+        "--sim-min-cycles-per-s",
+        type=float,
+        default=500.0,
+        help=(
+            "Slowest expected RTL simulation speed in cycles/s, sets the wall-clock timeout of"
+            " each simulation along with --sim-max-cpi [default 500]"
+        ),
+    )
     args = parser.parse_args()
 
     # Parse args
     binary = Path(args.binary).resolve()
     binary_name = binary.name
-    simulator = Path(args.simulator).resolve()
-    assert simulator.exists() and simulator.is_file()
-    chipyard_root = Path(args.chipyard_root).resolve()
-    assert chipyard_root.is_dir()
     dest_dir = Path(args.dest_dir).resolve()
     dest_dir.mkdir(exist_ok=True)
     cwd = Path.cwd()
     assert args.interval_length > 1
+    spike_shards = args.spike_shards if args.spike_shards > 0 else (os.cpu_count() or 1)
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
+    sim = sim_resources(args)
+
+    if args.single_spike_run:
+        assert args.trace_cache_data, "--single-spike-run requires --trace-cache-data"
+        assert (
+            args.detailed_warmup_insts % args.interval_length == 0
+        ), "--single-spike-run only has register checkpoints at multiples of the interval length"
+    if args.trace_cache_data:
+        assert args.cache_warmup, "--trace-cache-data requires --cache-warmup"
+    if args.icache_warmup:
+        assert args.cache_warmup, "--icache-warmup requires --cache-warmup"
+    if args.l2_warmup:
+        assert args.cache_warmup, "--l2-warmup requires --cache-warmup"
+    if args.tlb_warmup:
+        assert args.cache_warmup, "--tlb-warmup requires --cache-warmup"
+    if args.bp_warmup:
+        assert args.cache_warmup, "--bp-warmup requires --cache-warmup"
+    dcache_params = [
+        parse_cache_geometry(g, phys_addr_bits=32, block_size_bytes=64)
+        for g in args.dcache_geometry
+    ]
+    l2_params = (
+        parse_cache_geometry(args.l2_geometry, phys_addr_bits=32, block_size_bytes=64)
+        if args.l2_warmup
+        else None
+    )
+    icache_params = [
+        parse_cache_geometry(args.icache_geometry, phys_addr_bits=32, block_size_bytes=64)
+    ]
     logging.info(f"""Tidalsim called with:
     binary = {binary}
     interval_length = {args.interval_length}
@@ -135,9 +973,25 @@ def main():
         (binary_dir / "spike.full_trace") if args.cache_warmup else (binary_dir / "spike.trace")
     )
     full_commit_log = args.cache_warmup
-    if spike_trace_file.exists():
+    # Register checkpoints taken at every interval boundary with --single-spike-run
+    periodic_loadarch_dir = binary_dir / f"n_{args.interval_length}_loadarchs"
+    if spike_trace_file.exists() and (not args.single_spike_run or periodic_loadarch_dir.exists()):
         assert spike_trace_file.is_file()
         logging.info(f"Spike trace file already exists in {spike_trace_file}, not rerunning spike")
+    elif args.single_spike_run:
+        logging.info(
+            f"Running spike once to collect the trace in {spike_trace_file} and register"
+            f" checkpoints every {args.interval_length} instructions in {periodic_loadarch_dir}"
+        )
+        trace_with_periodic_loadarchs(
+            binary,
+            session_dir=binary_dir,
+            trace_file=spike_trace_file,
+            loadarch_dir=periodic_loadarch_dir,
+            period=args.interval_length,
+            n_harts=n_harts,
+            isa=isa,
+        )
     else:
         logging.info(f"Spike trace doesn't exist at {spike_trace_file}, running spike")
         spike_cmd = get_spike_cmd(
@@ -152,39 +1006,18 @@ def main():
         run_cmd_pipe(spike_cmd, cwd=dest_dir, stderr=spike_trace_file)
 
     if args.golden_sim:
-        golden_sim_dir = binary_dir / "golden"
-        golden_sim_dir.mkdir(exist_ok=True)
-        golden_perf_file = golden_sim_dir / "perf.csv"
-        logging.info(f"Running full RTL simulation of {binary} in {golden_sim_dir}")
-
-        if golden_perf_file.exists() and golden_perf_file.is_file():
-            logging.info(
-                f"Golden performance results already exist in {golden_sim_dir}, not-rerunning RTL"
-                " simulation"
-            )
-        else:
-            logging.info(f"Taking spike checkpoint at instruction 0 to inject into RTL simulation")
-            gen_checkpoints(
-                binary,
-                start_pc=0x8000_0000,
-                inst_points=[0],
-                ckpt_base_dir=golden_sim_dir,
-                n_harts=n_harts,
-                isa=isa,
-            )
-            inst_0_ckpt = golden_sim_dir / "0x80000000.0"
-            run_rtl_sim(
-                simulator=simulator,
-                perf_file=golden_perf_file,
-                perf_sample_period=args.interval_length,
-                max_instructions=None,
-                chipyard_root=chipyard_root,
-                binary=(inst_0_ckpt / "mem.elf"),
-                loadarch=(inst_0_ckpt / "loadarch"),
-                suppress_exit=False,
-                checkpoint_dir=None,
-                cwd=golden_sim_dir,
-            )
+        run_golden_sim(
+            args,
+            binary,
+            spike_trace_file,
+            full_commit_log,
+            binary_dir / "golden",
+            dcache_params,
+            sim,
+            n_harts,
+            isa,
+            spike_shards,
+        )
         sys.exit(0)
 
     bb: BasicBlocks
@@ -252,6 +1085,42 @@ def main():
     logging.info(f"BBV embedding dataframe:\n{embedding_df}")
     logging.info(f"BBV embedding # of features: {embedding_df['embedding'][0].size}")
 
+    # Reuse distance histograms and miss ratio curves for the L1d geometries
+    if args.reuse_profile:
+        assert args.cache_warmup, "Reuse distance analysis requires the full commit log"
+        reuse_profiles_file = embedding_dir / "reuse_profiles.pickle"
+        block_size_bytes = dcache_params[0].block_size_bytes
+        assert all(p.block_size_bytes == block_size_bytes for p in dcache_params)
+        # Each profile records the set count (and block size) it was computed for, so profiles
+        # saved by a run with other L1d geometries are reused and only the missing ones are computed
+        reuse_profiles: List[ReuseProfile] = []
+        if reuse_profiles_file.exists():
+            logging.info(f"Loading reuse distance profiles from {reuse_profiles_file}")
+            reuse_profiles = [
+                profile
+                for profile in load(reuse_profiles_file)
+                if profile.block_size_bytes == block_size_bytes
+                and profile.interval_length == args.interval_length
+            ]
+        set_counts = {1} | {p.n_sets for p in dcache_params}
+        missing_set_counts = sorted(set_counts - {profile.n_sets for profile in reuse_profiles})
+        if missing_set_counts:
+            logging.info(f"Running reuse distance analysis for set counts {missing_set_counts}")
+            with spike_trace_file.open("r") as f:
+                spike_trace_log = parse_spike_log(f, full_commit_log)
+                reuse_profiles += reuse_profiles_from_spike_log(
+                    spike_trace_log,
+                    block_size_bytes=block_size_bytes,
+                    interval_length=args.interval_length,
+                    set_counts=missing_set_counts,
+                )
+            dump(reuse_profiles, reuse_profiles_file)
+            logging.info(f"Saving reuse distance profiles to {reuse_profiles_file}")
+        profile_for_sets = {profile.n_sets: profile for profile in reuse_profiles}
+        for params in dcache_params:
+            miss_ratio = profile_for_sets[params.n_sets].miss_ratio(params.n_ways)
+            logging.info(f"L1d {params.geometry_str()} miss ratio (LRU): {miss_ratio:.4f}")
+
     # Perform clustering and select centroids
     cluster_dir = embedding_dir / f"c_{args.clusters}"
     cluster_dir.mkdir(exist_ok=True)
@@ -301,86 +1170,85 @@ def main():
     logging.info(f"The following rows are closest to the cluster centroids\n{to_simulate}")
 
     # Create the directories for each interval we want to simulate in RTL simulation
-    checkpoint_insts: List[int] = to_simulate["inst_start"].tolist()
+    # Each checkpoint is placed --detailed-warmup-insts before its interval
+    interval_starts: List[int] = to_simulate["inst_start"].tolist()
+    checkpoint_insts = place_checkpoints(
+        interval_starts, args.detailed_warmup_insts, args.interval_length
+    )
     checkpoint_dir = cluster_dir / "checkpoints"
     checkpoint_dir.mkdir(exist_ok=True)
+    write_sample_placement(checkpoint_dir, interval_starts, checkpoint_insts)
     checkpoints = [checkpoint_dir / f"0x80000000.{i}" for i in checkpoint_insts]
     for c in checkpoints:
         c.mkdir(exist_ok=True)
 
-    # Construct MTR checkpoints for the L1d cache
-    mtr_ckpts: Optional[List[MTR]] = None
+    # Construct MTR checkpoints for the L1d cache (and the L1i cache with --icache-warmup, the TLBs with
+    # --tlb-warmup and the branch predictor with --bp-warmup)
+    warmup: Optional[WarmupCkpts] = None
     if args.cache_warmup:
-        mtr_ckpts_exist = [(c / "mtr.pickle").exists() for c in checkpoints]
-        if all(mtr_ckpts_exist):
-            logging.info(f"MTR checkpoints already exist for each interval to simulate")
-            mtr_ckpts = [load(c / "mtr.pickle") for c in checkpoints]
-        else:
-            logging.info(f"Generating MTR checkpoints at inst points {checkpoint_insts}")
-            with spike_trace_file.open("r") as f:
-                spike_trace_log = parse_spike_log(f, full_commit_log)
-                mtr_ckpts = mtr_ckpts_from_inst_points(
-                    spike_trace_log, block_size=64, inst_points=checkpoint_insts
-                )
-            for mtr_ckpt, ckpt_dir in zip(mtr_ckpts, checkpoints):
-                dump(mtr_ckpt, ckpt_dir / "mtr.pickle")
-                with (ckpt_dir / "mtr.pretty").open("w") as f:
-                    pprint.pprint(mtr_ckpt, stream=f)
+        warmup = gen_warmup_ckpts(
+            args, spike_trace_file, full_commit_log, checkpoints, checkpoint_insts
+        )
+        # The branch predictor state only depends on the trace
+        if warmup.bp:
+            logging.info("Dumping branch predictor state for each checkpoint")
+            for bp_ckpt, ckpt_dir in zip(warmup.bp, checkpoints):
+                bp_ckpt.dump(ckpt_dir, ArrayFormat[args.array_format.capitalize()])
 
-    # Capture arch checkpoints from spike
-    # Cache this result if all the checkpoints are already available
-    checkpoints_exist = [
-        (c / "loadarch").exists() and (c / "mem.elf").exists() for c in checkpoints
-    ]
-    if all(checkpoints_exist):
-        logging.info("Checkpoints already exist, not rerunning spike")
-    else:
-        logging.info("Generating arch checkpoints with spike")
-        gen_checkpoints(
+    # Each checkpoint's RTL simulation runs the detailed warmup prefix before the interval and the
+    # interval itself
+    prefix_insts = {
+        c: start - ckpt_inst
+        for c, start, ckpt_inst in zip(checkpoints, interval_starts, checkpoint_insts)
+    }
+    sim_job = functools.partial(checkpoint_rtl_sim_job, args, sim.backend, prefix_insts)
+    ckpt_state_params = CkptStateParams(
+        dcache_params,
+        icache_params,
+        l2_params,
+        not args.l2_non_inclusive,
+        (
+            (
+                parse_tlb_geometry(args.dtlb_geometry),
+                parse_tlb_geometry(args.itlb_geometry),
+                parse_tlb_geometry(args.l2tlb_geometry) if args.l2tlb_geometry else None,
+            )
+            if args.tlb_warmup
+            else None
+        ),
+        ArrayFormat[args.array_format.capitalize()],
+        binary if args.trace_cache_data else None,
+    )
+
+    # Take the arch checkpoints at [checkpoint_insts] with the register checkpoints of the single spike
+    # run (if any), calling [on_checkpoint] with each checkpoint once it's ready
+    def take_checkpoints(on_checkpoint: Optional[Callable[[Path], None]] = None) -> None:
+        take_arch_checkpoints(
             binary,
-            start_pc=0x8000_0000,
-            inst_points=checkpoint_insts,
-            ckpt_base_dir=checkpoint_dir,
-            n_harts=n_harts,
-            isa=isa,
+            checkpoint_insts,
+            checkpoint_dir,
+            periodic_loadarch_dir if args.single_spike_run else None,
+            warmup.dcache if warmup else None,
+            n_harts,
+            isa,
+            spike_shards,
+            sim.shared_executor,
+            on_checkpoint,
         )
 
-    # TODO: Reconstruct cache states using the MTR checkpoints and the memory bin files dumped from spike
-    if args.cache_warmup:
-        assert mtr_ckpts
-        cache_params = CacheParams(phys_addr_bits=32, block_size_bytes=64, n_sets=64, n_ways=4)
-        for mtr, ckpt_dir in zip(mtr_ckpts, checkpoints):
-            cache_state: CacheState
-            with (ckpt_dir / "mem.0x80000000.bin").open("rb") as f:
-                cache_state = mtr.as_cache(cache_params, f, dram_base=0x8000_0000)
-            cache_state.dump_data_arrays(ckpt_dir, "dcache_data_array")
-            cache_state.dump_tag_arrays(ckpt_dir, "dcache_tag_array")
-
-    # Run each checkpoint in RTL sim and extract perf metrics
-    perf_files_exist = all([(c / "perf.csv").exists() for c in checkpoints])
-    if perf_files_exist:
-        logging.info(
-            "Performance metrics for checkpoints already collected, skipping RTL simulation"
+    status: Dict[str, JobStatus]
+    if args.pipeline:
+        status = run_pipelined_rtl_sims(
+            checkpoints, take_checkpoints, ckpt_state_params, warmup, sim, sim_job, checkpoint_dir
         )
     else:
-        logging.info(
-            "Running parallel RTL simulations to collect performance metrics for checkpoints"
+        status = run_rtl_sims(
+            checkpoints, take_checkpoints, ckpt_state_params, warmup, sim, sim_job, checkpoint_dir
         )
 
-        def run_checkpoint_rtl_sim(checkpoint_dir: Path) -> None:
-            run_rtl_sim(
-                simulator=simulator,
-                perf_file=(checkpoint_dir / "perf.csv"),
-                perf_sample_period=int(args.interval_length / 10),
-                max_instructions=args.interval_length,
-                chipyard_root=chipyard_root,
-                binary=(checkpoint_dir / "mem.elf"),
-                loadarch=(checkpoint_dir / "loadarch"),
-                suppress_exit=True,
-                checkpoint_dir=(checkpoint_dir if args.cache_warmup else None),
-                cwd=checkpoint_dir,
-            )
-
-        Parallel(n_jobs=-1)(
-            delayed(run_checkpoint_rtl_sim)(checkpoint) for checkpoint in checkpoints
+    failed = failed_jobs(status)
+    if len(failed) > 0:
+        raise RuntimeError(
+            f"RTL simulation of checkpoints {', '.join(failed)} failed (see rtl_sim.log in each"
+            " checkpoint directory), rerunning will only simulate the unfinished checkpoints"
         )
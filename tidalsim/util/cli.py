@@ -3,6 +3,7 @@ import fileinput
 import sys
 from pathlib import Path
 import logging
+from typing import Iterator
 
 
 def run_cmd(cmd: str, cwd: Path) -> subprocess.CompletedProcess:
@@ -36,3 +37,14 @@ def run_cmd_pipe_stdout(cmd: str, cwd: Path, stdout: Path) -> subprocess.Complet
         result = subprocess.run(cmd, shell=True, stdout=stdout_file, cwd=cwd)
         assert result.returncode == 0, f"{cmd} failed with returncode {result.returncode}"
         return result
+
+
+# Run [cmd] and yield the lines it prints on stderr as they're printed
+def run_cmd_stream_stderr(cmd: str, cwd: Path) -> Iterator[str]:
+    logging.info(f'Running "{cmd}" and streaming stderr')
+    with subprocess.Popen(
+        cmd, shell=True, stdout=sys.stdout, stderr=subprocess.PIPE, cwd=cwd, text=True
+    ) as proc:
+        assert proc.stderr is not None
+        yield from proc.stderr
+    assert proc.returncode == 0, f"{cmd} failed with returncode {proc.returncode}"
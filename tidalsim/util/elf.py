@@ -0,0 +1,282 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+import struct
+
+import numpy as np
+
+# A minimal reader for little-endian ELF64 files (e.g. RISC-V binaries)
+# Spec: https://refspecs.linuxfoundation.org/elf/gabi4+/ch4.eheader.html
+
+PT_LOAD = 1
+PF_X, PF_W, PF_R = 1, 2, 4
+SHT_PROGBITS, SHT_SYMTAB, SHT_STRTAB = 1, 2, 3
+SHF_WRITE, SHF_ALLOC, SHF_EXECINSTR = 1, 2, 4
+SHN_ABS = 0xFFF1
+STB_GLOBAL = 1
+EM_RISCV = 243
+ET_EXEC = 2
+
+EHDR_SIZE, PHDR_SIZE, SHDR_SIZE, SYM_SIZE = 64, 56, 64, 24
+
+
+@dataclass
+class ElfSegment:
+    # physical address the segment is loaded at
+    paddr: int
+    # segment contents, zero-filled up to the segment's size in memory
+    # (any bytes-like object, e.g. a slice of a memory-mapped DRAM image, when writing an ELF)
+    data: Union[bytes, np.ndarray]
+
+
+@dataclass
+class ElfHeader:
+    e_type: int
+    e_machine: int
+    e_entry: int
+    e_phoff: int
+    e_shoff: int
+    e_flags: int
+    e_phentsize: int
+    e_phnum: int
+    e_shentsize: int
+    e_shnum: int
+    e_shstrndx: int
+
+
+def read_elf_header(raw: bytes) -> ElfHeader:
+    if raw[:4] != b"\x7fELF":
+        raise RuntimeError("Not an ELF file")
+    if raw[4] != 2 or raw[5] != 1:
+        raise RuntimeError("Only little-endian ELF64 files are supported")
+    (
+        e_type,
+        e_machine,
+        _e_version,
+        e_entry,
+        e_phoff,
+        e_shoff,
+        e_flags,
+        _e_ehsize,
+        e_phentsize,
+        e_phnum,
+        e_shentsize,
+        e_shnum,
+        e_shstrndx,
+    ) = struct.unpack_from("<HHIQQQIHHHHHH", raw, 16)
+    return ElfHeader(
+        e_type,
+        e_machine,
+        e_entry,
+        e_phoff,
+        e_shoff,
+        e_flags,
+        e_phentsize,
+        e_phnum,
+        e_shentsize,
+        e_shnum,
+        e_shstrndx,
+    )
+
+
+# Return every PT_LOAD segment in [elf]
+def read_elf_segments(elf: Path) -> List[ElfSegment]:
+    raw = elf.read_bytes()
+    header = read_elf_header(raw)
+    segments: List[ElfSegment] = []
+    for i in range(header.e_phnum):
+        p_type, _p_flags, p_offset, _p_vaddr, p_paddr, p_filesz, p_memsz, _p_align = (
+            struct.unpack_from("<IIQQQQQQ", raw, header.e_phoff + i * header.e_phentsize)
+        )
+        if p_type != PT_LOAD or p_memsz == 0:
+            continue
+        data = raw[p_offset : p_offset + p_filesz] + bytes(p_memsz - p_filesz)
+        segments.append(ElfSegment(p_paddr, data))
+    return segments
+
+
+# The initial contents of memory starting at [base] after loading [elf], as a dense array that ends at the
+# last loaded byte. Segments below [base] (e.g. in the bootrom) are ignored.
+def elf_memory_image(elf: Path, base: int = 0x8000_0000) -> np.ndarray:
+    segments = [s for s in read_elf_segments(elf) if s.paddr >= base]
+    end = max([s.paddr + len(s.data) for s in segments], default=base)
+    image = np.zeros(end - base, dtype=np.uint8)
+    for segment in segments:
+        offset = segment.paddr - base
+        image[offset : offset + len(segment.data)] = np.frombuffer(segment.data, dtype=np.uint8)
+    return image
+
+
+# Return the value of every named symbol in [elf]'s symbol table
+def read_elf_symbols(elf: Path) -> Dict[str, int]:
+    raw = elf.read_bytes()
+    header = read_elf_header(raw)
+
+    # (sh_type, sh_offset, sh_size, sh_link) of section [i]
+    def section(i: int) -> Tuple[int, int, int, int]:
+        _sh_name, sh_type, _sh_flags, _sh_addr, sh_offset, sh_size, sh_link = struct.unpack_from(
+            "<IIQQQQI", raw, header.e_shoff + i * header.e_shentsize
+        )
+        return sh_type, sh_offset, sh_size, sh_link
+
+    symbols: Dict[str, int] = {}
+    for i in range(header.e_shnum):
+        sh_type, sh_offset, sh_size, sh_link = section(i)
+        if sh_type != SHT_SYMTAB:
+            continue
+        _, strtab_offset, _, _ = section(sh_link)
+        for sym_offset in range(sh_offset, sh_offset + sh_size, SYM_SIZE):
+            st_name, _st_info, _st_other, _st_shndx, st_value, _st_size = struct.unpack_from(
+                "<IBBHQQ", raw, sym_offset
+            )
+            if st_name == 0:
+                continue
+            name_end = raw.index(b"\x00", strtab_offset + st_name)
+            symbols[raw[strtab_offset + st_name : name_end].decode()] = st_value
+    return symbols
+
+
+# A string table with the offset of every string in it
+class _StrTab:
+    def __init__(self) -> None:
+        self.data = b"\x00"
+
+    def add(self, s: str) -> int:
+        offset = len(self.data)
+        self.data += s.encode() + b"\x00"
+        return offset
+
+
+# Write a RISC-V ELF64 executable to [elf] that loads every segment in [segments] at its physical address,
+# with absolute global [symbols] (e.g. tohost/fromhost). This is what objcopy -I binary + ld produce for a
+# raw memory image: each segment is a writable and executable PT_LOAD segment backed by its own section.
+# The segment data is streamed straight into the file, so it can be a view of a memory-mapped image.
+def write_elf(
+    elf: Path, segments: List[ElfSegment], symbols: Dict[str, int], entry: int = 0x8000_0000
+) -> None:
+    page_size = 0x1000
+    phoff = EHDR_SIZE
+
+    # File offsets of the segments, congruent to their addresses modulo the page size
+    offsets: List[int] = []
+    offset = phoff + PHDR_SIZE * len(segments)
+    for segment in segments:
+        offset += (segment.paddr - offset) % page_size
+        offsets.append(offset)
+        offset += len(segment.data)
+
+    shstrtab = _StrTab()
+    strtab = _StrTab()
+    symtab = bytes(SYM_SIZE)  # the null symbol
+    for name, value in symbols.items():
+        symtab += struct.pack("<IBBHQQ", strtab.add(name), STB_GLOBAL << 4, 0, SHN_ABS, value, 0)
+    section_names = [shstrtab.add(f".mem.{hex(segment.paddr)}") for segment in segments]
+    symtab_name, strtab_name, shstrtab_name = (
+        shstrtab.add(".symtab"),
+        shstrtab.add(".strtab"),
+        shstrtab.add(".shstrtab"),
+    )
+    symtab_offset = offset + (-offset % 8)
+    strtab_offset = symtab_offset + len(symtab)
+    shstrtab_offset = strtab_offset + len(strtab.data)
+    shoff = shstrtab_offset + len(shstrtab.data)
+    shoff += -shoff % 8
+    # null section, one section per segment, .symtab, .strtab, .shstrtab
+    shnum = 1 + len(segments) + 3
+    strtab_idx = len(segments) + 2
+
+    def shdr(
+        name: int,
+        sh_type: int,
+        flags: int,
+        addr: int,
+        offset: int,
+        size: int,
+        link: int,
+        info: int,
+        align: int,
+        entsize: int,
+    ) -> bytes:
+        return struct.pack(
+            "<IIQQQQIIQQ", name, sh_type, flags, addr, offset, size, link, info, align, entsize
+        )
+
+    with elf.open("wb") as f:
+        f.write(b"\x7fELF" + bytes([2, 1, 1]) + bytes(9))
+        f.write(
+            struct.pack(
+                "<HHIQQQIHHHHHH",
+                ET_EXEC,
+                EM_RISCV,
+                1,
+                entry,
+                phoff,
+                shoff,
+                0,
+                EHDR_SIZE,
+                PHDR_SIZE,
+                len(segments),
+                SHDR_SIZE,
+                shnum,
+                shnum - 1,
+            )
+        )
+        for segment, seg_offset in zip(segments, offsets):
+            size = len(segment.data)
+            f.write(
+                struct.pack(
+                    "<IIQQQQQQ",
+                    PT_LOAD,
+                    PF_R | PF_W | PF_X,
+                    seg_offset,
+                    segment.paddr,
+                    segment.paddr,
+                    size,
+                    size,
+                    page_size,
+                )
+            )
+        for segment, seg_offset in zip(segments, offsets):
+            f.write(bytes(seg_offset - f.tell()))
+            # Arrays (e.g. slices of a memory-mapped image) are written through their memoryview, uncopied
+            f.write(segment.data if isinstance(segment.data, bytes) else segment.data.data)
+        f.write(bytes(symtab_offset - f.tell()))
+        f.write(symtab)
+        f.write(strtab.data)
+        f.write(shstrtab.data)
+        f.write(bytes(shoff - f.tell()))
+        f.write(bytes(SHDR_SIZE))
+        for segment, seg_offset, name in zip(segments, offsets, section_names):
+            f.write(
+                shdr(
+                    name,
+                    SHT_PROGBITS,
+                    SHF_WRITE | SHF_ALLOC | SHF_EXECINSTR,
+                    segment.paddr,
+                    seg_offset,
+                    len(segment.data),
+                    0,
+                    0,
+                    1,
+                    0,
+                )
+            )
+        # sh_info of the symbol table is the index of the first global symbol
+        f.write(
+            shdr(
+                symtab_name,
+                SHT_SYMTAB,
+                0,
+                0,
+                symtab_offset,
+                len(symtab),
+                strtab_idx,
+                1,
+                8,
+                SYM_SIZE,
+            )
+        )
+        f.write(shdr(strtab_name, SHT_STRTAB, 0, 0, strtab_offset, len(strtab.data), 0, 0, 1, 0))
+        f.write(
+            shdr(shstrtab_name, SHT_STRTAB, 0, 0, shstrtab_offset, len(shstrtab.data), 0, 0, 1, 0)
+        )
@@ -0,0 +1,310 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+
+# Executors run Python functions (checkpoint conversion, cache reconstruction, RTL simulation jobs)
+# either in a local process pool or on workers on other machines.
+#
+# [QueueExecutor] talks to its workers through a job queue in a directory on storage they all share:
+#   <queue_dir>/tasks/<id>.task                pickled [Task]s waiting for a worker
+#   <queue_dir>/claimed/<id>.task@<worker>     a worker claims a task by renaming it here, the rename is
+#                                              atomic so every task is claimed by a single worker
+#   <queue_dir>/results/<id>.result            the pickled [TaskResult], written by the worker
+#   <queue_dir>/workers/<worker>               touched periodically by every live worker
+# Tasks claimed by a worker that stopped touching its heartbeat file are put back in tasks/.
+# Artifacts are passed by path, so the paths in a task's arguments must be on shared storage, unless
+# the executor copies them: the task then carries the contents of its input files (which overwrite
+# the worker's copies unless they're the same) and the result carries the contents of its outputs.
+
+
+class Executor(ABC):
+    # Run [fn](*args) and return its future. [inputs] are the files [fn] reads and [outputs] the
+    # files it writes, for executors that copy artifacts to and from their workers.
+    @abstractmethod
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        inputs: Sequence[Path] = (),
+        outputs: Sequence[Path] = (),
+    ) -> Future:
+        pass
+
+    # Wait for every submitted task to finish and release the executor
+    @abstractmethod
+    def shutdown(self) -> None:
+        pass
+
+    def __enter__(self) -> "Executor":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.shutdown()
+
+
+# Runs tasks in a pool of [n_workers] processes on this machine
+class LocalExecutor(Executor):
+    def __init__(self, n_workers: int) -> None:
+        # Tasks are often submitted from threads (e.g. ones reading spike's output), so don't fork
+        self.pool = ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        inputs: Sequence[Path] = (),
+        outputs: Sequence[Path] = (),
+    ) -> Future:
+        return self.pool.submit(fn, *args)
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=True)
+
+
+@dataclass
+class Task:
+    fn: Callable[..., Any]
+    args: tuple
+    # map of path -> contents of the input files, only when copying artifacts
+    inputs: Dict[str, bytes] = field(default_factory=lambda: {})
+    # output files to send back with the result, only when copying artifacts
+    outputs: List[str] = field(default_factory=lambda: [])
+
+
+@dataclass
+class TaskResult:
+    value: Any = None
+    error: Optional[BaseException] = None
+    # map of path -> contents of the task's output files
+    outputs: Dict[str, bytes] = field(default_factory=lambda: {})
+    worker: str = ""
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f".{path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def _queue_dirs(queue_dir: Path) -> Dict[str, Path]:
+    dirs = {name: queue_dir / name for name in ["tasks", "claimed", "results", "workers"]}
+    for d in dirs.values():
+        d.mkdir(parents=True, exist_ok=True)
+    return dirs
+
+
+# Dispatches tasks to the workers (see [run_queue_worker]) polling the job queue in [queue_dir]
+# If [copy_artifacts], the tasks' input and output files are copied through the queue instead of being
+# accessed by path on shared storage. A task claimed by a worker whose heartbeat is older than
+# [worker_timeout_s] is requeued.
+class QueueExecutor(Executor):
+    def __init__(
+        self,
+        queue_dir: Path,
+        copy_artifacts: bool = False,
+        poll_interval_s: float = 0.2,
+        worker_timeout_s: float = 60.0,
+    ) -> None:
+        self.dirs = _queue_dirs(queue_dir)
+        self.copy_artifacts = copy_artifacts
+        self.poll_interval_s = poll_interval_s
+        self.worker_timeout_s = worker_timeout_s
+        self.futures: Dict[str, Future] = {}
+        self.cv = threading.Condition()
+        self.closed = False
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        inputs: Sequence[Path] = (),
+        outputs: Sequence[Path] = (),
+    ) -> Future:
+        task = Task(fn, args)
+        if self.copy_artifacts:
+            task.inputs = {str(path): path.read_bytes() for path in inputs}
+            task.outputs = [str(path) for path in outputs]
+        # Task ids sort in submission order, workers take the oldest task first
+        task_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        future: Future = Future()
+        with self.cv:
+            assert not self.closed, "Can't submit tasks to a closed executor"
+            self.futures[task_id] = future
+        _write_atomic(self.dirs["tasks"] / f"{task_id}.task", pickle.dumps(task))
+        return future
+
+    # Resolve [future] with the result of its task [task_id] in [result_file]
+    def _collect_result(self, task_id: str, future: Future, result_file: Path) -> None:
+        result: TaskResult = pickle.loads(result_file.read_bytes())
+        for path, contents in result.outputs.items():
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            _write_atomic(Path(path), contents)
+        result_file.unlink()
+        if result.error is not None:
+            logging.error(f"Task {task_id} failed on {result.worker}: {result.error}")
+            future.set_exception(result.error)
+        else:
+            future.set_result(result.value)
+
+    # Put the tasks among [task_ids] (submitted by this executor) that were claimed by workers that
+    # have died back in the queue. A worker that hasn't touched its heartbeat file yet is given
+    # [worker_timeout_s] from the time it claimed the task.
+    def _requeue_stale_claims(self, task_ids: Set[str]) -> None:
+        now = time.time()
+        for claim in self.dirs["claimed"].iterdir():
+            task_name, _, worker = claim.name.partition("@")
+            if task_name.removesuffix(".task") not in task_ids:
+                continue
+            try:
+                last_seen = (self.dirs["workers"] / worker).stat().st_mtime
+            except FileNotFoundError:
+                try:
+                    # Renaming the task into claimed/ updates its ctime
+                    last_seen = claim.stat().st_ctime
+                except FileNotFoundError:
+                    continue  # the worker finished
+            if now - last_seen >= self.worker_timeout_s:
+                logging.warning(f"Worker {worker} died while running {task_name}, requeuing it")
+                try:
+                    claim.rename(self.dirs["tasks"] / task_name)
+                except FileNotFoundError:
+                    pass  # the worker finished after all
+
+    def _collect(self) -> None:
+        while True:
+            with self.cv:
+                results = {
+                    task_id: self.dirs["results"] / f"{task_id}.result" for task_id in self.futures
+                }
+                finished = {
+                    task_id: self.futures.pop(task_id)
+                    for task_id, result_file in results.items()
+                    if result_file.exists()
+                }
+            # Resolve the futures without holding the lock, their callbacks may submit more tasks
+            for task_id, future in finished.items():
+                self._collect_result(task_id, future, results[task_id])
+            if len(results) > len(finished):
+                self._requeue_stale_claims(set(results) - set(finished))
+            with self.cv:
+                if self.closed and len(self.futures) == 0:
+                    return
+                self.cv.wait(self.poll_interval_s)
+
+    def shutdown(self) -> None:
+        with self.cv:
+            self.closed = True
+            self.cv.notify_all()
+        self.collector.join()
+
+
+# Run a worker named [name] that takes tasks from the job queue in [queue_dir] until a file named 'stop'
+# appears in [queue_dir], or once it's been idle for [idle_exit_s] (if given)
+def run_queue_worker(
+    queue_dir: Path,
+    name: Optional[str] = None,
+    poll_interval_s: float = 0.2,
+    idle_exit_s: Optional[float] = None,
+) -> None:
+    name = name or f"{socket.gethostname()}.{os.getpid()}"
+    dirs = _queue_dirs(queue_dir)
+    heartbeat = dirs["workers"] / name
+    heartbeat.touch()
+    stopped = threading.Event()
+
+    # Keep the heartbeat fresh while running long tasks
+    def beat() -> None:
+        while not stopped.wait(poll_interval_s):
+            heartbeat.touch()
+
+    threading.Thread(target=beat, daemon=True).start()
+    logging.info(f"Worker {name} polling {queue_dir}")
+    idle_since = time.monotonic()
+    try:
+        while not (queue_dir / "stop").exists():
+            claim = _claim_task(dirs, name)
+            if claim is None:
+                if idle_exit_s is not None and time.monotonic() - idle_since > idle_exit_s:
+                    return
+                time.sleep(poll_interval_s)
+                continue
+            _run_task(dirs, claim, name)
+            idle_since = time.monotonic()
+    finally:
+        stopped.set()
+        heartbeat.unlink(missing_ok=True)
+
+
+def _claim_task(dirs: Dict[str, Path], name: str) -> Optional[Path]:
+    for task_file in sorted(dirs["tasks"].glob("*.task")):
+        claim = dirs["claimed"] / f"{task_file.name}@{name}"
+        try:
+            task_file.rename(claim)
+            return claim
+        except FileNotFoundError:
+            continue  # another worker claimed it first
+    return None
+
+
+def _run_task(dirs: Dict[str, Path], claim: Path, name: str) -> None:
+    task_id = claim.name.partition(".task@")[0]
+    result = TaskResult(worker=name)
+    try:
+        task: Task = pickle.loads(claim.read_bytes())
+        # The worker's copy of an input may be stale (e.g. a regenerated checkpoint), so it's
+        # overwritten unless it has the same contents
+        for path, contents in task.inputs.items():
+            if not Path(path).exists() or Path(path).read_bytes() != contents:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                _write_atomic(Path(path), contents)
+        result.value = task.fn(*task.args)
+        result.outputs = {path: Path(path).read_bytes() for path in task.outputs}
+    except Exception as e:
+        result.error = e
+    try:
+        data = pickle.dumps(result)
+    except Exception as e:
+        data = pickle.dumps(
+            TaskResult(error=RuntimeError(f"Unpicklable task result: {e}"), worker=name)
+        )
+    _write_atomic(dirs["results"] / f"{task_id}.result", data)
+    claim.unlink(missing_ok=True)
+
+
+# [n_workers] queue workers on this machine, a stand-in for the workers on a simulator farm
+class LocalQueueWorkers:
+    def __init__(self, queue_dir: Path, n_workers: int, poll_interval_s: float = 0.2) -> None:
+        ctx = multiprocessing.get_context("spawn")
+        self.workers = [
+            ctx.Process(
+                target=run_queue_worker,
+                args=(queue_dir, f"{socket.gethostname()}.local{i}", poll_interval_s),
+                daemon=True,
+            )
+            for i in range(n_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def close(self) -> None:
+        for worker in self.workers:
+            worker.terminate()
+            worker.join()
+
+    def __enter__(self) -> "LocalQueueWorkers":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
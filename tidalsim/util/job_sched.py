@@ -0,0 +1,366 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, asdict
+from enum import Enum
+from pathlib import Path
+from concurrent.futures import Future
+from typing import Dict, IO, List, Optional, Tuple
+import json
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from tidalsim.util.executor import Executor
+
+# A scheduler for long-running simulator processes (e.g. one RTL simulation per checkpoint)
+# Jobs are started only when the memory and CPUs they declare fit within the scheduler's limits, the
+# longest expected jobs first. Each job has a wall-clock timeout and a bounded number of attempts, and a
+# failing job doesn't stop the others. The status of every job is persisted in a json file, so when the
+# same jobs are submitted again, the ones that already finished (and whose outputs still exist) are skipped.
+# A job can also be stopped early, as a success, by its [JobMonitor].
+# Jobs are run as subprocesses of the scheduler, or by an [Executor] (e.g. on the workers of a simulator
+# farm) through [run_job_cmd], in which case the job's timeout is enforced by its worker.
+
+
+# Watches a running job (e.g. the output it's writing) and decides whether it can be stopped early
+class JobMonitor(ABC):
+    # Called when an attempt of the job starts
+    def start(self) -> None:
+        pass
+
+    # Called periodically while the job runs, returns the reason to stop the job, or None to keep going
+    @abstractmethod
+    def poll(self) -> Optional[str]:
+        pass
+
+    # Called after the job was killed because [poll] returned a reason
+    def stop(self) -> None:
+        pass
+
+
+class JobState(Enum):
+    Pending = "pending"
+    Running = "running"
+    Done = "done"
+    Failed = "failed"
+
+
+@dataclass
+class SimJob:
+    # unique name of the job, the key in the status file
+    name: str
+    cmd: str
+    cwd: Path
+    # files the job must produce to be considered done
+    outputs: List[Path] = field(default_factory=lambda: [])
+    mem_gb: float = 0.0
+    cpus: int = 1
+    # relative runtime of the job (e.g. the number of simulated instructions), longest jobs start first
+    expected_cost: float = 0.0
+    # wall-clock timeout, None for no timeout
+    timeout_s: Optional[float] = None
+    # file that gets the job's stdout and stderr, inherit the scheduler's stdout if None
+    log_file: Optional[Path] = None
+    # stops the job early (as a success) once it has produced enough
+    monitor: Optional[JobMonitor] = None
+    # files the job reads, copied to the worker by executors that don't share storage with it
+    inputs: List[Path] = field(default_factory=lambda: [])
+
+
+@dataclass
+class JobStatus:
+    state: JobState = JobState.Pending
+    attempts: int = 0
+    returncode: Optional[int] = None
+    runtime_s: float = 0.0
+    # why the last attempt failed (e.g. a timeout or a missing output)
+    reason: str = ""
+    # why the job was stopped early by its monitor
+    stop_reason: str = ""
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "state": self.state.value}
+
+    @staticmethod
+    def from_dict(d: Dict) -> "JobStatus":
+        return JobStatus(**{**d, "state": JobState(d["state"])})
+
+
+@dataclass
+class _RunningJob:
+    job: SimJob
+    start_time: float
+    # the job's process when it's run by the scheduler
+    proc: Optional[subprocess.Popen] = None
+    log: Optional[IO] = None
+    # the job's [run_job_cmd] when it's run by an executor
+    future: Optional[Future] = None
+    # why the monitor asked the executor's job to stop, once it has
+    stop_reason: Optional[str] = None
+
+
+# Run [cmd] in [cwd] to completion, with its stdout and stderr in [log_file] (if given). Its process group
+# is killed after [timeout_s] or as soon as [stop_file] appears. Returns the returncode and why the
+# command was killed ("" if it wasn't). This is how an [Executor] runs a [SimJob].
+def run_job_cmd(
+    cmd: str,
+    cwd: Path,
+    log_file: Optional[Path],
+    timeout_s: Optional[float],
+    stop_file: Path,
+    poll_interval_s: float = 0.1,
+) -> Tuple[int, str]:
+    start_time = time.monotonic()
+    log = log_file.open("w") if log_file is not None else None
+    try:
+        proc = subprocess.Popen(
+            cmd, shell=True, cwd=cwd, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+        while True:
+            try:
+                return proc.wait(poll_interval_s), ""
+            except subprocess.TimeoutExpired:
+                pass
+            if timeout_s is not None and time.monotonic() - start_time > timeout_s:
+                reason = f"timed out after {timeout_s}s"
+            elif stop_file.exists():
+                reason = "stopped"
+            else:
+                continue
+            os.killpg(proc.pid, signal.SIGKILL)
+            return proc.wait(), reason
+    finally:
+        if log is not None:
+            log.close()
+
+
+# Run [SimJob]s with at most [max_mem_gb] of declared memory and [max_cpus] declared CPUs in use at once.
+# A job that needs more than the limits on its own is run by itself. Each job is attempted up to
+# [max_attempts] times. The status of every job is kept in [status_file].
+# Jobs are dispatched by a background thread, so more can be submitted while others are running.
+# If [executor] is given, jobs are run by it instead of as subprocesses of the scheduler.
+class JobScheduler:
+    def __init__(
+        self,
+        status_file: Path,
+        max_mem_gb: float,
+        max_cpus: int,
+        max_attempts: int = 2,
+        poll_interval_s: float = 0.5,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self.executor = executor
+        self.status_file = status_file
+        self.max_mem_gb = max_mem_gb
+        self.max_cpus = max_cpus
+        self.max_attempts = max_attempts
+        self.poll_interval_s = poll_interval_s
+        self.status: Dict[str, JobStatus] = {}
+        if status_file.exists():
+            with status_file.open("r") as f:
+                self.status = {name: JobStatus.from_dict(s) for name, s in json.load(f).items()}
+        self.pending: List[SimJob] = []
+        self.running: Dict[str, _RunningJob] = {}
+        self.cv = threading.Condition()
+        self.dispatcher: Optional[threading.Thread] = None
+        self.closed = False
+
+    def _save_status(self) -> None:
+        tmp_file = self.status_file.with_name(f"{self.status_file.name}.tmp")
+        with tmp_file.open("w") as f:
+            json.dump({name: s.to_dict() for name, s in self.status.items()}, f, indent=2)
+        tmp_file.replace(self.status_file)
+
+    # Queue [job], unless it finished in a previous run and its outputs are still there
+    def submit(self, job: SimJob) -> None:
+        with self.cv:
+            assert not self.closed, "Can't submit jobs to a closed scheduler"
+            status = self.status.get(job.name)
+            if status is not None and status.state == JobState.Done:
+                if all(output.exists() for output in job.outputs):
+                    logging.info(f"Job {job.name} already finished, skipping it")
+                    return
+            self.status[job.name] = JobStatus()
+            self.pending.append(job)
+            self.pending.sort(key=lambda j: j.expected_cost, reverse=True)
+            self._save_status()
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+                self.dispatcher.start()
+            self.cv.notify_all()
+
+    # Block until every submitted job has finished or failed, and return the status of every job
+    def wait(self) -> Dict[str, JobStatus]:
+        with self.cv:
+            self.cv.wait_for(lambda: len(self.pending) == 0 and len(self.running) == 0)
+            return dict(self.status)
+
+    # Submit every one of [jobs] and wait for them
+    def run(self, jobs: List[SimJob]) -> Dict[str, JobStatus]:
+        # Hold the lock so no job starts before all of them are queued in order
+        with self.cv:
+            for job in jobs:
+                self.submit(job)
+        return self.wait()
+
+    def _fits(self, job: SimJob) -> bool:
+        if len(self.running) == 0:
+            return True
+        mem_gb = sum(r.job.mem_gb for r in self.running.values()) + job.mem_gb
+        cpus = sum(r.job.cpus for r in self.running.values()) + job.cpus
+        return mem_gb <= self.max_mem_gb and cpus <= self.max_cpus
+
+    def _start(self, job: SimJob) -> None:
+        status = self.status[job.name]
+        status.state = JobState.Running
+        status.attempts += 1
+        status.stop_reason = ""
+        if job.monitor is not None:
+            job.monitor.start()
+        logging.info(f'Starting job {job.name} (attempt {status.attempts}): "{job.cmd}"')
+        if self.executor is not None:
+            stop_file = _stop_file(job)
+            stop_file.unlink(missing_ok=True)
+            logs = [job.log_file] if job.log_file is not None else []
+            future = self.executor.submit(
+                run_job_cmd,
+                job.cmd,
+                job.cwd,
+                job.log_file,
+                job.timeout_s,
+                stop_file,
+                inputs=job.inputs,
+                outputs=job.outputs + logs,
+            )
+            self.running[job.name] = _RunningJob(job, time.monotonic(), future=future)
+            return
+        log = job.log_file.open("w") if job.log_file is not None else None
+        proc = subprocess.Popen(
+            job.cmd,
+            shell=True,
+            cwd=job.cwd,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,  # so a timeout kills the whole process group
+        )
+        self.running[job.name] = _RunningJob(job, time.monotonic(), proc, log)
+
+    def _finish(self, r: _RunningJob, returncode: int, reason: str) -> None:
+        job = r.job
+        del self.running[job.name]
+        if r.log is not None:
+            r.log.close()
+        status = self.status[job.name]
+        status.returncode = returncode
+        status.runtime_s = time.monotonic() - r.start_time
+        if reason == "":
+            missing = [str(output) for output in job.outputs if not output.exists()]
+            if returncode != 0:
+                reason = f"exited with returncode {returncode}"
+            elif len(missing) > 0:
+                reason = f"didn't produce {', '.join(missing)}"
+        status.reason = reason
+        if reason == "":
+            status.state = JobState.Done
+            logging.info(f"Job {job.name} finished in {status.runtime_s:.1f}s")
+        elif status.attempts < self.max_attempts:
+            status.state = JobState.Pending
+            logging.warning(f"Job {job.name} {reason}, retrying it")
+            self.pending.append(job)
+            self.pending.sort(key=lambda j: j.expected_cost, reverse=True)
+        else:
+            status.state = JobState.Failed
+            logging.error(f"Job {job.name} {reason} after {status.attempts} attempts")
+
+    def _stop_early(self, r: _RunningJob, stop_reason: str) -> None:
+        assert r.job.monitor is not None
+        r.job.monitor.stop()
+        logging.info(f"Stopped job {r.job.name} early: {stop_reason}")
+        self.status[r.job.name].stop_reason = stop_reason
+        self._finish(r, 0, "")
+
+    # Poll a job that's run by the executor
+    def _poll_future(self, r: _RunningJob) -> None:
+        assert r.future is not None
+        if r.future.done():
+            try:
+                returncode, reason = r.future.result()
+            except Exception as e:
+                returncode, reason = -1, f"failed on its worker ({e})"
+            if r.stop_reason is not None:
+                self._stop_early(r, r.stop_reason)
+            else:
+                self._finish(r, returncode, reason)
+        elif r.job.monitor is not None and r.stop_reason is None:
+            r.stop_reason = r.job.monitor.poll()
+            if r.stop_reason is not None:
+                # The worker kills the job once it sees the stop file
+                _stop_file(r.job).touch()
+
+    def _dispatch(self) -> None:
+        while True:
+            with self.cv:
+                if self.closed:
+                    return
+                for name, r in list(self.running.items()):
+                    if r.proc is None:
+                        self._poll_future(r)
+                        continue
+                    returncode = r.proc.poll()
+                    if returncode is not None:
+                        self._finish(r, returncode, "")
+                    elif (
+                        r.job.timeout_s is not None
+                        and time.monotonic() - r.start_time > r.job.timeout_s
+                    ):
+                        os.killpg(r.proc.pid, signal.SIGKILL)
+                        self._finish(r, r.proc.wait(), f"timed out after {r.job.timeout_s}s")
+                    elif r.job.monitor is not None:
+                        stop_reason = r.job.monitor.poll()
+                        if stop_reason is not None:
+                            os.killpg(r.proc.pid, signal.SIGKILL)
+                            r.proc.wait()
+                            self._stop_early(r, stop_reason)
+                for job in list(self.pending):
+                    if self._fits(job):
+                        self.pending.remove(job)
+                        self._start(job)
+                self._save_status()
+                self.cv.notify_all()
+                self.cv.wait(self.poll_interval_s)
+
+    # Kill any running jobs and stop dispatching
+    def close(self) -> None:
+        with self.cv:
+            self.closed = True
+            for r in list(self.running.values()):
+                if r.proc is not None:
+                    os.killpg(r.proc.pid, signal.SIGKILL)
+                    returncode = r.proc.wait()
+                else:
+                    _stop_file(r.job).touch()
+                    returncode = -1
+                self._finish(r, returncode, "killed when the scheduler was closed")
+            self.pending = []
+            self._save_status()
+            self.cv.notify_all()
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+
+    def __enter__(self) -> "JobScheduler":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+# Created to ask the worker running [job] to kill it
+def _stop_file(job: SimJob) -> Path:
+    return job.cwd / f".{job.name}.stop"
+
+
+# Names of the jobs in [status] that failed
+def failed_jobs(status: Dict[str, JobStatus]) -> List[str]:
+    return [name for name, s in status.items() if s.state == JobState.Failed]
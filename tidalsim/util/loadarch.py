@@ -0,0 +1,224 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+import re
+import struct
+
+# A typed model of a 'loadarch' checkpoint: the architectural state that spike prints (on stderr) when
+# it runs the commands in [tidalsim.util.spike_ckpt.reg_dump] for every hart, after the output of the
+# 'rs' command that stepped to the checkpoint.
+
+# CSRs dumped for every hart, in the order they're dumped
+CSR_NAMES = [
+    "fcsr",
+    "vstart",
+    "vxsat",
+    "vxrm",
+    "vcsr",
+    "vtype",
+    "stvec",
+    "sscratch",
+    "sepc",
+    "scause",
+    "stval",
+    "satp",
+    "mstatus",
+    "medeleg",
+    "mideleg",
+    "mie",
+    "mtvec",
+    "mscratch",
+    "mepc",
+    "mcause",
+    "mtval",
+    "mip",
+    "mcycle",
+    "minstret",
+]
+N_XREGS = 32
+N_FREGS = 32
+# Every hart's dump starts with a line for each of pc, priv, CSRs, mtime, mtimecmp, f and x registers
+SCALAR_LINES = 2 + len(CSR_NAMES) + 2 + N_FREGS + N_XREGS
+# followed by the output of 'vreg': a 'VLEN=...' header and a line for each vector register. How many
+# lines that is and how they're laid out depends on spike's version and vector configuration, so its
+# lines are recognized by their contents instead of being counted.
+VREG_HEADER = re.compile(r"\s*VLEN\s*=")
+VREG_LINE = re.compile(r"\s*v\d+\s*:")
+
+LOADARCH_MAGIC = b"LDARCH\x00\x01"
+# f registers are stored as 128 bits to cover any FLEN
+FREG_BYTES = 16
+
+
+def _parse_hex(line: str, what: str) -> int:
+    try:
+        return int(line.strip(), 16)
+    except ValueError:
+        raise RuntimeError(f"Expected a hex value for {what} in the loadarch, got '{line.strip()}'")
+
+
+# Whether [line] is the output of the 'rs' command that stepped to a checkpoint, which starts its loadarch
+def is_step_output(line: str) -> bool:
+    return line.startswith(":")
+
+
+# Whether [line] is part of the output of 'vreg'
+def is_vreg_output(line: str) -> bool:
+    return VREG_HEADER.match(line) is not None or VREG_LINE.match(line) is not None
+
+
+# The index just past the 'vreg' output (if any) that starts at [lines][start]
+def _vreg_output_end(lines: List[str], start: int) -> int:
+    if start == len(lines) or not VREG_HEADER.match(lines[start]):
+        return start
+    end = start + 1
+    while end < len(lines) and VREG_LINE.match(lines[end]):
+        end += 1
+    return end
+
+
+@dataclass
+class HartArchState:
+    pc: int
+    priv: int
+    # map of CSR name -> value, in the order of [CSR_NAMES]
+    csrs: Dict[str, int]
+    mtime: int
+    mtimecmp: int
+    fregs: List[int]
+    xregs: List[int]
+    # spike's raw 'vreg' output
+    vregs: List[str]
+
+    @staticmethod
+    def from_lines(lines: List[str], hart: int) -> "HartArchState":
+        if len(lines) < SCALAR_LINES:
+            raise RuntimeError(
+                f"Hart {hart}'s register dump ended after {len(lines)} of {SCALAR_LINES} lines"
+            )
+        vregs_end = _vreg_output_end(lines, SCALAR_LINES)
+        if vregs_end != len(lines):
+            raise RuntimeError(
+                f"Expected hart {hart}'s vreg output in the loadarch, got '{lines[vregs_end].strip()}'"
+            )
+        values = iter(lines)
+        pc = _parse_hex(next(values), f"hart {hart} pc")
+        priv = _parse_hex(next(values), f"hart {hart} priv")
+        csrs = {csr: _parse_hex(next(values), f"hart {hart} {csr}") for csr in CSR_NAMES}
+        mtime = _parse_hex(next(values), "mtime")
+        mtimecmp = _parse_hex(next(values), f"hart {hart} mtimecmp")
+        fregs = [_parse_hex(next(values), f"hart {hart} f{i}") for i in range(N_FREGS)]
+        xregs = [_parse_hex(next(values), f"hart {hart} x{i}") for i in range(N_XREGS)]
+        vregs = [line.rstrip("\n") for line in values]
+        return HartArchState(pc, priv, csrs, mtime, mtimecmp, fregs, xregs, vregs)
+
+    def to_bytes(self) -> bytes:
+        vregs = "\n".join(self.vregs).encode()
+        return (
+            struct.pack(
+                f"<QB{len(CSR_NAMES)}QQQ",
+                self.pc,
+                self.priv,
+                *self.csrs.values(),
+                self.mtime,
+                self.mtimecmp,
+            )
+            + b"".join(f.to_bytes(FREG_BYTES, "little") for f in self.fregs)
+            + struct.pack(f"<{N_XREGS}QI", *self.xregs, len(vregs))
+            + vregs
+        )
+
+    # Parse a hart's state from [raw] at [offset], return the state and the offset just past it
+    @staticmethod
+    def from_bytes(raw: bytes, offset: int) -> Tuple["HartArchState", int]:
+        scalars_fmt = f"<QB{len(CSR_NAMES)}QQQ"
+        pc, priv, *rest = struct.unpack_from(scalars_fmt, raw, offset)
+        csrs = dict(zip(CSR_NAMES, rest[: len(CSR_NAMES)]))
+        mtime, mtimecmp = rest[len(CSR_NAMES) :]
+        offset += struct.calcsize(scalars_fmt)
+        fregs = [
+            int.from_bytes(raw[offset + i * FREG_BYTES : offset + (i + 1) * FREG_BYTES], "little")
+            for i in range(N_FREGS)
+        ]
+        offset += N_FREGS * FREG_BYTES
+        *xregs, vregs_len = struct.unpack_from(f"<{N_XREGS}QI", raw, offset)
+        offset += struct.calcsize(f"<{N_XREGS}QI")
+        vregs = raw[offset : offset + vregs_len].decode().split("\n")
+        offset += vregs_len
+        return HartArchState(pc, priv, csrs, mtime, mtimecmp, fregs, xregs, vregs), offset
+
+
+@dataclass
+class Loadarch:
+    # spike's output from the 'rs' command that stepped to this checkpoint
+    step_output: str
+    harts: List[HartArchState] = field(default_factory=lambda: [])
+
+    # [lines] holds the step output followed by every hart's dump: its scalar lines, then its vreg output
+    @staticmethod
+    def from_lines(lines: List[str]) -> "Loadarch":
+        if len(lines) == 0 or not is_step_output(lines[0]):
+            raise RuntimeError(
+                "A loadarch starts with the output of the 'rs' command, got"
+                f" '{lines[0].strip() if lines else ''}'"
+            )
+        harts: List[HartArchState] = []
+        start = 1
+        while start < len(lines):
+            end = _vreg_output_end(lines, min(start + SCALAR_LINES, len(lines)))
+            harts.append(HartArchState.from_lines(lines[start:end], len(harts)))
+            start = end
+        return Loadarch(lines[0].rstrip("\n"), harts)
+
+    @staticmethod
+    def read(loadarch: Path) -> "Loadarch":
+        return Loadarch.from_lines(loadarch.read_text().splitlines())
+
+    # Compact binary serialization
+    def to_bytes(self) -> bytes:
+        step_output = self.step_output.encode()
+        return (
+            LOADARCH_MAGIC
+            + struct.pack("<II", len(self.harts), len(step_output))
+            + step_output
+            + b"".join(hart.to_bytes() for hart in self.harts)
+        )
+
+    @staticmethod
+    def from_bytes(raw: bytes) -> "Loadarch":
+        if raw[: len(LOADARCH_MAGIC)] != LOADARCH_MAGIC:
+            raise RuntimeError("Not a binary loadarch")
+        offset = len(LOADARCH_MAGIC)
+        n_harts, step_output_len = struct.unpack_from("<II", raw, offset)
+        offset += 8
+        step_output = raw[offset : offset + step_output_len].decode()
+        offset += step_output_len
+        harts: List[HartArchState] = []
+        for _ in range(n_harts):
+            hart, offset = HartArchState.from_bytes(raw, offset)
+            harts.append(hart)
+        return Loadarch(step_output, harts)
+
+
+# Split spike's concatenated debug output [lines] (for [n_harts] harts) into one loadarch per checkpoint
+# as the lines arrive. Every checkpoint starts with the output of the 'rs' command that stepped to it, so
+# a checkpoint is complete once the next one starts (or the output ends).
+# Yields the raw lines of every checkpoint along with the parsed state.
+def stream_loadarchs(lines: Iterable[str], n_harts: int) -> Iterator[Tuple[List[str], Loadarch]]:
+    def parse(chunk: List[str]) -> Tuple[List[str], Loadarch]:
+        loadarch = Loadarch.from_lines(chunk)
+        if len(loadarch.harts) != n_harts:
+            raise RuntimeError(
+                f"Expected a checkpoint of {n_harts} harts in spike's output, but it holds"
+                f" {len(loadarch.harts)}"
+            )
+        return chunk, loadarch
+
+    chunk: List[str] = []
+    for line in lines:
+        if is_step_output(line) and len(chunk) > 0:
+            yield parse(chunk)
+            chunk = []
+        chunk.append(line)
+    if len(chunk) > 0:
+        yield parse(chunk)
@@ -0,0 +1,83 @@
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+import logging
+import threading
+
+from tidalsim.util.executor import Executor, LocalExecutor
+from tidalsim.util.job_sched import JobScheduler, JobStatus, SimJob
+
+# Runs every checkpoint through post-processing and RTL simulation on its own, as soon as spike has
+# dumped it, instead of waiting for every checkpoint to finish each phase. Spike, the post-processing
+# (e.g. cache reconstruction) of earlier checkpoints and their RTL simulations all overlap.
+
+
+class CheckpointPipeline:
+    # Post-processing runs on [executor], or in a pool of [n_workers] local processes if it isn't given,
+    # and the RTL simulation of each checkpoint (built by [sim_job]) is submitted to [scheduler] once its
+    # post-processing is done
+    def __init__(
+        self,
+        scheduler: JobScheduler,
+        sim_job: Callable[[Path], SimJob],
+        n_workers: int = 1,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self.scheduler = scheduler
+        self.sim_job = sim_job
+        self.own_executor = executor is None
+        self.executor = executor if executor is not None else LocalExecutor(n_workers)
+        # checkpoints whose post-processing hasn't finished (and whose simulation isn't submitted yet)
+        self.n_post_processing = 0
+        self.cv = threading.Condition()
+        self.errors: List[BaseException] = []
+
+    # The arch checkpoint in [ckpt_dir] is ready: run [post_process](*args) (if given, it must be
+    # picklable) on the executor, then simulate the checkpoint. [inputs] and [outputs] are the files
+    # [post_process] reads and writes, see [Executor.submit]. Safe to call from any thread.
+    def checkpoint_ready(
+        self,
+        ckpt_dir: Path,
+        post_process: Optional[Callable[..., None]] = None,
+        *args,
+        inputs: Sequence[Path] = (),
+        outputs: Sequence[Path] = (),
+    ) -> None:
+        if post_process is None:
+            self.scheduler.submit(self.sim_job(ckpt_dir))
+            return
+
+        def post_processed(future: Future) -> None:
+            error = future.exception()
+            if error is None:
+                try:
+                    self.scheduler.submit(self.sim_job(ckpt_dir))
+                except Exception as e:
+                    error = e
+            if error is not None:
+                logging.error(f"Post-processing {ckpt_dir} failed: {error}")
+            with self.cv:
+                if error is not None:
+                    self.errors.append(error)
+                self.n_post_processing -= 1
+                self.cv.notify_all()
+
+        logging.info(f"Checkpoint {ckpt_dir} is ready, post-processing it")
+        with self.cv:
+            self.n_post_processing += 1
+        self.executor.submit(post_process, *args, inputs=inputs, outputs=outputs).add_done_callback(
+            post_processed
+        )
+
+    # Wait for every checkpoint reported so far to be post-processed and simulated, and return the
+    # status of every simulation. Raises the first post-processing error, after the simulations of
+    # the other checkpoints have finished.
+    def wait(self) -> Dict[str, JobStatus]:
+        with self.cv:
+            self.cv.wait_for(lambda: self.n_post_processing == 0)
+        if self.own_executor:
+            self.executor.shutdown()
+        status = self.scheduler.wait()
+        if len(self.errors) > 0:
+            raise self.errors[0]
+        return status
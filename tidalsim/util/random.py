@@ -14,3 +14,19 @@ def inst_points_to_inst_steps(inst_points: List[int]) -> List[int]:
     ]
     assert all(step >= 0 for step in inst_steps)
     return inst_steps
+
+
+# Place the checkpoint of every sampled interval starting at [interval_starts] (sorted, multiples of
+# [interval_length]) [warmup_insts] instructions before the interval, so the RTL simulation can warm
+# up the state that isn't injected before it reaches the interval. Near the start of the program the
+# warmup is cut short, either at instruction 0 or so that no two intervals share a checkpoint.
+# The checkpoints stay multiples of [interval_length] if [warmup_insts] is one.
+def place_checkpoints(
+    interval_starts: List[int], warmup_insts: int, interval_length: int
+) -> List[int]:
+    ckpt_insts: List[int] = []
+    for start in interval_starts:
+        prev_ckpt = ckpt_insts[-1] if ckpt_insts else -interval_length
+        ckpt_insts.append(max(0, start - warmup_insts, prev_ckpt + interval_length))
+    assert all(ckpt <= start for ckpt, start in zip(ckpt_insts, interval_starts))
+    return ckpt_insts
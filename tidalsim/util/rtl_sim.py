@@ -0,0 +1,165 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+import sys
+
+from tidalsim.util.cli import run_cmd
+
+
+# Build the command line of an RTL simulation that injects the arch state in [loadarch] and the DRAM
+# image in [binary], and writes the performance samples to [perf_file] every [perf_sample_period]
+# instructions. The simulation is killed after [timeout_cycles] cycles.
+def rtl_sim_cmd(
+    simulator: Path,
+    perf_file: Path,
+    perf_sample_period: int,
+    max_instructions: Optional[int],
+    chipyard_root: Path,
+    binary: Path,
+    loadarch: Path,
+    suppress_exit: bool,
+    checkpoint_dir: Optional[Path],
+    timeout_cycles: int = 10_000_000,
+) -> str:
+    max_insts_str = f"+max-instructions={max_instructions}" if max_instructions is not None else ""
+    checkpoint_dir_str = (
+        f"+checkpoint-dir={checkpoint_dir.resolve()}" if checkpoint_dir is not None else ""
+    )
+    # +no_hart0_msip = with loadarch, the target should begin execution immediately without
+    #   an interrupt required to jump out of the bootrom
+    return (
+        f"{simulator}             +permissive             +dramsim            "
+        f" +dramsim_ini_dir={chipyard_root.resolve()}/generators/testchipip/src/main/resources/dramsim2_ini"
+        "             +no_hart0_msip             +ntb_random_seed_automatic            "
+        f" +max-cycles={timeout_cycles}             +perf-sample-period={perf_sample_period}       "
+        f"      +perf-file={perf_file.resolve()}             {max_insts_str}            "
+        f" +loadmem={binary.resolve()}             +loadarch={loadarch.resolve()}            "
+        f" {checkpoint_dir_str}             +permissive-off            "
+        f" {'+suppress-exit' if suppress_exit else ''}             {binary.resolve()}"
+    )
+
+
+def run_rtl_sim(
+    simulator: Path,
+    perf_file: Path,
+    perf_sample_period: int,
+    max_instructions: Optional[int],
+    chipyard_root: Path,
+    binary: Path,
+    loadarch: Path,
+    cwd: Path,
+    suppress_exit: bool,
+    checkpoint_dir: Optional[Path],
+    timeout_cycles: int = 10_000_000,
+) -> None:
+    cmd = rtl_sim_cmd(
+        simulator,
+        perf_file,
+        perf_sample_period,
+        max_instructions,
+        chipyard_root,
+        binary,
+        loadarch,
+        suppress_exit,
+        checkpoint_dir,
+        timeout_cycles,
+    )
+    run_cmd(cmd, cwd)
+
+
+# Timeouts of an RTL simulation of [max_instructions] instructions: the +max-cycles bound, assuming the
+# core never takes more than [max_cpi] cycles per instruction on average, and the wall-clock bound,
+# assuming the simulator never runs slower than [min_cycles_per_s]. Returns (cycles, seconds).
+def rtl_sim_timeouts(
+    max_instructions: int, max_cpi: float, min_cycles_per_s: float
+) -> Tuple[int, float]:
+    timeout_cycles = int(max_instructions * max_cpi)
+    return timeout_cycles, timeout_cycles / min_cycles_per_s
+
+
+# A simulator that checkpoints are replayed on. Every backend takes the same inputs as the state injection
+# harness: the arch state in [loadarch], the DRAM image in [binary] and (if [checkpoint_dir] is given) the
+# cache arrays in [checkpoint_dir], and writes perf samples to [perf_file] every [perf_sample_period]
+# instructions, for up to [max_instructions] instructions (or until the program exits if None).
+class SimBackend(ABC):
+    @abstractmethod
+    def cmd(
+        self,
+        perf_file: Path,
+        perf_sample_period: int,
+        max_instructions: Optional[int],
+        binary: Path,
+        loadarch: Path,
+        suppress_exit: bool,
+        checkpoint_dir: Optional[Path],
+        timeout_cycles: int = 10_000_000,
+    ) -> str:
+        pass
+
+
+# A Chipyard VCS (or Verilator) simulator built with STATE_INJECT=1, see [rtl_sim_cmd]
+@dataclass
+class VCSBackend(SimBackend):
+    simulator: Path
+    chipyard_root: Path
+
+    def cmd(
+        self,
+        perf_file: Path,
+        perf_sample_period: int,
+        max_instructions: Optional[int],
+        binary: Path,
+        loadarch: Path,
+        suppress_exit: bool,
+        checkpoint_dir: Optional[Path],
+        timeout_cycles: int = 10_000_000,
+    ) -> str:
+        return rtl_sim_cmd(
+            self.simulator,
+            perf_file,
+            perf_sample_period,
+            max_instructions,
+            self.chipyard_root,
+            binary,
+            loadarch,
+            suppress_exit,
+            checkpoint_dir,
+            timeout_cycles,
+        )
+
+
+# The stand-in simulator in [tidalsim.scripts.fake_rtl_sim], which produces a deterministic perf.csv
+# without any RTL, after sleeping [latency_s] per perf sample window
+@dataclass
+class FakeSimBackend(SimBackend):
+    latency_s: float = 0.0
+    # instructions run when there's no +max-instructions, standing in for the program's exit
+    exit_insts: int = 1_000_000
+
+    def cmd(
+        self,
+        perf_file: Path,
+        perf_sample_period: int,
+        max_instructions: Optional[int],
+        binary: Path,
+        loadarch: Path,
+        suppress_exit: bool,
+        checkpoint_dir: Optional[Path],
+        timeout_cycles: int = 10_000_000,
+    ) -> str:
+        args = [
+            f"{sys.executable} -m tidalsim.scripts.fake_rtl_sim",
+            f"+max-cycles={timeout_cycles}",
+            f"+perf-sample-period={perf_sample_period}",
+            f"+perf-file={perf_file.resolve()}",
+            f"+max-instructions={max_instructions}" if max_instructions is not None else "",
+            f"+loadmem={binary.resolve()}",
+            f"+loadarch={loadarch.resolve()}",
+            f"+checkpoint-dir={checkpoint_dir.resolve()}" if checkpoint_dir is not None else "",
+            "+suppress-exit" if suppress_exit else "",
+            f"+fake-latency={self.latency_s}",
+            f"+fake-exit-insts={self.exit_insts}",
+            str(binary.resolve()),
+        ]
+        return " ".join(arg for arg in args if arg != "")
@@ -0,0 +1,189 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple, TypeAlias, Union
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+# Sparse, deduplicated storage of DRAM images (e.g. spike's mem.0x80000000.bin checkpoint dumps)
+# Only the pages holding a non-zero byte are kept. Pages are stored once per [PageStore] under the
+# hash of their contents, so checkpoints of the same binary share their (mostly identical) pages.
+# Each DRAM image is described by a [SparseMem] manifest that maps its populated pages to their hashes.
+
+PAGE_SIZE_BYTES = 4096
+
+
+def page_digest(page: bytes) -> str:
+    return hashlib.blake2b(page, digest_size=16).hexdigest()
+
+
+# A content-addressed store of pages, every page lives in [root]/<digest[:2]>/<digest>
+@dataclass
+class PageStore:
+    root: Path
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    # Store [page] (if it isn't already stored) and return its digest
+    def put(self, page: bytes) -> str:
+        digest = page_digest(page)
+        path = self.path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Checkpoints are converted concurrently (by processes and threads), so write to a file
+            # private to this writer and atomically rename it
+            tmp_path = path.with_name(f"{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(page)
+            tmp_path.replace(path)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        return self.path(digest).read_bytes()
+
+
+@dataclass
+class SparseMem:
+    # physical address of the first byte of the image
+    base: int
+    # size of the image in bytes
+    size: int
+    # path of the [PageStore] holding the pages, relative to the manifest
+    store: str
+    # map of page offset (in bytes from [base]) -> page digest. Pages that aren't present are all zeros.
+    pages: Dict[int, str] = field(default_factory=lambda: {})
+
+    # Return the (start, end) byte offsets of each run of contiguous populated pages
+    def populated_ranges(self) -> List[Tuple[int, int]]:
+        ranges: List[Tuple[int, int]] = []
+        for offset in sorted(self.pages):
+            if ranges and ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], offset + PAGE_SIZE_BYTES)
+            else:
+                ranges.append((offset, offset + PAGE_SIZE_BYTES))
+        return ranges
+
+    # Rebuild the dense DRAM image (this allocates the whole image, see [SparseImage] to avoid that)
+    def to_image(self, store: PageStore) -> np.ndarray:
+        image = np.zeros(self.size, dtype=np.uint8)
+        for offset, digest in self.pages.items():
+            image[offset : offset + PAGE_SIZE_BYTES] = np.frombuffer(store.get(digest), np.uint8)
+        return image
+
+    def dump(self, manifest: Path) -> None:
+        with manifest.open("w") as f:
+            json.dump(
+                {
+                    "base": self.base,
+                    "size": self.size,
+                    "store": self.store,
+                    "pages": {hex(offset): digest for offset, digest in sorted(self.pages.items())},
+                },
+                f,
+                indent=2,
+            )
+
+    @staticmethod
+    def load(manifest: Path) -> "SparseMem":
+        with manifest.open("r") as f:
+            d = json.load(f)
+        pages = {int(offset, 16): digest for offset, digest in d["pages"].items()}
+        return SparseMem(d["base"], d["size"], d["store"], pages)
+
+
+# Put every non-zero page of the dense DRAM [image] (based at [base]) in [store]
+# and return the manifest describing it, which will be written into [manifest_dir]
+def compact_dram_image(
+    image: np.ndarray, base: int, store: PageStore, manifest_dir: Path
+) -> SparseMem:
+    assert image.size % PAGE_SIZE_BYTES == 0
+    pages = image.reshape(-1, PAGE_SIZE_BYTES)
+    return compact_pages(
+        {
+            int(page_idx) * PAGE_SIZE_BYTES: pages[page_idx]
+            for page_idx in np.flatnonzero(pages.any(axis=1))
+        },
+        base,
+        image.size,
+        store,
+        manifest_dir,
+    )
+
+
+# Same as [compact_dram_image] for a DRAM image of [size] bytes that's only given by its [pages]
+# (a map of page offset -> page contents, every other page is all zeros)
+def compact_pages(
+    pages: Dict[int, np.ndarray], base: int, size: int, store: PageStore, manifest_dir: Path
+) -> SparseMem:
+    sparse = SparseMem(base, size, os.path.relpath(store.root, manifest_dir))
+    for offset, page in pages.items():
+        assert offset % PAGE_SIZE_BYTES == 0 and page.size == PAGE_SIZE_BYTES
+        if page.any():
+            sparse.pages[offset] = store.put(page.tobytes())
+    return sparse
+
+
+# A read-only DRAM image that is looked up through the page map of a [SparseMem], without ever building
+# the dense image. Pages are only read from the [PageStore] when they're first accessed.
+@dataclass
+class SparseImage:
+    sparse: SparseMem
+    store: PageStore
+    loaded_pages: Dict[int, np.ndarray] = field(default_factory=lambda: {}, repr=False)
+
+    def __len__(self) -> int:
+        return self.sparse.size
+
+    # The contents of the populated page at byte offset [page_offset]
+    def page(self, page_offset: int) -> np.ndarray:
+        page = self.loaded_pages.get(page_offset)
+        if page is None:
+            digest = self.sparse.pages[page_offset]
+            page = np.frombuffer(self.store.get(digest), dtype=np.uint8)
+            self.loaded_pages[page_offset] = page
+        return page
+
+    # Same as [tidalsim.cache_model.mtr.gather_blocks] on the dense image: the [block_size_bytes]
+    # long blocks starting at each of [offsets], bytes in unpopulated pages or past the end read as 0.
+    # Only the populated pages that are touched are stacked up (behind a row of zeros) and gathered from.
+    def gather_blocks(self, offsets: np.ndarray, block_size_bytes: int) -> np.ndarray:
+        idxs = offsets[:, np.newaxis] + np.arange(block_size_bytes)
+        page_offsets = idxs - idxs % PAGE_SIZE_BYTES
+        touched = np.unique(page_offsets[idxs < self.sparse.size])
+        populated = np.array(
+            [offset for offset in touched.tolist() if offset in self.sparse.pages], dtype=np.int64
+        )
+        pages = np.zeros((populated.size + 1, PAGE_SIZE_BYTES), dtype=np.uint8)
+        for row, offset in enumerate(populated.tolist(), start=1):
+            pages[row] = self.page(offset)
+        rows = np.searchsorted(populated, page_offsets) + 1
+        found = (rows <= populated.size) & (idxs < self.sparse.size)
+        found[found] = populated[rows[found] - 1] == page_offsets[found]
+        return pages[np.where(found, rows, 0), idxs % PAGE_SIZE_BYTES]
+
+    # The [size_bytes] bytes starting at byte [offset]
+    def read(self, offset: int, size_bytes: int) -> np.ndarray:
+        return self.gather_blocks(np.array([offset], dtype=np.int64), size_bytes)[0]
+
+    def to_image(self) -> np.ndarray:
+        return self.sparse.to_image(self.store)
+
+
+# A DRAM image: either dense (e.g. a memory-mapped dump) or sparse
+MemoryImage: TypeAlias = Union[np.ndarray, SparseImage]
+
+
+# The [size_bytes] bytes starting at byte [offset] of [image]
+def read_image(image: MemoryImage, offset: int, size_bytes: int) -> np.ndarray:
+    if isinstance(image, SparseImage):
+        return image.read(offset, size_bytes)
+    return image[offset : offset + size_bytes]
+
+
+# Open the DRAM image described by the SparseMem [manifest]
+def load_sparse_mem(manifest: Path) -> SparseImage:
+    sparse = SparseMem.load(manifest)
+    return SparseImage(sparse, PageStore(manifest.parent / sparse.store))
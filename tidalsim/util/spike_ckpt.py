@@ -1,4 +1,5 @@
-from typing import List, Optional, Iterator
+from typing import Callable, Dict, List, Optional, Iterator, Tuple
+from concurrent.futures import Future
 from pathlib import Path
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
@@ -8,11 +9,30 @@ import shutil
 import itertools
 
 from joblib import Parallel, delayed
+import numpy as np
 
-from tidalsim.util.cli import run_cmd, run_cmd_capture
+from tidalsim.util.cli import run_cmd_stream_stderr
+from tidalsim.util.executor import Executor
+from tidalsim.util.loadarch import CSR_NAMES, SCALAR_LINES, Loadarch, stream_loadarchs
 from tidalsim.util.random import inst_points_to_inst_steps
-from tidalsim.cache_model.mtr import MTR
-from tidalsim.cache_model.cache import CacheParams, CacheState, CohStatus
+from tidalsim.cache_model.mtr import MTR, reconstruct_caches, map_dram_image, load_dram_image
+from tidalsim.util.elf import ElfSegment, elf_memory_image, read_elf_symbols, write_elf
+from tidalsim.util.sparse_mem import (
+    PAGE_SIZE_BYTES,
+    PageStore,
+    SparseMem,
+    compact_dram_image,
+    compact_pages,
+)
+from tidalsim.cache_model.cache import CacheParams, CacheState, CohStatus, ArrayFormat
+from tidalsim.cache_model.multicore_mtr import MulticoreMTR
+from tidalsim.cache_model.tlb import TLBMTR, SATP_MODE_LEVELS, reconstruct_tlb
+
+
+# Name of the manifest of each checkpoint's sparse DRAM image
+DRAM_MANIFEST = "mem.pages.json"
+# Size of the DRAM spike is given (starting at 0x80000000)
+DRAM_SIZE = 0x1000_0000
 
 
 def get_spike_cmd(
@@ -27,8 +47,7 @@ def get_spike_cmd(
     # TODO: add pmp CSR dumping commands to spike
     debug_flags = "" if debug_file is None else f"-d --debug-cmd={debug_file.resolve()}"
     dram_base = 0x8000_0000
-    dram_size = 0x1000_0000
-    basemem = f"{dram_base}:{dram_size}"
+    basemem = f"{dram_base}:{DRAM_SIZE}"
     spike_flags = f"-p{n_harts} --pmpregions=0 --isa={isa} -m{basemem}"
     inst_log_flag = "-l" if inst_log else ""
     commit_log_flag = "--log-commits" if commit_log else ""
@@ -56,43 +75,20 @@ def combine_cmd_blocks(cmd_blocks: List[SpikeCmdBlock]) -> SpikeCmdBlock:
 
 
 # Spike commands for dumping all register state for hart [h]
+# Only the scalar registers' lines are counted in [expected_lines], 'vreg' prints a variable number of
+# lines after them (see [tidalsim.util.loadarch])
 def reg_dump(h: int) -> SpikeCmdBlock:
-    special_reg_dump = [
-        f"pc {h}",
-        f"priv {h}",
-        f"reg {h} fcsr",
-        f"reg {h} vstart",
-        f"reg {h} vxsat",
-        f"reg {h} vxrm",
-        f"reg {h} vcsr",
-        f"reg {h} vtype",
-        f"reg {h} stvec",
-        f"reg {h} sscratch",
-        f"reg {h} sepc",
-        f"reg {h} scause",
-        f"reg {h} stval",
-        f"reg {h} satp",
-        f"reg {h} mstatus",
-        f"reg {h} medeleg",
-        f"reg {h} mideleg",
-        f"reg {h} mie",
-        f"reg {h} mtvec",
-        f"reg {h} mscratch",
-        f"reg {h} mepc",
-        f"reg {h} mcause",
-        f"reg {h} mtval",
-        f"reg {h} mip",
-        f"reg {h} mcycle",
-        f"reg {h} minstret",
-        f"mtime",
-        f"mtimecmp {h}",
-    ]
+    special_reg_dump = (
+        [f"pc {h}", f"priv {h}"]
+        + [f"reg {h} {csr}" for csr in CSR_NAMES]
+        + [f"mtime", f"mtimecmp {h}"]
+    )
     fpr_dump = [f"freg {h} {fr}" for fr in range(32)]
     xpr_dump = [f"reg {h} {xr}" for xr in range(32)]
     vreg_dump = [f"vreg {h}"]
     return SpikeCmdBlock(
         cmds=special_reg_dump + fpr_dump + xpr_dump + vreg_dump,
-        expected_lines=len(special_reg_dump) + 32 + 32 + 33,
+        expected_lines=SCALAR_LINES,
     )
 
 
@@ -134,13 +130,136 @@ def inst_points_dump(
     return combine_cmd_blocks([wait_for_pc] + list(per_interval_cmds()) + [exit_spike])
 
 
+# Read the value of register [reg] (e.g. 'satp') of hart [hart] from a checkpoint's [loadarch] file
+def read_loadarch_reg(loadarch: Path, reg: str, hart: int = 0) -> int:
+    return Loadarch.read(loadarch).harts[hart].csrs[reg]
+
+
 def get_ckpt_dirs(ckpt_base_dir: Path, start_pc: int, inst_points: List[int]) -> List[Path]:
     return [ckpt_base_dir / f"{hex(start_pc)}.{i}" for i in inst_points]
 
 
+# The DRAM contents of the checkpoint in [ckpt_dir]: spike's dense dump if it's still there,
+# otherwise the manifest of the sparse image it was compacted into (see [load_dram_image])
+def ckpt_dram_file(ckpt_dir: Path) -> Path:
+    spike_mem_out = ckpt_dir / "mem.0x80000000.bin"
+    return spike_mem_out if spike_mem_out.exists() else ckpt_dir / DRAM_MANIFEST
+
+
+# Estimated cost of dumping one checkpoint (DRAM + registers) in spike, in units of instructions
+# stepped through in debug mode. Used to balance the work between spike shards.
+SPIKE_DUMP_COST_INSTS = 5_000_000
+
+
+# Partition the sorted [inst_points] into at most [n_shards] contiguous groups, each of which is taken
+# by its own spike process. Every spike process starts from reset, so a shard costs the fast-forward
+# to its last inst point plus [dump_cost] for every checkpoint it dumps. The partition minimizes the
+# cost of the most expensive shard (the wall time when all shards run concurrently).
+def partition_inst_points(
+    inst_points: List[int], n_shards: int, dump_cost: int = SPIKE_DUMP_COST_INSTS
+) -> List[List[int]]:
+    assert inst_points == sorted(inst_points)
+    n = len(inst_points)
+    n_shards = max(1, min(n_shards, n))
+
+    def shard_cost(i: int, j: int) -> int:  # cost of the shard holding inst_points[i:j]
+        return inst_points[j - 1] + dump_cost * (j - i)
+
+    # best[k][j] = (cost, split) of covering inst_points[:j] with k shards, the last being [split:j]
+    inf = float("inf")
+    best = [[(inf, 0)] * (n + 1) for _ in range(n_shards + 1)]
+    best[0][0] = (0, 0)
+    for k in range(1, n_shards + 1):
+        for j in range(1, n + 1):
+            for i in range(k - 1, j):
+                cost = max(best[k - 1][i][0], shard_cost(i, j))
+                if cost < best[k][j][0]:
+                    best[k][j] = (cost, i)
+    # Use the fewest shards that achieve the best cost
+    k = min(range(1, n_shards + 1), key=lambda k: (best[k][n][0], k))
+    shards: List[List[int]] = []
+    j = n
+    while k > 0:
+        i = best[k][j][1]
+        shards.append(inst_points[i:j])
+        j, k = i, k - 1
+    return list(reversed(shards))
+
+
+# Run a single spike process in [shard_dir] that takes the checkpoints at [inst_points] and dumps them
+# into their directories under [ckpt_base_dir]. Spike's output is split among them as it runs:
+# each checkpoint gets its loadarch (and the parsed state in loadarch.bin, see [Loadarch]),
+# then [on_checkpoint] is called with its directory.
+def run_spike_shard(
+    binary: Path,
+    start_pc: int,
+    inst_points: List[int],
+    ckpt_base_dir: Path,
+    shard_dir: Path,
+    n_harts: int,
+    isa: str,
+    on_checkpoint: Callable[[Path], None],
+) -> None:
+    # Delete old artifacts if they exist
+    for artifact in ["loadarch", "run_spike.sh", "spike_cmds.txt"]:
+        (shard_dir / artifact).unlink(missing_ok=True)
+
+    # Commands for spike to run in debug mode
+    spike_cmds_file = shard_dir / "spike_cmds.txt"
+    logging.info(f"Generating spike interactive commands in {spike_cmds_file}")
+    cmd_block: SpikeCmdBlock
+    with spike_cmds_file.open("w") as f:
+        cmd_block = inst_points_dump(start_pc, inst_points, n_harts, ckpt_base_dir)
+        f.write("\n".join(cmd_block.cmds))
+
+    # The spike invocation command itself
+    spike_cmd = get_spike_cmd(
+        binary, n_harts, isa, spike_cmds_file, inst_log=False, commit_log=False, suppress_exit=True
+    )
+    run_spike_cmd_file = shard_dir / "run_spike.sh"
+    with run_spike_cmd_file.open("w") as f:
+        f.write(spike_cmd)
+    run_spike_cmd_file.chmod(run_spike_cmd_file.stat().st_mode | stat.S_IEXEC)
+
+    # Actually run spike, and split its output into each checkpoint's loadarch as soon as that
+    # checkpoint has been dumped. The raw output is also kept in [shard_dir]/loadarch.
+    logging.info(f"Running spike in {shard_dir}")
+    ckpt_dirs = get_ckpt_dirs(ckpt_base_dir, start_pc, inst_points)
+    n_ckpts = 0
+    with (shard_dir / "loadarch").open("w") as raw_loadarch:
+
+        def spike_output() -> Iterator[str]:
+            for line in run_cmd_stream_stderr(spike_cmd, cwd=shard_dir):
+                raw_loadarch.write(line)
+                yield line
+
+        for lines, loadarch in stream_loadarchs(spike_output(), n_harts):
+            if n_ckpts == len(ckpt_dirs):
+                raise RuntimeError(
+                    f"Expected spike to take {len(ckpt_dirs)} checkpoints, but it printed more"
+                )
+            ckpt_dir = ckpt_dirs[n_ckpts]
+            with (ckpt_dir / "loadarch").open("w") as f:
+                f.write("".join(lines))
+            (ckpt_dir / "loadarch.bin").write_bytes(loadarch.to_bytes())
+            on_checkpoint(ckpt_dir)
+            n_ckpts += 1
+    if n_ckpts != len(ckpt_dirs):
+        raise RuntimeError(
+            f"Expected spike to take {len(ckpt_dirs)} checkpoints, but it only took {n_ckpts}"
+        )
+
+
 # Take checkpoints after reaching [pc] at every instruction commit point in [inst_points]
 # inst_points = [100, 1000, 2000] means
 # Take snapshots at the points where 100/1000/2000 instructions have committed
+# The inst points are split among up to [n_shards] spike processes that run concurrently
+# (see [partition_inst_points]), each in its own [ckpt_base_dir]/shard.<n> directory.
+# With a single shard, spike runs directly in [ckpt_base_dir].
+# Every checkpoint is finished (loadarch + mem.elf) as soon as spike dumps it, and [on_checkpoint]
+# (if given) is then called with its directory, possibly from several threads at once.
+# The DRAM dumps are converted in the spike shards' threads, or by [executor] if given (its workers must
+# see [ckpt_base_dir] at the same path).
 def gen_checkpoints(
     binary: Path,
     start_pc: int,
@@ -148,6 +267,9 @@ def gen_checkpoints(
     ckpt_base_dir: Path,
     n_harts: int = 1,
     isa: str = "rv64gc",
+    n_shards: int = 1,
+    on_checkpoint: Optional[Callable[[Path], None]] = None,
+    executor: Optional[Executor] = None,
 ) -> None:
     logging.info(f"Placing checkpoints in {ckpt_base_dir}")
 
@@ -158,88 +280,393 @@ def gen_checkpoints(
         ckpt_dir.mkdir(exist_ok=True)
 
     # Delete old artifacts if they exist
-    for artifact in ["loadarch", "run_spike.sh", "spike_cmds.txt"]:
-        (ckpt_base_dir / artifact).unlink(missing_ok=True)
     for ckpt_dir in ckpt_dirs:
         (ckpt_dir / "loadarch").unlink(missing_ok=True)
+        (ckpt_dir / "loadarch.bin").unlink(missing_ok=True)
         (ckpt_dir / "mem.elf").unlink(missing_ok=True)
+        (ckpt_dir / DRAM_MANIFEST).unlink(missing_ok=True)
 
-    # Commands for spike to run in debug mode
-    spike_cmds_file = ckpt_base_dir / "spike_cmds.txt"
-    logging.info(f"Generating spike interactive commands in {spike_cmds_file}")
-    cmd_block: SpikeCmdBlock
-    with spike_cmds_file.open("w") as f:
-        cmd_block = inst_points_dump(start_pc, inst_points, n_harts, ckpt_base_dir)
-        f.write("\n".join(cmd_block.cmds))
+    # Capture tohost/fromhost memory addresses from original binary
+    symbols = read_elf_symbols(binary)
+    tohost, fromhost = symbols["tohost"], symbols["fromhost"]
+    logging.info(
+        f"Found tohost/fromhost in binary elf file, tohost: {hex(tohost)}, fromhost:"
+        f" {hex(fromhost)}"
+    )
+    # Pages are deduplicated across all the checkpoints in [ckpt_base_dir]
+    page_store = PageStore(ckpt_base_dir / "pages")
 
-    # The spike invocation command itself
-    spike_cmd = get_spike_cmd(
-        binary, n_harts, isa, spike_cmds_file, inst_log=False, commit_log=False, suppress_exit=True
+    conversions: List[Future] = []
+
+    # Called as soon as spike has dumped a checkpoint
+    def finish_checkpoint(ckpt_dir: Path) -> None:
+        if executor is None:
+            convert_spike_mem(ckpt_dir, page_store, tohost, fromhost)
+            if on_checkpoint is not None:
+                on_checkpoint(ckpt_dir)
+            return
+
+        # Resolved once [on_checkpoint] has returned, not just once the conversion is done
+        finished: Future = Future()
+
+        def converted(future: Future) -> None:
+            try:
+                future.result()
+                if on_checkpoint is not None:
+                    on_checkpoint(ckpt_dir)
+                finished.set_result(None)
+            except Exception as e:
+                finished.set_exception(e)
+
+        conversions.append(finished)
+        executor.submit(
+            convert_spike_mem, ckpt_dir, page_store, tohost, fromhost
+        ).add_done_callback(converted)
+
+    shards = partition_inst_points(sorted(inst_points), n_shards)
+    if len(shards) == 1:
+        shard_dirs = [ckpt_base_dir]
+    else:
+        shard_dirs = [ckpt_base_dir / f"shard.{i}" for i in range(len(shards))]
+        for shard_dir in shard_dirs:
+            shard_dir.mkdir(exist_ok=True)
+    logging.info(f"Taking checkpoints with {len(shards)} spike processes: {shards}")
+    # Each shard mostly waits on its spike subprocess, so threads are enough to run them concurrently
+    Parallel(n_jobs=len(shards), backend="threading")(
+        delayed(run_spike_shard)(
+            binary, start_pc, shard, ckpt_base_dir, shard_dir, n_harts, isa, finish_checkpoint
+        )
+        for shard, shard_dir in zip(shards, shard_dirs)
     )
-    run_spike_cmd_file = ckpt_base_dir / "run_spike.sh"
-    with run_spike_cmd_file.open("w") as f:
-        f.write(spike_cmd)
-    run_spike_cmd_file.chmod(run_spike_cmd_file.stat().st_mode | stat.S_IEXEC)
+    # Raises the first failed conversion
+    for finished in conversions:
+        finished.result()
 
-    # Actually run spike
-    logging.info(f"Running spike")
-    loadarch_file = ckpt_base_dir / "loadarch"
-    run_cmd(f"{spike_cmd} 2> {loadarch_file.resolve()}", cwd=ckpt_base_dir)
 
-    # Spike emits a single loadarch file which needs to be split among the multiple checkpoints
-    loadarch_lines = loadarch_file.open("r").readlines()
-    assert cmd_block.expected_lines % len(inst_points) == 0
-    lines_per_loadarch = cmd_block.expected_lines // len(inst_points)
-    if len(loadarch_lines) != cmd_block.expected_lines:
-        raise RuntimeError(
-            f"Expected the loadarch file {loadarch_file} to contain"
-            f" {cmd_block.expected_lines} lines, but it actually contained"
-            f" {len(loadarch_lines)} lines"
+# Compact the DRAM dump spike wrote into [ckpt_dir] into [page_store] and build the mem.elf
+# that's loaded into the RTL simulation, with the [tohost]/[fromhost] symbols of the original binary
+def convert_spike_mem(ckpt_dir: Path, page_store: PageStore, tohost: int, fromhost: int) -> None:
+    spike_mem_out = ckpt_dir / "mem.0x80000000.bin"
+    dram = map_dram_image(spike_mem_out)
+    write_ckpt_mem(ckpt_dir, dram, page_store, tohost, fromhost)
+    del dram
+    # The dense dump can always be rebuilt from the page store, see [ckpt_dram_file]
+    spike_mem_out.unlink()
+
+
+# Store the checkpoint's DRAM contents [dram] (based at 0x80000000) in [ckpt_dir] as a sparse image in
+# [page_store] and as the mem.elf that's loaded into the RTL simulation
+def write_ckpt_mem(
+    ckpt_dir: Path, dram: np.ndarray, page_store: PageStore, tohost: int, fromhost: int
+) -> None:
+    # Only keep the non-zero pages of DRAM
+    sparse = compact_dram_image(dram, 0x8000_0000, page_store, ckpt_dir)
+    # The segments are written straight from [dram]
+    _write_ckpt_sparse_mem(ckpt_dir, sparse, lambda start, end: dram[start:end], tohost, fromhost)
+
+
+# Same as [write_ckpt_mem] for DRAM contents that are only given by their populated [pages]
+# (see [tidalsim.cache_model.mtr.MTR.memory_pages]), so the dense image is never built
+def write_ckpt_pages(
+    ckpt_dir: Path, pages: Dict[int, np.ndarray], page_store: PageStore, tohost: int, fromhost: int
+) -> None:
+    sparse = compact_pages(pages, 0x8000_0000, DRAM_SIZE, page_store, ckpt_dir)
+
+    def read_range(start: int, end: int) -> np.ndarray:
+        return np.concatenate([pages[offset] for offset in range(start, end, PAGE_SIZE_BYTES)])
+
+    _write_ckpt_sparse_mem(ckpt_dir, sparse, read_range, tohost, fromhost)
+
+
+# Dump the manifest of the checkpoint's [sparse] DRAM image and build its mem.elf, reading the contents
+# of the byte offsets [start, end) of DRAM with [read_range]
+def _write_ckpt_sparse_mem(
+    ckpt_dir: Path,
+    sparse: SparseMem,
+    read_range: Callable[[int, int], np.ndarray],
+    tohost: int,
+    fromhost: int,
+) -> None:
+    logging.info(f"Compiling memory to elf in {ckpt_dir}")
+    loadmem_elf = ckpt_dir / "mem.elf"
+    sparse.dump(ckpt_dir / DRAM_MANIFEST)
+    # Every run of populated pages becomes its own segment, so mem.elf only contains the
+    # populated parts of DRAM
+    segments = [
+        ElfSegment(0x8000_0000 + start, read_range(start, end))
+        for start, end in sparse.populated_ranges()
+    ]
+    assert len(segments) > 0, f"The DRAM image of {ckpt_dir} is empty"
+    write_elf(loadmem_elf, segments, {"tohost": tohost, "fromhost": fromhost})
+
+
+# Turn the lightweight checkpoints (register state only) saved by
+# [tidalsim.util.spike_session.trace_with_periodic_loadarchs] in [loadarch_dir] into full checkpoints at
+# [inst_points] under [ckpt_base_dir], without running spike again. The DRAM contents of each checkpoint
+# come from the initial memory image of [binary] and the data seen in the trace up to that point,
+# which is tracked in [mtr_ckpts] (MTRs built with track_data, one per inst point).
+# That's only the real DRAM contents if every write to memory was tracked, so a checkpoint isn't cloned
+# if its MTR saw an access whose data wasn't tracked, or a write to tohost (the host may have written
+# memory while servicing it). Returns the inst points of these checkpoints, which must be taken by
+# spike instead (see [gen_checkpoints]).
+def clone_checkpoints(
+    binary: Path,
+    loadarch_dir: Path,
+    inst_points: List[int],
+    mtr_ckpts: List[MTR],
+    ckpt_base_dir: Path,
+    start_pc: int = 0x8000_0000,
+    n_jobs: int = -1,
+    on_checkpoint: Optional[Callable[[Path], None]] = None,
+) -> List[int]:
+    assert len(inst_points) == len(mtr_ckpts)
+    symbols = read_elf_symbols(binary)
+    tohost, fromhost = symbols["tohost"], symbols["fromhost"]
+    page_store = PageStore(ckpt_base_dir / "pages")
+
+    def untracked_memory(mtr: MTR) -> bool:
+        tohost_entry = mtr.table.get(mtr.get_block_addr(tohost))
+        host_access = tohost_entry is not None and tohost_entry.last_writetime is not None
+        return mtr.untracked_accesses > 0 or host_access
+
+    clones: List[Tuple[int, MTR, Path]] = []
+    refused: List[int] = []
+    for inst_point, mtr, ckpt_dir in zip(
+        inst_points, mtr_ckpts, get_ckpt_dirs(ckpt_base_dir, start_pc, inst_points)
+    ):
+        if untracked_memory(mtr):
+            refused.append(inst_point)
+        else:
+            clones.append((inst_point, mtr, ckpt_dir))
+    if refused:
+        logging.warning(
+            f"The trace doesn't account for every write to memory before inst points {refused},"
+            " their checkpoints can't be cloned"
         )
-    for i, ckpt_dir in enumerate(ckpt_dirs):
-        with (ckpt_dir / "loadarch").open("w") as f:
-            lines = loadarch_lines[lines_per_loadarch * i : lines_per_loadarch * (i + 1)]
-            f.write("".join(lines))
-    # loadarch_file.unlink()
 
-    # Capture tohost/fromhost memory addresses from original binary
-    tohost = int(
-        run_cmd_capture(
-            f"riscv64-unknown-elf-nm {binary.resolve()} | grep tohost | head -c 16", Path.cwd()
-        ),
-        16,
+    def clone_checkpoint(inst_point: int, mtr: MTR, ckpt_dir: Path) -> Path:
+        loadarch_file = loadarch_dir / f"{inst_point}.loadarch"
+        if not loadarch_file.exists():
+            raise RuntimeError(f"There's no register checkpoint at instruction {inst_point}")
+        ckpt_dir.mkdir(exist_ok=True)
+        shutil.copyfile(loadarch_file, ckpt_dir / "loadarch")
+        (ckpt_dir / "loadarch.bin").write_bytes(Loadarch.read(loadarch_file).to_bytes())
+        pages = mtr.memory_pages(elf_memory_image(binary, 0x8000_0000), 0x8000_0000, DRAM_SIZE)
+        write_ckpt_pages(ckpt_dir, pages, page_store, tohost, fromhost)
+        return ckpt_dir
+
+    # [on_checkpoint] is called (in this process) with every checkpoint as soon as it's cloned
+    for ckpt_dir in Parallel(n_jobs=n_jobs, return_as="generator")(
+        delayed(clone_checkpoint)(inst_point, mtr, ckpt_dir) for inst_point, mtr, ckpt_dir in clones
+    ):
+        assert ckpt_dir is not None
+        if on_checkpoint is not None:
+            on_checkpoint(ckpt_dir)
+    return refused
+
+
+# Dump the arrays of [cache_states] (one per geometry) for the cache [cache_name] into [ckpt_dir]
+# The first cache state is dumped directly into [ckpt_dir], and if there is more than one,
+# each one is also dumped into [ckpt_dir]/<cache_name>.<n_sets>x<n_ways>
+def dump_cache_states(
+    cache_states: List[CacheState], ckpt_dir: Path, cache_name: str, fmt: ArrayFormat
+) -> None:
+    cache_state_dirs: List[Tuple[CacheState, Path]] = [(cache_states[0], ckpt_dir)]
+    if len(cache_states) > 1:
+        for cache_state in cache_states:
+            geometry_dir = ckpt_dir / f"{cache_name}.{cache_state.params.geometry_str()}"
+            geometry_dir.mkdir(exist_ok=True)
+            cache_state_dirs.append((cache_state, geometry_dir))
+    for cache_state, dump_dir in cache_state_dirs:
+        cache_state.dump_data_arrays(dump_dir, f"{cache_name}_data_array", fmt)
+        cache_state.dump_tag_arrays(dump_dir, f"{cache_name}_tag_array", fmt)
+
+
+# Reconstruct the L1 cache [cache_name] ('dcache' or 'icache') for every geometry in [cache_params] from
+# [mtr] and the DRAM contents spike dumped into [ckpt_dir], and dump the tag/data arrays for state injection.
+# The first geometry is the one the RTL simulator is built with and its arrays are dumped directly
+# into [ckpt_dir]. When sweeping more than one geometry, every geometry also gets its own
+# injection directory: [ckpt_dir]/<cache_name>.<n_sets>x<n_ways>
+# The arrays are written in the file format [fmt]
+# If [elf] is given, the cache block data comes from the binary's initial memory image overlaid with
+# the data tracked in [mtr] (if any), so the checkpoint's DRAM dump isn't read (or needed).
+def dump_dcache_ckpt(
+    mtr: MTR,
+    ckpt_dir: Path,
+    cache_params: List[CacheParams],
+    n_jobs: int = -1,
+    fmt: ArrayFormat = ArrayFormat.Bin,
+    elf: Optional[Path] = None,
+    cache_name: str = "dcache",
+) -> None:
+    dram_bin = ckpt_dram_file(ckpt_dir) if elf is None else None
+    cache_states = reconstruct_caches(
+        mtr, cache_params, dram_bin, dram_base=0x8000_0000, n_jobs=n_jobs, elf_file=elf
     )
-    fromhost = int(
-        run_cmd_capture(
-            f"riscv64-unknown-elf-nm {binary.resolve()} | grep fromhost | head -c 16", Path.cwd()
-        ),
-        16,
+    dump_cache_states(cache_states, ckpt_dir, cache_name, fmt)
+
+
+# Reconstruct and dump the L1 arrays of every checkpoint ([mtr_ckpts] and [ckpt_dirs] line up)
+# in a pool of [n_jobs] worker processes. Each worker maps its own checkpoint's DRAM image.
+def dump_dcache_ckpts(
+    mtr_ckpts: List[MTR],
+    ckpt_dirs: List[Path],
+    cache_params: List[CacheParams],
+    n_jobs: int = -1,
+    fmt: ArrayFormat = ArrayFormat.Bin,
+    elf: Optional[Path] = None,
+    cache_name: str = "dcache",
+) -> None:
+    assert len(mtr_ckpts) == len(ckpt_dirs)
+    Parallel(n_jobs=n_jobs)(
+        delayed(dump_dcache_ckpt)(mtr, ckpt_dir, cache_params, 1, fmt, elf, cache_name)
+        for mtr, ckpt_dir in zip(mtr_ckpts, ckpt_dirs)
     )
-    logging.info(
-        f"Found tohost/fromhost in binary elf file, tohost: {hex(tohost)}, fromhost:"
-        f" {hex(fromhost)}"
+
+
+# Reconstruct the L1d (every geometry in [l1_params]) and the L2 [l2_params] from [mtr] as an inclusive
+# (or non-inclusive) hierarchy, see [MTR.as_cache_hierarchy], and dump both levels' arrays into [ckpt_dir]
+# The L2 arrays are dumped as l2_tag_array* and l2_data_array*
+# The block data comes from the checkpoint's DRAM dump, or [elf] + the trace data, as in [dump_dcache_ckpt]
+def dump_cache_hierarchy_ckpt(
+    mtr: MTR,
+    ckpt_dir: Path,
+    l1_params: List[CacheParams],
+    l2_params: CacheParams,
+    inclusive: bool = True,
+    fmt: ArrayFormat = ArrayFormat.Bin,
+    elf: Optional[Path] = None,
+) -> None:
+    dram_bin = None if elf is not None else load_dram_image(ckpt_dram_file(ckpt_dir))
+    initial_image = None if elf is None else elf_memory_image(elf, 0x8000_0000)
+    l1_states, l2_state = mtr.as_cache_hierarchy(
+        l1_params, l2_params, dram_bin, 0x8000_0000, inclusive, initial_image
+    )
+    dump_cache_states(l1_states, ckpt_dir, "dcache", fmt)
+    dump_cache_states([l2_state], ckpt_dir, "l2", fmt)
+
+
+# Reconstruct and dump the L1d + L2 arrays of every checkpoint in a pool of [n_jobs] worker processes
+def dump_cache_hierarchy_ckpts(
+    mtr_ckpts: List[MTR],
+    ckpt_dirs: List[Path],
+    l1_params: List[CacheParams],
+    l2_params: CacheParams,
+    inclusive: bool = True,
+    n_jobs: int = -1,
+    fmt: ArrayFormat = ArrayFormat.Bin,
+    elf: Optional[Path] = None,
+) -> None:
+    assert len(mtr_ckpts) == len(ckpt_dirs)
+    Parallel(n_jobs=n_jobs)(
+        delayed(dump_cache_hierarchy_ckpt)(mtr, ckpt_dir, l1_params, l2_params, inclusive, fmt, elf)
+        for mtr, ckpt_dir in zip(mtr_ckpts, ckpt_dirs)
+    )
+
+
+# Reconstruct the DTLB, ITLB (and L2 TLB if [l2tlb_params] is given) of hart 0 from [tlb_mtr] by walking
+# the page tables in the checkpoint's DRAM dump, and dump the TLB entries into [ckpt_dir] as
+# {dtlb,itlb,l2tlb}_entries.<fmt>. Nothing is dumped if the hart runs with bare translation.
+def dump_tlb_ckpt(
+    tlb_mtr: TLBMTR,
+    ckpt_dir: Path,
+    dtlb_params: CacheParams,
+    itlb_params: CacheParams,
+    l2tlb_params: Optional[CacheParams] = None,
+    fmt: ArrayFormat = ArrayFormat.Bin,
+) -> None:
+    satp = read_loadarch_reg(ckpt_dir / "loadarch", "satp")
+    if (satp >> 60) not in SATP_MODE_LEVELS:
+        logging.info(f"Translation is off in {ckpt_dir} (satp = {hex(satp)}), not dumping TLBs")
+        return
+    image = load_dram_image(ckpt_dram_file(ckpt_dir))
+    tlbs = [("dtlb", tlb_mtr.dtlb, dtlb_params), ("itlb", tlb_mtr.itlb, itlb_params)]
+    if l2tlb_params is not None:
+        tlbs.append(("l2tlb", tlb_mtr.l2tlb(), l2tlb_params))
+    for name, mtr, params in tlbs:
+        reconstruct_tlb(mtr, params, satp, image, flush_time=tlb_mtr.flush_time).dump(
+            ckpt_dir, name, fmt
+        )
+
+
+def dump_tlb_ckpts(
+    tlb_mtr_ckpts: List[TLBMTR],
+    ckpt_dirs: List[Path],
+    dtlb_params: CacheParams,
+    itlb_params: CacheParams,
+    l2tlb_params: Optional[CacheParams] = None,
+    n_jobs: int = -1,
+    fmt: ArrayFormat = ArrayFormat.Bin,
+) -> None:
+    assert len(tlb_mtr_ckpts) == len(ckpt_dirs)
+    Parallel(n_jobs=n_jobs)(
+        delayed(dump_tlb_ckpt)(tlb_mtr, ckpt_dir, dtlb_params, itlb_params, l2tlb_params, fmt)
+        for tlb_mtr, ckpt_dir in zip(tlb_mtr_ckpts, ckpt_dirs)
     )
 
-    def convert_spike_mems(ckpt_dir: Path) -> None:
-        logging.info(f"Compiling memory to elf in {ckpt_dir}")
-        spike_mem_out = ckpt_dir / "mem.0x80000000.bin"
-        rawmem_elf = ckpt_dir / "raw.elf"
-        loadmem_elf = ckpt_dir / "mem.elf"
-        # NOTE: objcopy and ld produce different elfs when given absolute paths vs relative paths!
-        # So I give them relative paths here to maintain consistency with the original generate-ckpt.sh script
-        run_cmd(
-            "riscv64-unknown-elf-objcopy -I binary -O elf64-littleriscv"
-            f" {spike_mem_out.name} {rawmem_elf.name}",
-            cwd=ckpt_dir,
+
+# How the microarchitectural state of a checkpoint is reconstructed by [dump_ckpt_state]
+@dataclass
+class CkptStateParams:
+    dcache_params: List[CacheParams]
+    icache_params: List[CacheParams]
+    # also reconstruct the L2 (and the L1d as part of the hierarchy)
+    l2_params: Optional[CacheParams] = None
+    l2_inclusive: bool = True
+    # (DTLB, ITLB, L2 TLB) geometries
+    tlb_params: Optional[Tuple[CacheParams, CacheParams, Optional[CacheParams]]] = None
+    fmt: ArrayFormat = ArrayFormat.Bin
+    # take the cache block data from this binary + the trace data instead of the DRAM dump
+    elf: Optional[Path] = None
+
+
+# Reconstruct and dump all the warmed-up state of the single checkpoint in [ckpt_dir]: the L1d (+ L2)
+# from [mtr], the L1i from [imtr] and the TLBs from [tlb_mtr] (if given). This is the per-checkpoint
+# equivalent of the dump_*_ckpts functions, for checkpoints that are processed as soon as they're ready.
+def dump_ckpt_state(
+    ckpt_dir: Path,
+    params: CkptStateParams,
+    mtr: MTR,
+    imtr: Optional[MTR] = None,
+    tlb_mtr: Optional[TLBMTR] = None,
+) -> None:
+    if params.l2_params is not None:
+        dump_cache_hierarchy_ckpt(
+            mtr,
+            ckpt_dir,
+            params.dcache_params,
+            params.l2_params,
+            params.l2_inclusive,
+            params.fmt,
+            params.elf,
         )
-        # preserve the spike mem bin file for cache state reconstruction
-        # spike_mem_out.unlink()
-        run_cmd(
-            "riscv64-unknown-elf-ld -Tdata=0x80000000 -nmagic --defsym"
-            f" tohost={'0x%016x' % tohost} --defsym fromhost={'0x%016x' % fromhost} -o"
-            f" {loadmem_elf.name} {rawmem_elf.name}",
-            cwd=ckpt_dir,
+    else:
+        dump_dcache_ckpt(mtr, ckpt_dir, params.dcache_params, 1, params.fmt, params.elf)
+    if imtr is not None:
+        dump_dcache_ckpt(
+            imtr, ckpt_dir, params.icache_params, 1, params.fmt, params.elf, cache_name="icache"
         )
-        rawmem_elf.unlink()
+    if tlb_mtr is not None:
+        assert params.tlb_params is not None
+        dump_tlb_ckpt(tlb_mtr, ckpt_dir, *params.tlb_params, fmt=params.fmt)
+
 
-    Parallel(n_jobs=-1)(delayed(convert_spike_mems)(ckpt_dir) for ckpt_dir in ckpt_dirs)
+# Reconstruct every hart's private L1d for every geometry in [cache_params] from the multicore MTR
+# [mtr] and the DRAM contents spike dumped into [ckpt_dir], and dump each hart's arrays into
+# [ckpt_dir]/hart<hart_id> (laid out per geometry like [dump_dcache_ckpt])
+def dump_multicore_dcache_ckpt(
+    mtr: MulticoreMTR,
+    ckpt_dir: Path,
+    cache_params: List[CacheParams],
+    n_jobs: int = -1,
+    fmt: ArrayFormat = ArrayFormat.Bin,
+) -> None:
+    # One list of cache states (one per hart) for each geometry
+    geometry_states = [
+        mtr.as_caches(params, ckpt_dram_file(ckpt_dir), 0x8000_0000, n_jobs)
+        for params in cache_params
+    ]
+    for hart, cache_states in enumerate(zip(*geometry_states)):
+        hart_dir = ckpt_dir / f"hart{hart}"
+        hart_dir.mkdir(exist_ok=True)
+        dump_cache_states(list(cache_states), hart_dir, "dcache", fmt)
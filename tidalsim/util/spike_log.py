@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import Iterator, Optional, List, Iterable
+from typing import BinaryIO, Iterator, Optional, List, Iterable
+from pathlib import Path
 from enum import IntEnum
 from more_itertools import chunked
 import logging
@@ -32,6 +33,37 @@ jumps = ["j", "jal", "jr", "jalr", "ret", "call", "c.j", "c.jal", "c.jr", "c.jal
 syscalls = ["ecall", "ebreak", "mret", "sret", "uret"]
 control_insts = set(branches + jumps + syscalls)
 no_target_insts = set(syscalls + ["jr", "jalr", "c.jr", "c.jalr", "ret"])
+# spike prints 'jal' / 'jalr' (without 'ra') when the link register is ra, 'j' / 'jr' otherwise
+calls = set(["jal", "jalr", "call", "c.jal", "c.jalr"])
+returns = set(["ret"])
+
+# Access size in bytes of each load instruction. The commit log only contains the (sign/zero/NaN-boxed)
+# value written back to the destination register, so the access size must come from the instruction.
+load_sizes = {
+    "lb": 1,
+    "lbu": 1,
+    "c.lbu": 1,
+    "lh": 2,
+    "lhu": 2,
+    "c.lh": 2,
+    "c.lhu": 2,
+    "flh": 2,
+    "lw": 4,
+    "lwu": 4,
+    "c.lw": 4,
+    "c.lwsp": 4,
+    "flw": 4,
+    "c.flw": 4,
+    "c.flwsp": 4,
+    "lr.w": 4,
+    "ld": 8,
+    "c.ld": 8,
+    "c.ldsp": 8,
+    "fld": 8,
+    "c.fld": 8,
+    "c.fldsp": 8,
+    "lr.d": 8,
+}
 
 
 class Op(IntEnum):
@@ -44,6 +76,8 @@ class SpikeCommitInfo:
     address: int
     data: int
     op: Op
+    # access size in bytes, None if it couldn't be determined
+    size: Optional[int] = None
 
 
 @dataclass
@@ -56,28 +90,40 @@ class SpikeTraceEntry:
     # if the spike log was collected with --log-commits and this trace entry is a memory operation,
     #   [commit_info] will contain the memory operation
     commit_info: Optional[SpikeCommitInfo] = None
+    # size of the instruction in bytes (2 for compressed instructions)
+    inst_bytes: int = 4
+    # the hart that committed this instruction
+    hart: int = 0
+    # the privilege mode the instruction ran in (0 = U, 1 = S, 3 = M), only in the full commit log
+    priv: Optional[int] = None
 
     def is_control_inst(self) -> bool:
         return self.decoded_inst in control_insts
 
 
 # [full_commit_log] = True if spike was ran with '-l --log-commits', False if spike is only run with '-l'
-def parse_spike_log(log_lines: Iterator[str], full_commit_log: bool) -> Iterator[SpikeTraceEntry]:
-    inst_count = 0
+# [inst_count] is the dynamic instruction count of the first instruction in [log_lines]
+def parse_spike_log(
+    log_lines: Iterator[str], full_commit_log: bool, inst_count: int = 0
+) -> Iterator[SpikeTraceEntry]:
     for line in log_lines:
         # Example of first line (regular commit log)
         # core   0: 0x0000000080001a8e (0x00009522) c.add   a0, s0
         s = line.split()
         if s[2][0] == ">":
             continue  # this is a spike-decoded label, ignore it
+        hart = int(s[1][:-1])
         pc = int(s[2][2:], 16)
         decoded_inst = s[4]
+        # Compressed instructions don't have their 2 LSBs set
+        inst_bytes = 4 if (int(s[3][3:-1], 16) & 0b11) == 0b11 else 2
         # Ignore spike trace outside DRAM
         if pc < 0x8000_0000:
             if full_commit_log:
                 next(log_lines, None)
             continue
         commit_info: Optional[SpikeCommitInfo] = None
+        priv: Optional[int] = None
         if full_commit_log:
             # If the current line is a valid instruction, then we can be sure the next line
             # will contain the commit info
@@ -95,16 +141,81 @@ def parse_spike_log(log_lines: Iterator[str], full_commit_log: bool) -> Iterator
             # Load instruction
             # core   0: 3 0x0000000080000250 (0x638c) x11 0x0000000080001d68 mem 0x0000000080001d90
             # <hartid>: <priv>          <PC>   <inst> <rd>       <load data>            <load addr>
+
+            # Store conditional (that succeeded)
+            # core   0: 3 0x0000000080000a2c (0x18f5272f) x14 0x0000000000000000 mem 0x0000000080002000 0x00000001
+            # <hartid>: <priv>          <PC>   <inst> <rd> <sc result> <store addr> <store data>
+
+            # AMO (the load and the store of the read-modify-write)
+            # core   0: 3 0x0000000080000a30 (0x00f7272f) x14 0x0000000000000001 mem 0x0000000080002000 mem 0x0000000080002000 0x00000002
+            # <hartid>: <priv>          <PC>   <inst> <rd> <load data> <load addr> <store addr> <store data>
             assert line2 is not None
             s2 = line2.split()
             s2_len = len(s2)
+            priv = int(s2[2])
             if s2_len == 8 and s2[5] == "mem":  # store instruction
+                # spike prints the store data with as many hex digits as the store is wide
                 commit_info = SpikeCommitInfo(
-                    address=int(s2[6][2:], 16), data=int(s2[7][2:], 16), op=Op.Store
+                    address=int(s2[6][2:], 16),
+                    data=int(s2[7][2:], 16),
+                    op=Op.Store,
+                    size=(len(s2[7]) - 2) // 2,
                 )
             elif s2_len == 9 and s2[7] == "mem":  # load instruction
                 commit_info = SpikeCommitInfo(
-                    address=int(s2[8][2:], 16), data=int(s2[6][2:], 16), op=Op.Load
+                    address=int(s2[8][2:], 16),
+                    data=int(s2[6][2:], 16),
+                    op=Op.Load,
+                    size=load_sizes.get(decoded_inst),
                 )
-        yield SpikeTraceEntry(pc, decoded_inst, inst_count, commit_info)
+            elif (s2_len == 10 and s2[7] == "mem") or (
+                s2_len == 12 and s2[7] == "mem" and s2[9] == "mem"
+            ):  # store conditional or AMO, only the store is recorded since it supersedes the load
+                commit_info = SpikeCommitInfo(
+                    address=int(s2[-2][2:], 16),
+                    data=int(s2[-1][2:], 16),
+                    op=Op.Store,
+                    size=(len(s2[-1]) - 2) // 2,
+                )
+        yield SpikeTraceEntry(pc, decoded_inst, inst_count, commit_info, inst_bytes, hart, priv)
         inst_count += 1
+
+
+# Yield the byte offset into [log] of the line of every instruction that [parse_spike_log] counts
+# This only looks at the fields needed to count instructions, so it's much cheaper than parsing the log.
+def _spike_log_inst_lines(log: BinaryIO, full_commit_log: bool) -> Iterator[int]:
+    offset = 0
+    lines = iter(log)
+    for line in lines:
+        line_offset = offset
+        offset += len(line)
+        s = line.split(maxsplit=3)
+        if s[2][:1] == b">":
+            continue
+        if full_commit_log:
+            offset += len(next(lines, b""))
+        if int(s[2][2:], 16) < 0x8000_0000:
+            continue
+        yield line_offset
+
+
+# Return the byte offset into [log_file] of the line of each instruction in [inst_points] (sorted
+# dynamic instruction counts, as assigned by [parse_spike_log]), so the log can be parsed starting
+# from any of them. Points past the end of the log get the size of the log.
+def spike_log_inst_offsets(
+    log_file: Path, full_commit_log: bool, inst_points: List[int]
+) -> List[int]:
+    offsets: List[int] = []
+    with log_file.open("rb") as f:
+        for inst_count, line_offset in enumerate(_spike_log_inst_lines(f, full_commit_log)):
+            if len(offsets) == len(inst_points):
+                break
+            while len(offsets) < len(inst_points) and inst_points[len(offsets)] == inst_count:
+                offsets.append(line_offset)
+    return offsets + [log_file.stat().st_size] * (len(inst_points) - len(offsets))
+
+
+# The number of instructions [parse_spike_log] would yield from [log_file], without parsing it
+def spike_log_inst_count(log_file: Path, full_commit_log: bool) -> int:
+    with log_file.open("rb") as f:
+        return sum(1 for _ in _spike_log_inst_lines(f, full_commit_log))
@@ -0,0 +1,245 @@
+from pathlib import Path
+from typing import Callable, List, Optional, TextIO, Tuple
+import errno
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from tidalsim.util.loadarch import Loadarch, is_vreg_output
+from tidalsim.util.elf import read_elf_symbols
+from tidalsim.util.sparse_mem import PageStore
+from tidalsim.util.spike_ckpt import (
+    DRAM_MANIFEST,
+    SpikeCmdBlock,
+    arch_state_dump,
+    combine_cmd_blocks,
+    convert_spike_mem,
+    get_ckpt_dirs,
+    get_spike_cmd,
+    reg_dump,
+)
+
+# Sent after a block of register dumps to mark the end of its output, it prints a single register value
+DUMP_END_CMD = "reg 0 0"
+
+
+# A long-lived spike process in debug mode that takes checkpoints on demand
+# Spike reads its debug commands from a FIFO in [session_dir], so commands can be sent one block at a
+# time, and the output of every block is read back from spike's stderr before the next one is sent.
+# Checkpoints must be requested at non-decreasing instruction counts: the session only steps spike
+# forward by the distance from the previous checkpoint, so the prefix of the program is executed once.
+# If [trace] is given, spike also logs every committed instruction (as with -l --log-commits) and the
+# trace lines in its output are written to [trace] as they're printed.
+class SpikeSession:
+    def __init__(
+        self,
+        binary: Path,
+        session_dir: Path,
+        n_harts: int = 1,
+        isa: str = "rv64gc",
+        start_pc: int = 0x8000_0000,
+        trace: Optional[TextIO] = None,
+    ) -> None:
+        self.binary = binary
+        self.trace = trace
+        # 'rs' turns off instruction logging, 'r' keeps it on
+        self.run_cmd = "rs" if trace is None else "r"
+        self.n_harts = n_harts
+        self.start_pc = start_pc
+        # Instructions committed since PC = [start_pc]
+        self.inst_count = 0
+        symbols = read_elf_symbols(binary)
+        self.tohost, self.fromhost = symbols["tohost"], symbols["fromhost"]
+
+        cmds_fifo = session_dir / "spike_cmds.fifo"
+        cmds_fifo.unlink(missing_ok=True)
+        os.mkfifo(cmds_fifo)
+        # When tracing, spike exits when the program does
+        spike_cmd = get_spike_cmd(
+            binary,
+            n_harts,
+            isa,
+            cmds_fifo,
+            inst_log=trace is not None,
+            commit_log=trace is not None,
+            suppress_exit=trace is None,
+        )
+        logging.info(f'Starting spike session "{spike_cmd}" in {session_dir}')
+        self.proc = subprocess.Popen(
+            spike_cmd,
+            shell=True,
+            stdout=sys.stdout,
+            stderr=subprocess.PIPE,
+            cwd=session_dir,
+            text=True,
+        )
+        self.cmds = self._open_fifo(cmds_fifo)
+        self._run(SpikeCmdBlock([f"until pc 0 {hex(start_pc)}"], 0))
+
+    # Open the write end of [fifo] once spike has opened the read end, or fail if spike has exited
+    def _open_fifo(self, fifo: Path) -> TextIO:
+        while True:
+            try:
+                fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+                os.set_blocking(fd, True)
+                return os.fdopen(fd, "w")
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"spike exited with returncode {self.proc.returncode}")
+            time.sleep(0.01)
+
+    # Send the commands in [cmd_block] to spike and return the lines of output they produce
+    def _run(self, cmd_block: SpikeCmdBlock) -> List[str]:
+        self._send(cmd_block.cmds)
+        lines: List[str] = []
+        while len(lines) < cmd_block.expected_lines:
+            lines.append(self._readline(cmd_block, lines))
+        return lines
+
+    # [_run] for a [cmd_block] that ends with every hart's [reg_dump]. The vreg output of each hart has no
+    # fixed length, so [DUMP_END_CMD] is sent after the block and the output is read up to its line:
+    # the first one past the [expected_lines] of the block that isn't vreg output.
+    def _run_reg_dumps(self, cmd_block: SpikeCmdBlock) -> List[str]:
+        self._send(cmd_block.cmds + [DUMP_END_CMD])
+        lines: List[str] = []
+        n_counted = 0
+        while n_counted <= cmd_block.expected_lines:
+            lines.append(self._readline(cmd_block, lines))
+            if not is_vreg_output(lines[-1]):
+                n_counted += 1
+        return lines[:-1]
+
+    def _send(self, cmds: List[str]) -> None:
+        try:
+            self.cmds.write("".join(f"{cmd}\n" for cmd in cmds))
+            self.cmds.flush()
+        except BrokenPipeError:
+            self.proc.wait()
+            raise RuntimeError(f"spike exited before running {cmds[0]}")
+
+    # Read the next line of output for [cmd_block] after its [lines] so far, the trace lines in between
+    # are written to the trace
+    def _readline(self, cmd_block: SpikeCmdBlock, lines: List[str]) -> str:
+        assert self.proc.stderr is not None
+        while True:
+            line = self.proc.stderr.readline()
+            if line == "":
+                self.proc.wait()
+                raise RuntimeError(
+                    f"spike exited after printing {len(lines)} of {cmd_block.expected_lines}"
+                    f" lines for {cmd_block.cmds[0]}"
+                )
+            if self.trace is not None and line.startswith("core"):
+                self.trace.write(line)
+                continue
+            return line
+
+    # Step spike forward by [n_insts] instructions (printing the trace if tracing) and return the
+    # register state of every hart (spike's raw output and the parsed state), without dumping DRAM
+    def step(self, n_insts: int) -> Tuple[List[str], Loadarch]:
+        cmd_block = combine_cmd_blocks(
+            [SpikeCmdBlock([f"{self.run_cmd} {n_insts}"], 1)]
+            + [reg_dump(h) for h in range(self.n_harts)]
+        )
+        lines = self._run_reg_dumps(cmd_block)
+        self.inst_count += n_insts
+        return lines, Loadarch.from_lines(lines)
+
+    # Step spike to [inst_point] instructions after PC = [start_pc] and dump the arch state into
+    # [ckpt_dir] as a loadarch (+ loadarch.bin) and DRAM dump
+    def checkpoint(self, inst_point: int, ckpt_dir: Path) -> Loadarch:
+        if inst_point < self.inst_count:
+            raise RuntimeError(
+                f"Can't take a checkpoint at instruction {inst_point}, the spike session is already"
+                f" at instruction {self.inst_count}"
+            )
+        ckpt_dir.mkdir(exist_ok=True)
+        cmd_block = combine_cmd_blocks([
+            SpikeCmdBlock([f"{self.run_cmd} {inst_point - self.inst_count}"], 1),
+            arch_state_dump(self.n_harts, ckpt_dir),
+        ])
+        lines = self._run_reg_dumps(cmd_block)
+        self.inst_count = inst_point
+        loadarch = Loadarch.from_lines(lines)
+        with (ckpt_dir / "loadarch").open("w") as f:
+            f.write("".join(lines))
+        (ckpt_dir / "loadarch.bin").write_bytes(loadarch.to_bytes())
+        return loadarch
+
+    # Take checkpoints at every one of [inst_points] (relative to PC = [start_pc]) in their directories
+    # under [ckpt_base_dir], the same layout as [gen_checkpoints]. Each checkpoint's DRAM dump is
+    # converted into mem.elf, then [on_checkpoint] (if given) is called with its directory.
+    def take_checkpoints(
+        self,
+        inst_points: List[int],
+        ckpt_base_dir: Path,
+        on_checkpoint: Optional[Callable[[Path], None]] = None,
+    ) -> None:
+        page_store = PageStore(ckpt_base_dir / "pages")
+        for inst_point, ckpt_dir in zip(
+            inst_points, get_ckpt_dirs(ckpt_base_dir, self.start_pc, inst_points)
+        ):
+            (ckpt_dir / DRAM_MANIFEST).unlink(missing_ok=True)
+            self.checkpoint(inst_point, ckpt_dir)
+            convert_spike_mem(ckpt_dir, page_store, self.tohost, self.fromhost)
+            if on_checkpoint is not None:
+                on_checkpoint(ckpt_dir)
+
+    def close(self) -> None:
+        if self.proc.poll() is None:
+            self._run(SpikeCmdBlock(["quit"], 0))
+            self.proc.wait()
+        try:
+            self.cmds.close()
+        except BrokenPipeError:
+            pass  # spike exited with commands still buffered
+        assert self.proc.returncode == 0, f"spike exited with returncode {self.proc.returncode}"
+
+    def __enter__(self) -> "SpikeSession":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.proc.kill()
+            self.proc.wait()
+
+
+# Run [binary] to completion once, in a spike session in [session_dir] that writes the commit trace
+# (the same trace as spike -l --log-commits) to [trace_file]. The register state of every hart is
+# saved every [period] instructions (counting from PC = [start_pc]) as [loadarch_dir]/<inst>.loadarch.
+# These are lightweight checkpoints without DRAM, which can be turned into full checkpoints later with
+# [tidalsim.util.spike_ckpt.clone_checkpoints]. Returns the instruction points that were saved.
+def trace_with_periodic_loadarchs(
+    binary: Path,
+    session_dir: Path,
+    trace_file: Path,
+    loadarch_dir: Path,
+    period: int,
+    n_harts: int = 1,
+    isa: str = "rv64gc",
+    start_pc: int = 0x8000_0000,
+) -> List[int]:
+    loadarch_dir.mkdir(exist_ok=True)
+    inst_points: List[int] = []
+    with trace_file.open("w") as trace:
+        session = SpikeSession(binary, session_dir, n_harts, isa, start_pc, trace)
+        with session:
+            try:
+                lines, _ = session.step(0)
+                while True:
+                    with (loadarch_dir / f"{session.inst_count}.loadarch").open("w") as f:
+                        f.write("".join(lines))
+                    inst_points.append(session.inst_count)
+                    lines, _ = session.step(period)
+            except RuntimeError:
+                # The program finished in the middle of the last period
+                if session.proc.poll() is None or session.proc.returncode != 0:
+                    raise
+    logging.info(f"Saved {len(inst_points)} register checkpoints in {loadarch_dir}")
+    return inst_points